@@ -0,0 +1,54 @@
+import os
+import sys
+import pandas
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'visierra'))
+
+import application  # noqa: E402
+from application import db, dataframe_cache, transformation_cache, chart_payload_cache  # noqa: E402
+from application.libraries import warehouse, partitions, payloads  # noqa: E402
+
+
+@pytest.fixture
+def application_directory(tmp_path, monkeypatch):
+    """
+    The warehouse (the csv files, their columnar copies, rollups, partitions, token indices and payloads) is kept
+    in a temporary folder, with small row groups so that the zone maps and the appends span several of them.
+    """
+    monkeypatch.setattr(application, 'application_directory', str(tmp_path))
+    monkeypatch.setattr(warehouse, 'application_directory', str(tmp_path))
+    monkeypatch.setattr(partitions, 'application_directory', str(tmp_path))
+    monkeypatch.setattr(payloads, 'application_directory', str(tmp_path))
+    monkeypatch.setattr(warehouse, 'ROW_GROUP_SIZE', 128)
+    os.makedirs(os.path.join(str(tmp_path), 'warehouse'))
+    for cache in [dataframe_cache, transformation_cache, chart_payload_cache]:
+        cache.clear()
+    yield str(tmp_path)
+    for cache in [dataframe_cache, transformation_cache, chart_payload_cache]:
+        cache.clear()
+
+
+@pytest.fixture
+def app(application_directory):
+    app = Flask('visierra_tests')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(application_directory, 'visierra.db')
+    db.init_app(app=app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def register(app, application_directory):
+    """
+    Writes a dataframe as a csv file of the warehouse and registers it, please refer to
+    :func:`application.libraries.warehouse.register_dataframe`.
+    """
+    def register_csv(name: str, dataframe: pandas.DataFrame):
+        relative_path = os.path.join('warehouse', '{}.csv'.format(name))
+        dataframe.to_csv(os.path.join(application_directory, relative_path), index=False)
+        return warehouse.register_dataframe(name=name, description=name, relative_path=relative_path)
+    return register_csv
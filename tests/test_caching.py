@@ -0,0 +1,57 @@
+import numpy
+import pandas
+
+from application import dataframe_cache
+from application.libraries.caching import LRUCache, size_in_bytes
+from application.libraries.warehouse import read_registered_dataframe
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = LRUCache(max_bytes=100)
+    cache.put('a', 'a', size=40)
+    cache.put('b', 'b', size=40)
+    assert cache.get('a') == 'a'
+    # `b` is the least recently used one now
+    cache.put('c', 'c', size=40)
+    assert cache.get('b') is None and cache.get('a') == 'a' and cache.get('c') == 'c'
+    assert cache.statistics() == {
+        "hits": 3, "misses": 1, "evictions": 1, "entries": 2, "current_bytes": 80, "max_bytes": 100}
+
+
+def test_the_budget_is_kept():
+    cache = LRUCache(max_bytes=100)
+    # the values larger than the whole budget are not cached
+    cache.put('large', 'large', size=101)
+    assert cache.get('large', default='missed') == 'missed'
+    for index in range(10):
+        cache.put(index, index, size=30)
+        assert cache.statistics()["current_bytes"] <= 100
+    assert cache.statistics()["entries"] == 3 and cache.statistics()["evictions"] == 7
+
+    # replacing an entry replaces its size
+    cache.put(9, 9, size=10)
+    assert cache.statistics()["current_bytes"] == 70
+    cache.invalidate(lambda key: key % 2 == 1)
+    assert cache.statistics()["entries"] == 1 and cache.statistics()["current_bytes"] == 30
+    cache.clear()
+    assert cache.statistics()["entries"] == 0 and cache.statistics()["current_bytes"] == 0
+
+
+def test_sizes_of_the_values():
+    values = numpy.arange(1000, dtype=numpy.int64)
+    assert size_in_bytes(values) == 8000
+    assert size_in_bytes(pandas.Series(values)) >= 8000
+    assert size_in_bytes(pandas.DataFrame({'a': values, 'b': values})) >= 16000
+    assert size_in_bytes(b'1234') == 4
+
+
+def test_repeated_reads_are_served_from_the_cache(register):
+    dataframe_entity = register('cached', pandas.DataFrame({'a': numpy.arange(300), 'b': numpy.arange(300) * 2}))
+    before = dataframe_cache.statistics()
+    first = read_registered_dataframe(dataframe_entity, columns=['a'])
+    middle = dataframe_cache.statistics()
+    second = read_registered_dataframe(dataframe_entity, columns=['a'])
+    after = dataframe_cache.statistics()
+    pandas.testing.assert_frame_equal(first, second)
+    assert middle["misses"] > before["misses"]
+    assert after["misses"] == middle["misses"] and after["hits"] > middle["hits"]
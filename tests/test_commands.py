@@ -0,0 +1,110 @@
+import os
+import time
+import sqlite3
+import pandas
+import sqlalchemy
+from flask import Flask
+from flask_migrate import Migrate, upgrade, downgrade
+
+from application import db
+from application.commands import dataframes_cli, payloads_cli
+from application.entities import Dataframe
+from application.libraries.warehouse import is_columnar_copy_current, read_registered_dataframe
+from application.libraries.payloads import store_payload, PAYLOAD_DIRECTORY
+
+MIGRATIONS_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'visierra', 'migrations')
+
+# the columns of the `dataframe` table before the columnar copies
+BASELINE_COLUMNS = ['id', 'name', 'description', 'relative_path']
+
+
+def migrated_app(database_path: str) -> Flask:
+    app = Flask('visierra_migrations')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + database_path
+    db.init_app(app=app)
+    Migrate(app, db, directory=MIGRATIONS_DIRECTORY)
+    return app
+
+
+def dataframe_columns() -> list:
+    return [e['name'] for e in sqlalchemy.inspect(db.engine).get_columns('dataframe')]
+
+
+def test_register_command(app, application_directory):
+    pandas.DataFrame({'a': [1, 2, 3]}).to_csv(os.path.join(application_directory, 'warehouse', 'x.csv'), index=False)
+    runner = app.test_cli_runner()
+    result = runner.invoke(dataframes_cli, ['register', 'x', 'warehouse/x.csv', '--description', 'the x'])
+    assert result.exit_code == 0 and result.output == 'x: registered\n'
+    dataframe_entity = Dataframe.query.filter_by(name='x').first()
+    assert dataframe_entity.description == 'the x' and dataframe_entity.columnar_relative_path is not None
+
+    assert runner.invoke(dataframes_cli, ['register', 'x', 'warehouse/x.csv']).exit_code == 1
+    assert runner.invoke(dataframes_cli, ['register', 'y', 'warehouse/y.csv']).exit_code == 1
+    assert Dataframe.query.count() == 1
+
+
+def test_refresh_command(app, register, application_directory):
+    dataframe_entity = register('x', pandas.DataFrame({'a': range(10), 'subject': ['s1', 's2'] * 5}))
+    runner = app.test_cli_runner()
+    assert runner.invoke(dataframes_cli, ['refresh']).output == 'x: up to date\n'
+
+    pandas.DataFrame({'a': range(5), 'subject': ['s3'] * 5}).to_csv(
+        os.path.join(application_directory, dataframe_entity.relative_path), index=False)
+    assert not is_columnar_copy_current(dataframe_entity)
+    result = runner.invoke(dataframes_cli, ['refresh', 'x'])
+    assert result.exit_code == 0 and result.output == 'x: refreshed\n'
+    dataframe_entity = Dataframe.query.filter_by(name='x').first()
+    assert is_columnar_copy_current(dataframe_entity)
+    assert read_registered_dataframe(dataframe_entity, partition='s3')['a'].tolist() == list(range(5))
+
+    assert runner.invoke(dataframes_cli, ['refresh', 'y']).exit_code == 1
+
+
+def test_sweep_command(app, application_directory):
+    old_token = store_payload(b'old', 'image/png')
+    store_payload(b'new', 'image/png')
+    old_path = os.path.join(application_directory, PAYLOAD_DIRECTORY, old_token)
+    os.utime(old_path, (time.time() - 7200, time.time() - 7200))
+    runner = app.test_cli_runner()
+    assert runner.invoke(payloads_cli, ['sweep']).output == '0 payloads removed\n'
+    assert runner.invoke(payloads_cli, ['sweep', '--max-age', '3600']).output == '1 payloads removed\n'
+    assert not os.path.exists(old_path)
+
+
+def test_migrations_create_the_tables(tmp_path):
+    app = migrated_app(str(tmp_path / 'new.db'))
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIRECTORY)
+        assert {'user', 'role', 'roles_users', 'dataframe'} <= set(sqlalchemy.inspect(db.engine).get_table_names())
+        assert set(dataframe_columns()) == set(Dataframe.__table__.columns.keys())
+        downgrade(directory=MIGRATIONS_DIRECTORY, revision='-1')
+        assert dataframe_columns() == BASELINE_COLUMNS
+
+
+def test_migrations_upgrade_the_existing_databases(tmp_path):
+    # a database that was created before the columnar copies
+    database_path = str(tmp_path / 'existing.db')
+    connection = sqlite3.connect(database_path)
+    connection.execute(
+        'CREATE TABLE dataframe (id INTEGER PRIMARY KEY, name VARCHAR(255) UNIQUE, description VARCHAR(1000), '
+        'relative_path VARCHAR(1000))')
+    connection.execute("INSERT INTO dataframe VALUES (1, 'x', 'the x', 'warehouse/x.csv')")
+    connection.commit()
+    connection.close()
+
+    app = migrated_app(database_path)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIRECTORY)
+        assert set(dataframe_columns()) == set(Dataframe.__table__.columns.keys())
+        dataframe_entity = Dataframe.query.first()
+        assert dataframe_entity.name == 'x' and dataframe_entity.columnar_relative_path is None
+
+
+def test_migrations_keep_the_created_columns(tmp_path):
+    # a database that was created by `db.create_all` with the columns already
+    app = migrated_app(str(tmp_path / 'created.db'))
+    with app.app_context():
+        db.create_all()
+        upgrade(directory=MIGRATIONS_DIRECTORY)
+        assert set(dataframe_columns()) == set(Dataframe.__table__.columns.keys())
@@ -0,0 +1,68 @@
+import numpy
+import pandas
+import pytest
+
+from application.libraries.dates import quantize_dates, date_parts
+
+
+def baseline_quantize_date(date: str, resolution: str) -> int:
+    # the dates were quantized one row at a time, by joining the first parts of their `str` values
+    date_parts = date.replace('_', '-').split('-')
+    return int(''.join(date_parts[:{'year': 1, 'month': 2, 'day': 3}[resolution]]))
+
+
+@pytest.fixture
+def dates() -> pandas.Series:
+    generator = numpy.random.default_rng(0)
+    return pandas.Series(
+        pandas.Timestamp('2018-12-20') + pandas.to_timedelta(generator.integers(0, 800, 1000), unit='D')
+    ).dt.strftime('%Y-%m-%d')
+
+
+@pytest.mark.parametrize('resolution', ['year', 'month', 'day'])
+@pytest.mark.parametrize('layout', ['str', 'underscores', 'categorical', 'datetime64'])
+def test_quantize_dates_matches_baseline(dates, resolution, layout):
+    expected = numpy.array([baseline_quantize_date(e, resolution) for e in dates])
+    column = {
+        'str': dates,
+        'underscores': dates.str.replace('-', '_'),
+        'categorical': dates.astype('category'),
+        'datetime64': pandas.to_datetime(dates)
+    }[layout]
+    quantized = quantize_dates(column, resolution)
+    assert quantized.dtype == numpy.int64
+    numpy.testing.assert_array_equal(quantized, expected)
+
+
+@pytest.mark.parametrize('layout', ['str', 'categorical', 'datetime64'])
+def test_weeks_and_hours_match_the_calendar(dates, layout):
+    timestamps = pandas.to_datetime(dates) + pandas.to_timedelta(numpy.arange(len(dates)) % 24, unit='h')
+    column = {
+        'str': timestamps.dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'categorical': timestamps.dt.strftime('%Y-%m-%d %H:%M:%S').astype('category'),
+        'datetime64': timestamps
+    }[layout]
+    calendar = timestamps.dt.isocalendar()
+    numpy.testing.assert_array_equal(
+        quantize_dates(column, 'week'), calendar['year'].to_numpy() * 100 + calendar['week'].to_numpy())
+    numpy.testing.assert_array_equal(
+        quantize_dates(column, 'hour'), timestamps.dt.strftime('%Y%m%d%H').astype(numpy.int64).to_numpy())
+
+
+def test_dates_without_hours_get_the_default_hour():
+    column = pandas.Series(['2019-09-05', '2019_09_05 13', '2019-09-05T07'])
+    numpy.testing.assert_array_equal(quantize_dates(column, 'hour'), [2019090500, 2019090513, 2019090507])
+    numpy.testing.assert_array_equal(
+        quantize_dates(column, 'hour', default_hour=23), [2019090523, 2019090513, 2019090507])
+
+
+def test_weeks_roll_over_the_days_past_the_end_of_the_month():
+    column = pandas.Series(['2019-02-30', '2019-03-02', '2020-12-32', '2021-01-01', '2019-13-01'])
+    # the parts are not validated, so `2019-13-01` is the first day of 2020
+    numpy.testing.assert_array_equal(quantize_dates(column, 'week'), [201909, 201909, 202053, 202053, 202001])
+    numpy.testing.assert_array_equal(date_parts(column)["day"], [30, 2, 32, 1, 1])
+
+
+def test_dates_that_are_not_dates_are_rejected():
+    with pytest.raises(ValueError):
+        quantize_dates(pandas.Series(['2019-09-05', 'week 3']), 'day')
@@ -0,0 +1,60 @@
+import numpy
+import pandas
+import pytest
+
+from application.libraries.downsampling import downsample_series, validate_max_points
+
+
+def baseline_min_max_rows(dataframe: pandas.DataFrame, value_columns, max_points: int) -> pandas.DataFrame:
+    # the min/max-per-bin rows found with a loop over the bins
+    number_of_bins = (max_points - 2) // (2 * len(value_columns))
+    bin_size = -(-dataframe.shape[0] // number_of_bins)
+    positions = {0, dataframe.shape[0] - 1}
+    for column in value_columns:
+        values = dataframe[column].to_numpy(dtype=numpy.float64)
+        for start in range(0, len(values), bin_size):
+            values_of_bin = values[start:start + bin_size]
+            if numpy.isnan(values_of_bin).all():
+                positions.add(start)
+                continue
+            positions.add(start + int(numpy.nanargmin(values_of_bin)))
+            positions.add(start + int(numpy.nanargmax(values_of_bin)))
+    return dataframe.iloc[sorted(positions)]
+
+
+@pytest.fixture
+def series() -> pandas.DataFrame:
+    generator = numpy.random.default_rng(0)
+    dataframe = pandas.DataFrame({
+        'timestamp': pandas.date_range('2019-01-01', periods=5000, freq='h'),
+        'x': generator.normal(size=5000).cumsum(),
+        'y': generator.normal(size=5000),
+        'z': generator.integers(0, 100, 5000)
+    })
+    dataframe.loc[100:900, 'y'] = numpy.nan
+    return dataframe
+
+
+@pytest.mark.parametrize('max_points', [8, 9, 50, 333, 1000, 4999])
+def test_downsample_series_matches_baseline(series, max_points):
+    value_columns = ['x', 'y', 'z']
+    output = downsample_series(series, value_columns, max_points=max_points)
+    pandas.testing.assert_frame_equal(output, baseline_min_max_rows(series, value_columns, max_points))
+    assert output.shape[0] <= max_points
+    for column in value_columns:
+        assert output[column].min() == series[column].min() and output[column].max() == series[column].max()
+    assert output['timestamp'].iloc[0] == series['timestamp'].iloc[0]
+    assert output['timestamp'].iloc[-1] == series['timestamp'].iloc[-1]
+
+
+@pytest.mark.parametrize('max_points', [None, 5000, 10000])
+def test_downsample_series_keeps_small_series(series, max_points):
+    pandas.testing.assert_frame_equal(downsample_series(series, ['x', 'y', 'z'], max_points=max_points), series)
+
+
+@pytest.mark.parametrize('max_points', [7, 0, -5, 2.5, '100', True])
+def test_invalid_max_points(series, max_points):
+    with pytest.raises(ValueError):
+        validate_max_points(max_points, number_of_series=3)
+    with pytest.raises(ValueError):
+        downsample_series(series, ['x', 'y', 'z'], max_points=max_points)
@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from application.libraries.files import replace_file, replaced_file
+
+
+def test_files_are_replaced_at_once(tmp_path):
+    path = os.path.join(tmp_path, 'file')
+    replace_file(path, b'first')
+    with replaced_file(path) as handle:
+        handle.write(b'second')
+        # the file is not changed until it is written completely
+        with open(path, 'rb') as file:
+            assert file.read() == b'first'
+    with open(path, 'rb') as file:
+        assert file.read() == b'second'
+    assert os.listdir(tmp_path) == ['file']
+
+
+def test_failed_writes_leave_the_file_unchanged(tmp_path):
+    path = os.path.join(tmp_path, 'file')
+    replace_file(path, b'first')
+    with pytest.raises(RuntimeError):
+        with replaced_file(path) as handle:
+            handle.write(b'partial')
+            raise RuntimeError()
+    with open(path, 'rb') as file:
+        assert file.read() == b'first'
+    assert os.listdir(tmp_path) == ['file']
@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import time
+import types
+import numpy
+import pandas
+import pytest
+from flask import Flask
+
+from application import initialize_job_worker
+from application.libraries.jobs import JobQueue, JobQueueFull, FINAL_JOB_STATUSES
+from application.libraries.warehouse import detached_dataframe, readable_dataframe
+from application.libraries.ml_toolkit.utilities import ffnn_experiment_job
+
+
+def echo(progress, message: bytes) -> bytes:
+    progress.update(0.5, 'echoing')
+    progress.write_file('echoed', message[::-1])
+    return message
+
+
+def fail(progress):
+    raise ValueError('the job failed')
+
+
+def wait(progress, path: str):
+    # runs until it is cancelled, or until the file exists
+    while not os.path.exists(path):
+        progress.update(0.5, 'waiting')
+        time.sleep(0.05)
+    return b'done'
+
+
+def cache_budgets(progress) -> bytes:
+    from application import dataframe_cache, transformation_cache
+    return '{},{}'.format(dataframe_cache.max_bytes, transformation_cache.max_bytes).encode('utf-8')
+
+
+def finished_status(queue: JobQueue, job_id: str, timeout: float = 60) -> dict:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status["status"] in FINAL_JOB_STATUSES:
+            return status
+        time.sleep(0.05)
+    raise TimeoutError(job_id)
+
+
+@pytest.fixture
+def jobs_app(tmp_path):
+    app = Flask('visierra_jobs', root_path=str(tmp_path))
+    app.config.update(DATAFRAME_CACHE_MAX_BYTES=1000, TRANSFORMATION_CACHE_MAX_BYTES=2000)
+    return app
+
+
+@pytest.fixture
+def queue(jobs_app):
+    queue = JobQueue(
+        max_queued=1,
+        initializer=initialize_job_worker,
+        initializer_keys=['DATAFRAME_CACHE_MAX_BYTES', 'TRANSFORMATION_CACHE_MAX_BYTES']
+    )
+    queue.init_app(jobs_app)
+    yield queue
+    if queue.executor is not None:
+        queue.executor.shutdown(cancel_futures=True)
+
+
+def test_queue_is_started_by_the_first_job(queue):
+    assert not os.path.exists(queue.directory) and queue.executor is None
+    assert queue.jobs() == dict() and queue.status('0' * 32) is None and not queue.cancel('0' * 32)
+    assert queue.status('../jobs') is None and queue.output('../jobs') is None
+
+    job_id = queue.submit(echo, message=b'output')
+    assert os.path.isdir(queue.directory) and queue.executor is not None
+    status = finished_status(queue, job_id)
+    assert status["status"] == 'done' and status["progress"] == 1.0 and status["error"] is None
+    assert queue.output(job_id) == b'output' and list(queue.jobs().keys()) == [job_id]
+    assert queue.output(job_id, name='echoed') == b'tuptuo' and queue.output(job_id, name='missing') is None
+
+
+def test_workers_apply_the_cache_budgets(queue):
+    job_id = queue.submit(cache_budgets)
+    assert finished_status(queue, job_id)["status"] == 'done'
+    assert queue.output(job_id) == b'1000,2000'
+
+
+def test_failures_are_recorded(queue):
+    job_id = queue.submit(fail)
+    status = finished_status(queue, job_id)
+    assert status["status"] == 'failed' and status["error"] == 'ValueError: the job failed'
+    assert queue.output(job_id) is None
+
+
+def test_jobs_are_cancelled(queue, jobs_app, tmp_path):
+    running = queue.submit(wait, path=str(tmp_path / 'never'))
+    queued = queue.submit(wait, path=str(tmp_path / 'never'))
+    # one job runs and one waits, so the queue is full
+    with pytest.raises(JobQueueFull):
+        queue.submit(echo, message=b'output')
+
+    # the queued job is cancelled right away, even from another process of the server (which has no future of it)
+    other = JobQueue()
+    other.init_app(jobs_app)
+    assert other.cancel(queued)
+    assert queue.status(queued)["status"] == 'cancelled'
+    deadline = time.time() + 60
+    while queue.status(running)["status"] != 'running' and time.time() < deadline:
+        time.sleep(0.05)
+    assert queue.status(running)["stage"] == 'waiting'
+    assert queue.cancel(running) and queue.status(running)["cancelled"]
+    assert finished_status(queue, running)["status"] == 'cancelled'
+    assert not queue.cancel(running)
+
+
+def test_experiments_read_their_dataframe(register, monkeypatch):
+    # the picture of the confusion matrix is drawn by plauthor, which is replaced by a plain one
+    matrix = types.ModuleType('plauthor.plotters.matrix')
+    matrix.visualize_matrix = lambda *arguments, save_to_file, **keywords: open(save_to_file, 'wb').write(b'\x89PNG')
+    for name in ['plauthor', 'plauthor.plotters']:
+        monkeypatch.setitem(sys.modules, name, types.ModuleType(name))
+    monkeypatch.setitem(sys.modules, 'plauthor.plotters.matrix', matrix)
+
+    generator = numpy.random.default_rng(0)
+    dataframe_entity = register('experiment', pandas.DataFrame({
+        'a': generator.normal(size=300),
+        'b': generator.normal(size=300),
+        'label': generator.choice(['x', 'y'], 300),
+        'subject': generator.choice(['s1', 's2'], 300)
+    }))
+    stages, files = [], dict()
+    progress = types.SimpleNamespace(
+        update=lambda fraction, stage: stages.append(stage), write_file=lambda name, body: files.update({name: body}))
+    output = ffnn_experiment_job(
+        progress,
+        dataframe=detached_dataframe(readable_dataframe(dataframe_entity)),
+        guide={"transformations": [{"name": "equality", "column": 'subject', "value": 's1', "negation": False}]},
+        label_column='label',
+        feature_columns=['a', 'b'],
+        hidden_layer_config=(4,)
+    )
+    assert output == b'\x89PNG'
+    assert stages[:2] == ['reading', 'preparing']
+    # the layouts of the columns are kept along with the output, to be reused
+    layouts = json.loads(files['layouts.json'])
+    assert sorted(layouts.keys()) == ['label'] and sorted(layouts['label']) == ['x', 'y']
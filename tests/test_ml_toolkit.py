@@ -0,0 +1,131 @@
+import numpy
+import pandas
+import pytest
+
+from application.libraries.ml_toolkit.utilities import encode_categories, stratified_split, prepare_the_dataframe_for_ml
+
+
+def baseline_encode(values: pandas.Series):
+    # the categories were encoded one row at a time, as their positions in the order of their first appearance
+    layout = values.unique().tolist()
+    return numpy.array([layout.index(e) for e in values]), layout
+
+
+@pytest.fixture
+def labels() -> numpy.ndarray:
+    generator = numpy.random.default_rng(0)
+    return generator.choice(['a', 'b', 'c', 'd'], 1000, p=[0.55, 0.25, 0.15, 0.05])
+
+
+def test_encode_categories_matches_baseline(labels):
+    codes, layout = encode_categories(pandas.Series(labels))
+    baseline_codes, baseline_layout = baseline_encode(pandas.Series(labels))
+    assert layout == baseline_layout
+    numpy.testing.assert_array_equal(codes, baseline_codes)
+
+
+def test_encode_categories_reuses_layouts(labels):
+    codes, layout = encode_categories(pandas.Series(labels), layout=['d', 'c', 'b', 'a'])
+    assert layout == ['d', 'c', 'b', 'a']
+    numpy.testing.assert_array_equal(numpy.array(layout)[codes], labels)
+    with pytest.raises(ValueError):
+        encode_categories(pandas.Series(labels), layout=['a', 'b'])
+    codes, _ = encode_categories(pandas.Series(labels), layout=['a', 'b'], unseen='ignore')
+    numpy.testing.assert_array_equal(codes < 0, numpy.isin(labels, ['c', 'd']))
+
+
+@pytest.mark.parametrize('train_fraction', [0.5, 0.8])
+@pytest.mark.parametrize('balancing', ['none', 'under', 'over'])
+def test_stratified_split_matches_the_fractions_of_the_labels(labels, train_fraction, balancing):
+    train_positions, test_positions = stratified_split(labels, train_fraction=train_fraction, balancing=balancing)
+    counts = pandas.Series(labels).value_counts()
+    train_counts = numpy.maximum((train_fraction * counts).astype(int), 1)
+
+    # the test set holds the rest of the rows of each label, in order
+    train_rows = numpy.unique(train_positions)
+    assert len(numpy.intersect1d(train_rows, test_positions)) == 0
+    numpy.testing.assert_array_equal(test_positions, numpy.sort(test_positions))
+    pandas.testing.assert_series_equal(
+        pandas.Series(labels[test_positions]).value_counts().sort_index(),
+        (counts - train_counts).sort_index())
+
+    expected = {
+        'none': train_counts,
+        'under': pandas.Series(train_counts.min(), index=train_counts.index),
+        'over': pandas.Series(train_counts.max(), index=train_counts.index)
+    }[balancing]
+    pandas.testing.assert_series_equal(
+        pandas.Series(labels[train_positions]).value_counts().sort_index(), expected.sort_index(), check_names=False)
+    if balancing == 'over':
+        assert len(train_rows) + len(test_positions) == len(labels)
+
+
+def test_stratified_split_is_reproducible(labels):
+    first, second = stratified_split(labels, seed=7), stratified_split(labels, seed=7)
+    numpy.testing.assert_array_equal(first[0], second[0])
+    numpy.testing.assert_array_equal(first[1], second[1])
+
+
+@pytest.mark.parametrize('balancing', ['none', 'under', 'over'])
+def test_prepare_the_dataframe_for_ml_matches_the_split(labels, balancing):
+    generator = numpy.random.default_rng(1)
+    dataframe = pandas.DataFrame({
+        'x': generator.normal(size=len(labels)),
+        'c': generator.choice(['p', 'q'], len(labels)),
+        'y': pandas.Series(labels).map({'a': 3, 'b': 1, 'c': 7, 'd': 5})
+    })
+    X_train, y_train, X_test, y_test, layout, layouts = prepare_the_dataframe_for_ml(
+        dataframe, 'y', ['x', 'c'], balancing=balancing)
+    assert layout == [1, 3, 5, 7] and layouts == {'c': pandas.unique(dataframe['c']).tolist(), 'y': layout}
+
+    codes = pandas.Index(layout).get_indexer(dataframe['y'])
+    train_positions, test_positions = stratified_split(codes, balancing=balancing)
+    features = numpy.stack([
+        dataframe['x'].to_numpy(), baseline_encode(dataframe['c'].astype(str))[0]], axis=1).astype(numpy.float32)
+    numpy.testing.assert_array_equal(X_train, features[train_positions])
+    numpy.testing.assert_array_equal(X_test, features[test_positions])
+    numpy.testing.assert_array_equal(y_train, codes[train_positions])
+    numpy.testing.assert_array_equal(y_test, codes[test_positions])
+    assert X_train.flags['C_CONTIGUOUS'] and X_test.flags['C_CONTIGUOUS']
+
+
+def test_prepare_the_dataframe_for_ml_reuses_the_layouts(labels):
+    generator = numpy.random.default_rng(2)
+    dataframe = pandas.DataFrame({
+        'c': generator.choice(['p', 'q', 'r'], len(labels)),
+        'n': generator.choice([10, 20, 30], len(labels)),
+        'y': labels
+    })
+    layouts = {'c': ['r', 'q', 'p'], 'n': [30, 20, 10]}
+    X_train, y_train, X_test, _, layout, output_layouts = prepare_the_dataframe_for_ml(
+        dataframe, 'y', ['c', 'n'], category_layouts=layouts)
+    assert output_layouts == dict(layouts, y=layout) and layouts == {'c': ['r', 'q', 'p'], 'n': [30, 20, 10]}
+
+    # the numeric feature columns with a layout are encoded with it as well
+    train_positions, _ = stratified_split(pandas.Index(layout).get_indexer(dataframe['y']))
+    numpy.testing.assert_array_equal(X_train[:, 0], pandas.Index(layouts['c']).get_indexer(
+        dataframe['c'].to_numpy()[train_positions]))
+    numpy.testing.assert_array_equal(X_train[:, 1], pandas.Index(layouts['n']).get_indexer(
+        dataframe['n'].to_numpy()[train_positions]))
+
+    # the unseen categories of the features are never encoded as -1, while the rows of the unseen labels are left out
+    with pytest.raises(ValueError):
+        prepare_the_dataframe_for_ml(dataframe, 'y', ['c', 'n'], category_layouts={'c': ['p', 'q']}, unseen='ignore')
+    _, y_train, _, y_test, layout, _ = prepare_the_dataframe_for_ml(
+        dataframe, 'y', ['c', 'n'], category_layouts={'y': ['a', 'b', 'c']}, unseen='ignore')
+    assert layout == ['a', 'b', 'c'] and len(y_train) + len(y_test) == (labels != 'd').sum()
+
+
+def test_missing_dates_are_filled_like_the_other_columns(labels):
+    generator = numpy.random.default_rng(3)
+    days = pandas.Series(pandas.Timestamp('2019-01-01') + pandas.to_timedelta(
+        generator.integers(0, 5, len(labels)), unit='D')).dt.strftime('%Y-%m-%d')
+    days[::10] = None
+    dataframe = pandas.DataFrame({'d': days, 'y': labels})
+    # the date columns are parsed at registration (please refer to `compact_dataframe`)
+    compacted = dataframe.assign(d=pandas.to_datetime(dataframe['d'], format='%Y-%m-%d'))
+    expected = prepare_the_dataframe_for_ml(dataframe, 'y', ['d'])
+    output = prepare_the_dataframe_for_ml(compacted, 'y', ['d'])
+    assert 'NaT' not in output[5]['d'] and output[5] == expected[5]
+    for array, expected_array in zip(output[:4], expected[:4]):
+        numpy.testing.assert_array_equal(array, expected_array)
@@ -0,0 +1,114 @@
+import io
+import os
+import gzip
+import json
+import time
+import base64
+import numpy
+import pandas
+import pytest
+
+from application import chart_payload_cache
+from application.libraries.payloads import (
+    serialize_payload, inline_payload, store_payload, chart_payload, remove_old_payloads, PAYLOAD_FORMATS,
+    PAYLOAD_DIRECTORY)
+
+
+@pytest.fixture
+def morphed_data() -> pandas.DataFrame:
+    dataframe = pandas.DataFrame({
+        'count': numpy.arange(50, dtype=numpy.int64),
+        'value': numpy.linspace(-1, 1, 50),
+        'label': pandas.Categorical(numpy.tile(['x', 'y'], 25)),
+        'name': ['n{}'.format(e) for e in range(50)],
+        'date': pandas.date_range('2019-01-01', periods=50, freq='D'),
+        'flag': numpy.tile([True, False], 25)
+    })
+    dataframe.loc[::9, 'value'] = numpy.nan
+    dataframe.loc[::11, 'name'] = None
+    return dataframe
+
+
+def decode(body: bytes, payload_format: str) -> pandas.DataFrame:
+    if payload_format == 'csv':
+        return pandas.read_csv(io.BytesIO(body))
+    payload = json.loads(body.decode('utf-8'))
+    assert all(len(payload["data"][e]) == payload["length"] for e in payload["columns"])
+    return pandas.DataFrame(payload["data"], columns=payload["columns"])
+
+
+def comparable(dataframe: pandas.DataFrame) -> pandas.DataFrame:
+    # the values as the charts read them: the numbers as numbers and everything else as text
+    return pandas.DataFrame({
+        column: dataframe[column].astype(float) if column in ['count', 'value'] else
+        dataframe[column].astype(object).map(str, na_action='ignore').where(dataframe[column].notna(), None)
+        for column in dataframe.columns
+    })
+
+
+@pytest.mark.parametrize('payload_format', list(PAYLOAD_FORMATS.keys()))
+def test_payload_formats_match_the_csv_baseline(morphed_data, payload_format):
+    baseline = decode(morphed_data.to_csv(index=False).encode('utf-8'), 'csv')
+    decoded = decode(serialize_payload(morphed_data, payload_format=payload_format), payload_format)
+    assert decoded.columns.tolist() == morphed_data.columns.tolist()
+    decoded['date'] = pandas.to_datetime(decoded['date']).dt.strftime('%Y-%m-%d')
+    pandas.testing.assert_frame_equal(comparable(decoded), comparable(baseline))
+
+
+@pytest.mark.parametrize('payload_format', list(PAYLOAD_FORMATS.keys()))
+def test_stored_chart_payloads_keep_their_format(application_directory, morphed_data, payload_format):
+    body = serialize_payload(morphed_data, payload_format=payload_format)
+    token = store_payload(body, PAYLOAD_FORMATS[payload_format], compress=True)
+    chart_payload_cache.clear()
+    stored_body, _, mimetype, compressed = chart_payload(token)
+    assert mimetype == PAYLOAD_FORMATS[payload_format] and compressed
+    assert gzip.decompress(stored_body) == body
+
+
+def test_stored_payloads_are_found_by_the_other_processes(application_directory):
+    token = store_payload(b'picture' * 100, 'image/png', compress=True)
+    body, entity_tag, mimetype, compressed = chart_payload(token)
+    # another process of the server reads the payload from its file
+    chart_payload_cache.clear()
+    assert chart_payload(token) == (body, entity_tag, mimetype, compressed)
+    assert mimetype == 'image/png' and compressed
+    assert gzip.decompress(body) == b'picture' * 100
+
+
+def test_unknown_payloads(application_directory):
+    token = store_payload(b'picture', 'image/png')
+    chart_payload_cache.clear()
+    assert chart_payload(token)[0] == b'picture'
+    assert chart_payload('0' * 32) is None
+    assert chart_payload('../' + token) is None
+
+
+def test_unshared_payloads_are_not_written(application_directory):
+    token = store_payload(b'picture', 'image/png', shared=False)
+    assert chart_payload(token)[0] == b'picture'
+    assert not os.path.exists(os.path.join(application_directory, PAYLOAD_DIRECTORY, token))
+    chart_payload_cache.clear()
+    assert chart_payload(token) is None
+
+
+def test_inlined_payloads_are_read_as_they_are(morphed_data):
+    morphed_data.loc[0, 'name'] = '</script><script>alert(1)</script>&'
+    body = serialize_payload(morphed_data, payload_format='columnar_json')
+    expression = str(inline_payload(body, PAYLOAD_FORMATS['columnar_json']))
+    assert '<' not in expression and '>' not in expression and '&' not in expression
+    assert json.loads(expression) == json.loads(body.decode('utf-8'))
+
+    picture = json.loads(str(inline_payload(b'\x89PNG picture', 'image/png')))
+    assert picture.startswith('data:image/png;base64,')
+    assert base64.b64decode(picture.split(',', 1)[1]) == b'\x89PNG picture'
+
+
+def test_old_payloads_are_removed(application_directory):
+    assert remove_old_payloads() == 0
+    old_token, new_token = store_payload(b'old', 'image/png'), store_payload(b'new', 'image/png')
+    old_path = os.path.join(application_directory, PAYLOAD_DIRECTORY, old_token)
+    os.utime(old_path, (time.time() - 7200, time.time() - 7200))
+    assert remove_old_payloads(max_age=3600) == 1
+    assert not os.path.exists(old_path)
+    chart_payload_cache.clear()
+    assert chart_payload(old_token) is None and chart_payload(new_token)[0] == b'new'
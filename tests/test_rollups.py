@@ -0,0 +1,126 @@
+import os
+import numpy
+import pandas
+import pytest
+
+from application import dataframe_cache
+from application.libraries.warehouse import read_step_rollup, build_columnar_copy, ensure_columnar_copy, \
+    read_transformed_dataframe, read_registered_dataframe
+
+
+def baseline_rollup(dataframe: pandas.DataFrame, resolution: str) -> pandas.DataFrame:
+    # the sums that the shoe visualizations computed from the raw rows
+    timestamps = pandas.to_datetime(dataframe['timestamp'])
+    quantized = {
+        'day': timestamps.dt.year * 10000 + timestamps.dt.month * 100 + timestamps.dt.day,
+        'month': timestamps.dt.year * 100 + timestamps.dt.month,
+        'year': timestamps.dt.year
+    }[resolution]
+    return canonical(dataframe.assign(timestamp=quantized).groupby(['subject', 'timestamp', 'step_type']).agg(
+        number_of_steps=('number_of_steps', 'sum')).reset_index())
+
+
+def rollup_level(rollup: pandas.DataFrame, resolution: str) -> pandas.DataFrame:
+    return canonical(rollup[rollup['resolution'] == resolution].drop(columns=['resolution']))
+
+
+def canonical(buckets: pandas.DataFrame) -> pandas.DataFrame:
+    buckets = buckets.astype({
+        'subject': object, 'timestamp': numpy.int64, 'step_type': object, 'number_of_steps': numpy.int64})
+    return buckets.sort_values(['subject', 'timestamp', 'step_type']).reset_index(drop=True)
+
+
+def steps(size: int, seed: int) -> pandas.DataFrame:
+    generator = numpy.random.default_rng(seed)
+    return pandas.DataFrame({
+        'subject': generator.choice(['s1', 's2', 's3'], size),
+        'timestamp': pandas.Series(
+            pandas.Timestamp('2019-01-01') + pandas.to_timedelta(generator.integers(0, 700, size), unit='D')
+        ).dt.strftime('%Y-%m-%d'),
+        'step_type': generator.choice(['toe', 'normal', 'heel'], size),
+        'number_of_steps': generator.integers(0, 20, size)
+    })
+
+
+@pytest.fixture
+def step_dataframe() -> pandas.DataFrame:
+    return steps(1000, seed=0)
+
+
+@pytest.mark.parametrize('resolution', ['day', 'month', 'year'])
+def test_rollup_matches_baseline(register, step_dataframe, resolution):
+    dataframe_entity = register('steps', step_dataframe)
+    pandas.testing.assert_frame_equal(
+        rollup_level(read_step_rollup(dataframe_entity, dict()), resolution),
+        baseline_rollup(step_dataframe, resolution))
+
+
+def test_rollup_of_appended_rows_matches_rebuild(register, application_directory, step_dataframe):
+    dataframe_entity = register('steps', step_dataframe)
+    appended = steps(300, seed=1)
+    appended.loc[:20, 'subject'] = 's4'
+    appended.to_csv(
+        os.path.join(application_directory, dataframe_entity.relative_path), mode='a', header=False, index=False)
+    whole = pandas.concat([step_dataframe, appended], ignore_index=True)
+
+    # the requests do not refresh the columnar copy, so the stale rollup is not used until it is refreshed
+    assert read_step_rollup(dataframe_entity, dict()) is None
+    ensure_columnar_copy(dataframe_entity)
+    rollup = read_step_rollup(dataframe_entity, dict())
+    for resolution in ['day', 'month', 'year']:
+        pandas.testing.assert_frame_equal(
+            rollup_level(rollup, resolution),
+            baseline_rollup(whole, resolution))
+
+    # the rollup that is built again from the whole file is read from the disk rather than the cache
+    build_columnar_copy(dataframe_entity)
+    dataframe_cache.clear()
+    pandas.testing.assert_frame_equal(
+        rollup_level(read_step_rollup(dataframe_entity, dict()), 'day'), rollup_level(rollup, 'day'))
+
+
+@pytest.mark.parametrize('subjects', ['numbers', 'missing', 'none'])
+def test_rollup_of_a_subject_matches_its_partition(register, step_dataframe, subjects):
+    if subjects == 'numbers':
+        # the subjects of the rows without one are missing, so the column is read as floats (e.g. 12.0)
+        step_dataframe['subject'] = step_dataframe['subject'].map({'s1': 12, 's2': 13, 's3': None})
+    elif subjects == 'missing':
+        step_dataframe['subject'] = None
+    else:
+        step_dataframe = step_dataframe.drop(columns=['subject'])
+    dataframe_entity = register('steps', step_dataframe)
+    for subject in ['12', 13, 's1']:
+        rows = read_registered_dataframe(dataframe_entity, partition=subject)
+        buckets = read_step_rollup(dataframe_entity, dict(), partition=subject)
+        assert buckets[buckets['resolution'] == 'day']['number_of_steps'].sum() == rows['number_of_steps'].sum()
+        if subjects == 'numbers':
+            assert rows.shape[0] == (step_dataframe['subject'].astype(str) == '{}.0'.format(subject)).sum()
+        else:
+            assert rows.shape[0] == (0 if subjects == 'missing' else step_dataframe.shape[0])
+
+
+def test_rollup_is_not_used_for_transformed_rows(register, step_dataframe):
+    dataframe_entity = register('steps', step_dataframe)
+    assert read_step_rollup(dataframe_entity, {"transformations": [
+        {"name": "equality", "column": "subject", "value": "s1", "negation": False}]}) is None
+    assert read_step_rollup(dataframe_entity, {"column_mapping": {"number_of_steps": "steps"}}) is None
+
+
+def test_rollup_is_skipped_for_timestamps_that_are_not_dates(register, step_dataframe):
+    step_dataframe['timestamp'] = ['week {}'.format(e % 7) for e in range(step_dataframe.shape[0])]
+    dataframe_entity = register('steps', step_dataframe)
+    assert dataframe_entity.rollup is None
+    assert read_step_rollup(dataframe_entity, dict()) is None
+    assert read_transformed_dataframe(dataframe_entity, dict()).shape == step_dataframe.shape
+
+
+def test_rollup_is_not_mistaken_for_a_column(register, step_dataframe):
+    dataframe = step_dataframe.assign(rollup=numpy.arange(step_dataframe.shape[0]))
+    dataframe_entity = register('steps', dataframe)
+    column = read_registered_dataframe(dataframe_entity, columns=['rollup'])['rollup']
+    rollup = read_step_rollup(dataframe_entity, dict())
+    assert isinstance(rollup, pandas.DataFrame) and rollup.shape[0] > 0
+    numpy.testing.assert_array_equal(column.to_numpy(), dataframe['rollup'].to_numpy())
+    numpy.testing.assert_array_equal(
+        read_registered_dataframe(dataframe_entity, columns=['rollup'])['rollup'].to_numpy(),
+        dataframe['rollup'].to_numpy())
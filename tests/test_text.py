@@ -0,0 +1,161 @@
+import os
+import numpy
+import pandas
+import pytest
+from PIL import Image
+from wordcloud import WordCloud, STOPWORDS
+
+from application import chart_payload_cache
+from application.libraries.text import TextAggregation, fold_cases
+from application.libraries.payloads import payload_token, store_payload, chart_payload
+from application.libraries.transformation import guide_fingerprint
+from application.libraries.warehouse import read_token_frequencies, read_transformed_dataframe
+from application.blueprints.visualizations import visualizations
+from application.blueprints.visualizations.visualizations import WordCloudsVisualization, word_cloud_coloring, \
+    WORD_CLOUD_MASK
+
+WORDS = [
+    'New', 'York', 'new', 'york', 'pain', 'Pain', 'pains', 'knee', "knee's", 'the', 'and', 'walked', '42', 'Dogs',
+    'dog', "IT'S", 'ok', 'very', 'much', 'thank', 'you', 'glass', 'glasses', 'said', 'café'
+]
+
+
+def baseline_frequencies(comments: list, collocations: bool) -> dict:
+    # the word clouds counted the words of all of the comments joined together, the bigrams of which spanned two
+    # comments as well, so the comments are separated by a stopword that does not pair with the other words
+    text = ' the '.join([e for e in comments if type(e) == str])
+    return WordCloud(stopwords=set(STOPWORDS) | {'said'}, collocations=collocations).process_text(text)
+
+
+def random_comments(count: int, seed: int) -> list:
+    generator = numpy.random.default_rng(seed)
+    comments = []
+    for index in range(count):
+        words = generator.choice(WORDS, generator.integers(1, 12)).tolist()
+        if index % 3 == 0:
+            # the frequent pairs of words become collocations
+            words += ['New', 'York', 'thank', 'you.']
+        comments.append(' '.join(words) if index % 17 else None)
+    return comments
+
+
+@pytest.mark.parametrize('collocations', [True, False])
+def test_counts_match_the_word_clouds(collocations):
+    for seed in range(10):
+        comments = random_comments(60, seed)
+        counted = TextAggregation().count_tokens([pandas.Series(comments)], collocations=collocations)
+        baseline = baseline_frequencies(comments, collocations)
+        assert counted == baseline
+        # the words keep the order that the word clouds break the ties in
+        assert list(counted.keys()) == list(baseline.keys())
+
+
+def test_cases_are_folded_to_the_most_common_one():
+    folded, cases = fold_cases({'Pain': 3, 'pain': 1, 'pains': 2, 'York': 1})
+    assert folded == {'Pain': 6, 'York': 1} and cases['pain'] == 'Pain'
+
+
+@pytest.mark.parametrize('collocations', [True, False])
+def test_token_index_matches_the_counted_comments(register, collocations):
+    comments = random_comments(600, seed=0)
+    dataframe = pandas.DataFrame({'n': numpy.arange(600), 'COMMENT': comments})
+    dataframe_entity = register('comments', dataframe)
+    assert dataframe_entity.token_index is not None
+    visualization = WordCloudsVisualization(guide={"collocations": collocations})
+
+    assert read_token_frequencies(dataframe_entity, dict(), collocations=collocations) == \
+        baseline_frequencies(comments, collocations)
+    guide = {"transformations": [{"name": "inequality", "column": 'n', "type": '<', "value": 250, "negation": False}]}
+    data = read_transformed_dataframe(dataframe_entity, guide)
+    indexed = read_token_frequencies(dataframe_entity, guide, rows=data.index.to_numpy(), collocations=collocations)
+    assert indexed == visualization.word_frequencies(data) == baseline_frequencies(comments[:250], collocations)
+
+    # the index only describes the raw comments
+    assert read_token_frequencies(dataframe_entity, {"column_mapping": {'COMMENT': 'PatientComment'}}) is None
+
+
+@pytest.fixture
+def parallel_aggregation():
+    aggregation = TextAggregation(processes=2, chunk_size=7)
+    yield aggregation
+    if aggregation.executor is not None:
+        aggregation.executor.shutdown()
+
+
+def test_parallel_counts_match_the_serial_ones(parallel_aggregation):
+    comments = pandas.Series(random_comments(200, seed=1))
+    # the chunks of the caller are split further, and their outputs are merged in order
+    chunks = [comments.iloc[:50], comments.iloc[50:51], comments.iloc[51:]]
+    for collocations in [True, False]:
+        counted = parallel_aggregation.count_tokens(chunks, collocations=collocations)
+        serial = TextAggregation().count_tokens([comments], collocations=collocations)
+        assert counted == serial and list(counted.keys()) == list(serial.keys())
+    assert parallel_aggregation.executor is not None
+    assert parallel_aggregation.count_tokens([comments.iloc[:0]]) == dict()
+
+
+def test_parallel_token_matrix_matches_the_serial_one(parallel_aggregation):
+    comments = pandas.Series(random_comments(200, seed=2))
+    vocabulary, serial_vocabulary = dict(), dict()
+    matrix, number_of_rows = parallel_aggregation.token_matrix([comments], vocabulary, number_of_rows=10)
+    serial_matrix, _ = TextAggregation().token_matrix([comments], serial_vocabulary, number_of_rows=10)
+    assert number_of_rows == 210 and matrix.shape == (210, len(vocabulary))
+    assert vocabulary == serial_vocabulary
+    assert (matrix != serial_matrix).nnz == 0 and matrix[:10].nnz == 0
+
+
+@pytest.fixture
+def word_cloud_mask(application_directory, monkeypatch):
+    """
+    The mask of the word clouds (a colored disc on a white background) in the temporary application folder.
+    """
+    monkeypatch.setattr(visualizations, 'application_directory', application_directory)
+    mask_path = os.path.join(application_directory, WORD_CLOUD_MASK)
+    os.makedirs(os.path.dirname(mask_path))
+    x, y = numpy.mgrid[:200, :200]
+    picture = numpy.full((200, 200, 3), 255, dtype=numpy.uint8)
+    picture[(x - 100) ** 2 + (y - 100) ** 2 < 90 ** 2] = [200, 40, 40]
+    Image.fromarray(picture).save(mask_path)
+    word_cloud_coloring.cache_clear()
+    yield mask_path
+    word_cloud_coloring.cache_clear()
+
+
+def test_word_cloud_mask_is_decoded_once(word_cloud_mask):
+    mask, colors = word_cloud_coloring(WORD_CLOUD_MASK)
+    assert word_cloud_coloring(WORD_CLOUD_MASK)[0] is mask
+    assert word_cloud_coloring.cache_info().hits == 1 and word_cloud_coloring.cache_info().misses == 1
+    assert not mask.flags.writeable
+
+
+def test_rendered_word_clouds_are_reused(word_cloud_mask):
+    visualization = WordCloudsVisualization(guide=dict())
+    frequencies = visualization.word_frequencies(pandas.DataFrame({'COMMENT': random_comments(100, seed=3)}))
+    picture = visualization.generate_word_cloud_picture(frequencies)
+    # the pictures only depend on their key, so the ones that are rendered again are the same
+    assert picture.startswith(b'\x89PNG') and visualization.generate_word_cloud_picture(frequencies) == picture
+
+    guide = {"transformations": [{"name": "equality", "column": 'n', "value": 1, "negation": False}]}
+    token = payload_token(1, 'version', guide_fingerprint(guide), visualization.picture_parameters())
+    assert chart_payload(token) is None
+    store_payload(picture, 'image/png', token=token)
+    hits = chart_payload_cache.statistics()["hits"]
+    assert chart_payload(token)[0] == picture
+    assert chart_payload_cache.statistics()["hits"] == hits + 1
+
+    # another version of the dataframe, guide or parameters is rendered again
+    other_parameters = WordCloudsVisualization(guide={"collocations": False}).picture_parameters()
+    assert len({token,
+                payload_token(1, 'other version', guide_fingerprint(guide), visualization.picture_parameters()),
+                payload_token(1, 'version', guide_fingerprint(dict()), visualization.picture_parameters()),
+                payload_token(1, 'version', guide_fingerprint(guide), other_parameters)}) == 4
+
+
+def test_token_index_is_not_mistaken_for_a_column(register):
+    comments = random_comments(200, seed=0)
+    dataframe = pandas.DataFrame({'token_index': numpy.arange(200), 'COMMENT': comments})
+    dataframe_entity = register('comments', dataframe)
+    assert read_token_frequencies(dataframe_entity, dict()) == baseline_frequencies(comments, True)
+    numpy.testing.assert_array_equal(
+        read_transformed_dataframe(dataframe_entity, dict())['token_index'].to_numpy(), numpy.arange(200))
+    assert read_token_frequencies(dataframe_entity, dict()) == baseline_frequencies(comments, True)
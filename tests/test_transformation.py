@@ -0,0 +1,235 @@
+import random
+import numpy
+import pandas
+import pytest
+
+from application import dataframe_cache, transformation_cache
+from application.libraries.caching import size_in_bytes
+from application.libraries.transformation import transform_dataframe, transform_dataframe_chunks, \
+    compile_transformations, plan_transformations, column_statistics, map_columns, initial_transformation_state, \
+    transformation_states, transformation_state_output
+from application.libraries.warehouse import read_transformed_dataframe, read_transformed_chunks, \
+    explain_transformations, read_registered_dataframe
+
+
+def baseline_single_transformation(dataframe: pandas.DataFrame, single_transformation: dict) -> pandas.DataFrame:
+    # the filters as they were applied one after the other, before they were compiled and planned
+    if single_transformation["name"] == "random_selection":
+        return dataframe.sample(
+            single_transformation["row_count"], replace=True, random_state=single_transformation["seed"])
+    column = dataframe[single_transformation["column"]]
+    if single_transformation["name"] == "limit_range":
+        value, side = single_transformation["upper_bound"]
+        indices = column <= value if side == 'closed' else column < value
+        value, side = single_transformation["lower_bound"]
+        indices = indices & (column >= value if side == 'closed' else column > value)
+    elif single_transformation["name"] == "equality":
+        indices = column == single_transformation["value"]
+    else:
+        indices = {
+            '>': column.__gt__, '>=': column.__ge__, '<': column.__lt__, '<=': column.__le__
+        }[single_transformation["type"]](single_transformation["value"])
+    return dataframe[~indices if single_transformation["negation"] else indices]
+
+
+def baseline_transform(dataframe: pandas.DataFrame, guide: dict) -> pandas.DataFrame:
+    output = dataframe.copy()
+    for column, mapped_column in guide.get("column_mapping", dict()).items():
+        output[mapped_column] = dataframe[column]
+    for single_transformation in guide.get("transformations", []):
+        output = baseline_single_transformation(output, single_transformation)
+    return output
+
+
+def comparable(dataframe: pandas.DataFrame) -> pandas.DataFrame:
+    dataframe = dataframe.reset_index(drop=True)
+    dataframe = dataframe.astype({
+        column: object for column in dataframe.columns
+        if isinstance(dataframe[column].dtype, pandas.CategoricalDtype)})
+    return dataframe.loc[:, sorted(dataframe.columns)]
+
+
+def random_filter(generator: random.Random) -> dict:
+    name = generator.choice(['limit_range', 'equality', 'inequality'])
+    negation = generator.random() < 0.3
+    if name == 'limit_range':
+        lower = generator.uniform(-2, 1)
+        return {
+            "name": name, "column": generator.choice(['a', 'n']),
+            "lower_bound": [lower, generator.choice(['open', 'closed'])],
+            "upper_bound": [lower + generator.uniform(0, 2), generator.choice(['open', 'closed'])],
+            "negation": negation}
+    if name == 'equality':
+        return generator.choice([
+            {"name": name, "column": 'b', "value": generator.randint(0, 4), "negation": negation},
+            {"name": name, "column": 's', "value": generator.choice(['x', 'y', 'w']), "negation": negation}])
+    column = generator.choice(['a', 'b', 'n'])
+    return {
+        "name": name, "column": column, "type": generator.choice(['<', '<=', '>', '>=']),
+        "value": generator.uniform(0, 600) if column == 'n' else generator.uniform(-1, 3), "negation": negation}
+
+
+def random_guides(count: int, seed: int = 2019):
+    generator = random.Random(seed)
+    for index in range(count):
+        yield {
+            "column_mapping": {'a': 'aa'} if index % 2 else dict(),
+            "transformations": [random_filter(generator) for _ in range(generator.randint(0, 5))]
+        }
+
+
+@pytest.fixture
+def dataframe() -> pandas.DataFrame:
+    generator = numpy.random.default_rng(0)
+    dataframe = pandas.DataFrame({
+        'n': numpy.arange(600),
+        'a': generator.normal(size=600),
+        'b': generator.integers(0, 5, 600),
+        's': generator.choice(['x', 'y', 'z'], 600)
+    })
+    dataframe.loc[::7, 'a'] = numpy.nan
+    return dataframe
+
+
+def test_transform_dataframe_matches_baseline(dataframe):
+    for guide in random_guides(200):
+        pandas.testing.assert_frame_equal(
+            comparable(transform_dataframe(dataframe, guide)), comparable(baseline_transform(dataframe, guide)))
+
+
+def test_read_transformed_dataframe_matches_baseline(register, dataframe):
+    dataframe_entity = register('filters', dataframe)
+    # the guides are read twice, so that the cached outputs and prefixes are checked as well
+    for guide in list(random_guides(100)) * 2:
+        pandas.testing.assert_frame_equal(
+            comparable(read_transformed_dataframe(dataframe_entity, guide)),
+            comparable(baseline_transform(dataframe, guide)),
+            check_dtype=False)
+
+
+def test_mapped_columns_are_aliases_of_their_sources(dataframe):
+    original = dataframe.copy()
+    output = map_columns(dataframe, {'a': 'aa', 'b': 'bb'})
+    assert output.columns.tolist() == ['n', 'a', 'b', 's', 'aa', 'bb']
+    for column, mapped_column in [('a', 'aa'), ('b', 'bb')]:
+        assert numpy.shares_memory(output[mapped_column].to_numpy(), dataframe[column].to_numpy())
+        assert numpy.shares_memory(output[column].to_numpy(), dataframe[column].to_numpy())
+    pandas.testing.assert_frame_equal(dataframe, original)
+
+
+def test_cached_columns_are_not_changed_by_the_mappings(register, dataframe):
+    dataframe_entity = register('filters', dataframe)
+    registered = read_registered_dataframe(dataframe_entity)
+    cached = dataframe_cache.get((dataframe_entity.id, dataframe_entity.source_version, 'column', 'a'))
+    assert cached is not None
+
+    output = read_transformed_dataframe(dataframe_entity, {"column_mapping": {'a': 'aa'}, "transformations": []})
+    assert numpy.shares_memory(output['aa'].to_numpy(), cached.to_numpy())
+    # the mapped column is not added to the cached columns of the dataframe
+    pandas.testing.assert_frame_equal(read_registered_dataframe(dataframe_entity), registered)
+    pandas.testing.assert_series_equal(
+        cached, dataframe_cache.get((dataframe_entity.id, dataframe_entity.source_version, 'column', 'a')))
+    assert 'aa' not in read_registered_dataframe(dataframe_entity).columns
+
+
+def test_consecutive_filters_are_compiled_into_one_stage(dataframe):
+    filters = [
+        {"name": "equality", "column": 'b', "value": 1, "negation": False},
+        {"name": "inequality", "column": 'a', "type": '>', "value": 0, "negation": True}]
+    selection = {"name": "random_selection", "row_count": 50, "seed": 0}
+    plan = compile_transformations(filters + [selection] + filters[:1])
+    assert [(e["name"], e["indices"]) for e in plan] == [('filter', [0, 1]), ('random_selection', [2]), ('filter', [3])]
+    assert plan[0]["steps"] == filters
+
+    guide = {"transformations": filters + [selection] + filters[:1]}
+    output = transform_dataframe(dataframe, guide)
+    assert output.shape[0] == 50
+    pandas.testing.assert_frame_equal(comparable(output), comparable(baseline_transform(dataframe, guide)))
+    with pytest.raises(ValueError):
+        compile_transformations([{"name": "unknown"}])
+
+
+def test_selective_filters_are_planned_first(dataframe):
+    transformations = [
+        {"name": "inequality", "column": 'n', "type": '>=', "value": 60, "negation": False},
+        {"name": "equality", "column": 'b', "value": 2, "negation": False},
+        {"name": "inequality", "column": 'n', "type": '>=', "value": 594, "negation": False},
+        {"name": "random_selection", "row_count": 10, "seed": 0},
+        {"name": "inequality", "column": 'n', "type": '<', "value": 540, "negation": True},
+        {"name": "inequality", "column": 'n', "type": '>=', "value": 540, "negation": False}
+    ]
+    statistics = {column: column_statistics(dataframe[column]) for column in ['n', 'b']}
+    plan = plan_transformations(transformations, statistics)
+    # the filters do not move across the random selection, and the ties keep the user's order
+    assert [e["indices"] for e in plan] == [[2, 1, 0], [3], [4, 5]]
+    assert [e["selectivity"] for e in plan[0]["estimates"]] == pytest.approx([0.01, 0.2, 0.9], abs=0.05)
+    assert plan[1]["estimates"] == [{"selectivity": None, "cost": None}]
+
+    # the planned order keeps the rows of the user's order, including the ones of the random selection
+    guide = {"transformations": transformations}
+    states = list(transformation_states(initial_transformation_state(dataframe), transformations, statistics))
+    assert [e[0] for e in states] == [3, 4, 5, 6]
+    output = transformation_state_output(states[-1][1])
+    assert output.shape[0] == 10 and (output['n'] >= 594).all() and (output['b'] == 2).all()
+    pandas.testing.assert_frame_equal(comparable(output), comparable(baseline_transform(dataframe, guide)))
+
+
+def test_string_comparisons_are_planned_after_the_numeric_ones(dataframe):
+    transformations = [
+        {"name": "equality", "column": 's', "value": 'x', "negation": False},
+        {"name": "equality", "column": 'b', "value": 2, "negation": False}
+    ]
+    statistics = {
+        's': column_statistics(dataframe['s']),
+        'b': column_statistics(dataframe['b'].astype(float))
+    }
+    plan = plan_transformations(transformations, statistics)
+    assert plan[0]["indices"] == [1, 0]
+    assert plan[0]["estimates"][1]["cost"] > plan[0]["estimates"][0]["cost"]
+
+
+def test_explained_plan_is_the_plan_of_the_registered_dataframe(register, dataframe):
+    dataframe_entity = register('filters', dataframe)
+    guide = {"column_mapping": {'n': 'nn'}, "transformations": [
+        {"name": "inequality", "column": 'nn', "type": '<', "value": 540, "negation": False},
+        {"name": "inequality", "column": 'nn', "type": '>=', "value": 594, "negation": False}]}
+    plan = explain_transformations(dataframe_entity, guide)
+    assert [e["indices"] for e in plan] == [[1, 0]]
+    pandas.testing.assert_frame_equal(
+        comparable(read_transformed_dataframe(dataframe_entity, guide)),
+        comparable(baseline_transform(dataframe, guide)),
+        check_dtype=False)
+
+
+def test_transform_dataframe_chunks_matches_whole_dataframe(dataframe):
+    for guide in random_guides(100):
+        chunks = (dataframe.iloc[e:e + 64] for e in range(0, dataframe.shape[0], 64))
+        pandas.testing.assert_frame_equal(
+            comparable(pandas.concat(list(transform_dataframe_chunks(chunks, guide)))),
+            comparable(transform_dataframe(dataframe, guide)))
+
+
+def test_read_transformed_chunks_matches_in_memory(register, dataframe):
+    dataframe_entity = register('filters', dataframe)
+    assert len(dataframe_entity.zone_maps["row_counts"]) > 1
+    for guide in random_guides(100):
+        pandas.testing.assert_frame_equal(
+            comparable(pandas.concat(
+                [dataframe.iloc[:0]] + list(read_transformed_chunks(dataframe_entity, guide)))),
+            comparable(read_transformed_dataframe(dataframe_entity, guide)),
+            check_dtype=False)
+
+
+def test_cached_prefixes_count_their_dataframe(register, dataframe):
+    dataframe_entity = register('filters', dataframe)
+    guide = {"transformations": [
+        {"name": "inequality", "column": 'n', "type": '<', "value": 540, "negation": False},
+        {"name": "random_selection", "row_count": 100, "seed": 0},
+        {"name": "equality", "column": 'b', "value": 2, "negation": True}
+    ]}
+    read_transformed_dataframe(dataframe_entity, guide)
+    states = [value for key, (value, _) in transformation_cache.entries.items() if 'state' in key]
+    assert len(states) == 3
+    # the states are kept with their dataframes, whether or not these are cached elsewhere
+    assert transformation_cache.current_bytes >= sum(
+        size_in_bytes(e["dataframe"]) + (0 if e["mask"] is None else e["mask"].nbytes) for e in states)
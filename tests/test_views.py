@@ -0,0 +1,140 @@
+import os
+import json
+import numpy
+import pandas
+import flask_admin
+import pytest
+from types import SimpleNamespace
+
+from flask_wtf.csrf import generate_csrf
+
+from application import dataframe_cache, transformation_cache, chart_payload_cache
+from application.blueprints.visualizations import views
+from application.blueprints.ml_toolkit import views as ml_toolkit_views
+from application.blueprints.ml_toolkit.views import MachineLearningToolkit
+from application.libraries.jobs import JobQueue
+from application.blueprints.visualizations.views import WarehouseDiagnostics, VisualizationPalette, payload_source
+from application.libraries.payloads import chart_payload, PAYLOAD_DIRECTORY
+
+
+@pytest.fixture
+def client_of(app, monkeypatch):
+    """
+    Adds the views to an admin of the test application, as the superusers see them.
+    """
+    def client(*views):
+        admin = flask_admin.Admin(app)
+        for view in views:
+            monkeypatch.setattr(view, 'is_accessible', lambda: True)
+            admin.add_view(view)
+        return app.test_client()
+    return client
+
+
+def test_diagnostics_show_the_cache_statistics(client_of):
+    client = client_of(WarehouseDiagnostics(endpoint='diagnostics'))
+    dataframe_cache.get('missing')
+    statistics = client.get('/admin/diagnostics/').get_json()
+    assert statistics == {
+        "dataframe_cache": dataframe_cache.statistics(),
+        "transformation_cache": transformation_cache.statistics(),
+        "chart_payload_cache": chart_payload_cache.statistics()
+    }
+    assert statistics["dataframe_cache"]["misses"] > 0
+
+
+def test_diagnostics_are_only_shown_to_the_superusers(app, monkeypatch):
+    user = SimpleNamespace(is_active=True, is_authenticated=True, has_role=lambda role: role == 'user')
+    monkeypatch.setattr(views, 'current_user', user)
+    flask_admin.Admin(app).add_view(WarehouseDiagnostics(endpoint='diagnostics'))
+    assert app.test_client().get('/admin/diagnostics/').status_code == 403
+
+
+def test_explain_shows_the_plan_of_a_guide(client_of, register):
+    register('filters', pandas.DataFrame({'n': numpy.arange(600), 'b': numpy.arange(600) % 5}))
+    client = client_of(WarehouseDiagnostics(endpoint='diagnostics'))
+    guide = {"transformations": [
+        {"name": "inequality", "column": 'n', "type": '<', "value": 540, "negation": False},
+        {"name": "equality", "column": 'b', "value": 2, "negation": False}]}
+    response = client.get('/admin/diagnostics/explain', query_string={
+        "dataframe": 'filters', "guide": json.dumps(guide)})
+    assert response.status_code == 200
+    explained = response.get_json()
+    assert explained["dataframe"] == 'filters'
+    assert [e["indices"] for e in explained["plan"]] == [[1, 0]]
+
+    assert client.get('/admin/diagnostics/explain', query_string={"dataframe": 'missing'}).status_code == 404
+    assert client.get('/admin/diagnostics/explain', query_string={
+        "dataframe": 'filters', "guide": '{"transformations": [{"name": "unknown"}]}'}).status_code == 400
+
+
+def test_small_payloads_are_put_in_the_page(app, client_of, application_directory):
+    app.config['CHART_PAYLOAD_INLINE_MAX_BYTES'] = 100
+    client_of(VisualizationPalette(endpoint='palette'))
+    with app.test_request_context():
+        assert json.loads(str(payload_source(b'{"a": [1, 2]}', 'application/json'))) == {"a": [1, 2]}
+        assert chart_payload_cache.statistics()["entries"] == 0
+
+        # the pictures which may be reused are kept in this process only
+        source = json.loads(str(payload_source(b'picture', 'image/png', token='a' * 40)))
+        assert source.startswith('data:image/png;base64,')
+        assert chart_payload('a' * 40)[0] == b'picture'
+    assert not os.path.exists(os.path.join(application_directory, PAYLOAD_DIRECTORY))
+
+
+def test_large_payloads_are_fetched_by_the_page(app, client_of):
+    app.config['CHART_PAYLOAD_INLINE_MAX_BYTES'] = 100
+    client = client_of(VisualizationPalette(endpoint='palette'))
+    body = json.dumps({"a": list(range(100))}).encode('utf-8')
+    with app.test_request_context():
+        url = json.loads(str(payload_source(body, 'application/json', compress=True)))
+        assert json.loads(str(payload_source(b'picture' * 20, 'image/png', token='b' * 40, stored=True))) == \
+            '/admin/palette/payloads/' + 'b' * 40
+    assert url.startswith('/admin/palette/payloads/')
+
+    response = client.get(url)
+    assert response.status_code == 200 and response.data == body and response.mimetype == 'application/json'
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert client.get(url, headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_jobs_are_only_cancelled_with_the_token_of_the_page(app, client_of, monkeypatch):
+    app.config['SECRET_KEY'] = 'secret'
+    queue = JobQueue()
+    queue.init_app(app)
+    monkeypatch.setattr(ml_toolkit_views, 'ml_jobs', queue)
+    # the token of the page is kept in the session of its client
+    app.add_url_rule('/token', 'token', generate_csrf)
+    client = client_of(MachineLearningToolkit(endpoint='ml_kit'))
+    token = client.get('/token').get_data(as_text=True)
+
+    url = '/admin/ml_kit/jobs/{}/cancel'.format('0' * 32)
+    assert client.post(url).status_code == 400
+    assert client.post(url, headers={'X-CSRFToken': 'other'}).status_code == 400
+    # the job is unknown, but the request is allowed
+    assert client.post(url, headers={'X-CSRFToken': token}).status_code == 404
+
+
+@pytest.mark.parametrize('scheme', ['progress_through_time', 'walking_chart_during_date_range'])
+def test_unknown_subjects_are_shown_as_no_data(app, client_of, register, scheme):
+    app.config.update(WTF_CSRF_ENABLED=False, STREAMING_THRESHOLD_BYTES=2 ** 30)
+    app.template_folder = os.path.join(os.path.dirname(views.__file__), os.pardir, os.pardir, 'templates')
+    register('steps', pandas.DataFrame({
+        'subject': ['s1', 's2'] * 50,
+        'timestamp': pandas.date_range('2019-01-01', periods=100).strftime('%Y-%m-%d'),
+        'step_type': ['toe', 'flat', 'normal', 'flat'] * 25,
+        'number_of_steps': numpy.arange(100)
+    }))
+    client = client_of(VisualizationPalette(endpoint='palette'))
+    guide = {"subject": 's3', "start_date": '2019-01-01', "end_date": '2019-12-31', "resolution": 'month'}
+    kept = {"name": "inequality", "column": 'number_of_steps', "type": '>=', "value": 0, "negation": False}
+    # the rows of the subject are read from its rollup, then from its partition
+    for transformations in [[], [kept]]:
+        response = client.post('/admin/palette/', data={
+            "visualization": scheme,
+            "dataframe": 'steps',
+            "guide": json.dumps(dict(guide, transformations=transformations))
+        })
+        assert response.status_code == 200 and b'NO DATA' in response.data
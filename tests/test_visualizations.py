@@ -0,0 +1,60 @@
+import numpy
+import pandas
+import pytest
+
+from application.blueprints.visualizations.visualizations import ProgressThroughTimeVisualization, pivot_aggregate
+
+
+@pytest.mark.parametrize('resolution, start_date, end_date, start, end', [
+    ('month', '2019-11-15', '2020-02-03', '2019-11-01', '2020-02-29'),
+    ('month', '2019_01_15', '2019_02_03', '2019-01-01', '2019-02-28'),
+    ('month', '2019-03-15', '2019-04-30', '2019-03-01', '2019-04-30'),
+    ('month', '2019-03-15', '2019-12-01', '2019-03-01', '2019-12-31'),
+    ('year', '2019-03-15', '2020-02-03', '2019-01-01', '2020-12-31'),
+    ('day', '2019-03-15', '2020-02-03', '2019-03-15', '2020-02-03'),
+    ('week', '2019-03-15', '2020-02-03', '2019-03-09', '2020-02-09')
+])
+def test_date_windows_cover_the_whole_periods(resolution, start_date, end_date, start, end):
+    visualization = ProgressThroughTimeVisualization(
+        subject='s1', start_date=start_date, end_date=end_date, scheme='progress_through_time', resolution=resolution)
+    assert visualization.date_window() == {"column": 'timestamp', "start": start, "end": end}
+
+
+def baseline_pivot(keys: numpy.ndarray, categories: pandas.Series, values: pandas.Series, layout: list):
+    # the masks, fillna, sort and groupby that the shoe visualizations aggregated the steps with
+    output = pandas.DataFrame({'timestamp': keys, 'step_type': categories, 'number_of_steps': values})
+    for step_type in layout:
+        output[step_type] = output[output['step_type'] == step_type]['number_of_steps']
+        output[step_type] = output[step_type].fillna(0)
+    output = output.loc[:, ['timestamp'] + layout].sort_values(by='timestamp')
+    return output.groupby('timestamp').sum()
+
+
+@pytest.mark.parametrize('dtype', ['int64', 'uint8', 'float64', 'float with missing values'])
+def test_pivot_aggregate_matches_baseline(dtype):
+    generator = numpy.random.default_rng(0)
+    keys = generator.choice([20190301, 20190101, 20191231, 20180615], 1000)
+    # the `heel` steps are not in the layout, so their rows only contribute their timestamps
+    categories = pandas.Series(generator.choice(['toe', 'flat', 'normal', 'heel'], 1000))
+    values = pandas.Series(generator.integers(0, 200, 1000)).astype(dtype.split(' ')[0])
+    if dtype == 'float with missing values':
+        values[::7] = numpy.nan
+    layout = ['toe', 'flat', 'normal']
+
+    output = pivot_aggregate(keys, categories, values, layout)
+    assert output.index.tolist() == sorted(set(keys.tolist())) and output.columns.tolist() == layout
+    pandas.testing.assert_frame_equal(output, baseline_pivot(keys, categories, values, layout), check_dtype=False)
+    assert output.dtypes.tolist() == [numpy.dtype({'int64': 'int64', 'uint8': 'uint64'}.get(dtype, 'float64'))] * 3
+
+
+def test_pivot_aggregate_keeps_large_integers_exact():
+    values = pandas.Series([2 ** 53, 1, 1, 2 ** 53 + 1], dtype='int64')
+    output = pivot_aggregate(numpy.array([1, 1, 1, 0]), pandas.Series(['toe'] * 4), values, ['toe', 'flat'])
+    assert output.index.tolist() == [0, 1]
+    assert output['toe'].tolist() == [2 ** 53 + 1, 2 ** 53 + 2] and output['flat'].tolist() == [0, 0]
+
+
+def test_pivot_aggregate_of_no_rows():
+    output = pivot_aggregate(numpy.array([], dtype=numpy.int64), pandas.Series([], dtype=object),
+                             pandas.Series([], dtype='int64'), ['toe', 'flat'])
+    assert output.shape == (0, 2) and output.columns.tolist() == ['toe', 'flat']
@@ -0,0 +1,316 @@
+import os
+import numpy
+import pandas
+import pytest
+
+from application.libraries import warehouse
+from application.libraries.transformation import zone_map_row_groups, transform_dataframe
+from application.libraries.dtypes import infer_column_dtypes, compact_dataframe
+from application.libraries.warehouse import read_registered_dataframe, available_columns, readable_dataframe, \
+    is_columnar_copy_current, ensure_columnar_copy, build_columnar_copy, read_transformed_chunks, \
+    read_transformed_dataframe, iterate_registered_dataframe, date_window_rows
+
+
+@pytest.fixture
+def dataframe() -> pandas.DataFrame:
+    generator = numpy.random.default_rng(0)
+    dataframe = pandas.DataFrame({
+        'n': numpy.arange(600),
+        'a': generator.normal(size=600),
+        'subject': generator.choice(['s1', 's2', 's3'], 600),
+        'note': ['note {}'.format(e) for e in range(600)]
+    })
+    dataframe.loc[::7, 'a'] = numpy.nan
+    return dataframe
+
+
+def comparable(dataframe: pandas.DataFrame) -> pandas.DataFrame:
+    # the compact dtypes of the columnar copy hold the same values as the ones that pandas infers from the csv
+    return dataframe.astype({column: object for column in dataframe.columns if dataframe[column].dtype != float})
+
+
+def test_columnar_copy_matches_the_csv(register, application_directory, dataframe):
+    dataframe_entity = register('columns', dataframe)
+    assert os.path.isfile(os.path.join(application_directory, dataframe_entity.columnar_relative_path))
+    assert available_columns(dataframe_entity) == dataframe.columns.tolist()
+    baseline = pandas.read_csv(os.path.join(application_directory, dataframe_entity.relative_path))
+    pandas.testing.assert_frame_equal(
+        comparable(read_registered_dataframe(dataframe_entity)), comparable(baseline), check_dtype=False)
+
+
+def test_only_the_requested_columns_are_read(register, dataframe):
+    dataframe_entity = register('columns', dataframe)
+    # the columns are kept in the file's order, and the ones that do not exist are ignored
+    projected = read_registered_dataframe(dataframe_entity, columns=['subject', 'n', 'mapped'])
+    assert projected.columns.tolist() == ['n', 'subject']
+    numpy.testing.assert_array_equal(projected['n'].to_numpy(), dataframe['n'].to_numpy())
+
+
+def test_changed_csv_is_read_until_the_copy_is_refreshed(register, application_directory, dataframe):
+    dataframe_entity = register('columns', dataframe)
+    read_registered_dataframe(dataframe_entity)
+    changed = dataframe.iloc[::2].assign(note='changed')
+    changed.to_csv(os.path.join(application_directory, dataframe_entity.relative_path), index=False)
+
+    # the stale copy (and its cached columns) is not used, nor refreshed while reading
+    assert not is_columnar_copy_current(dataframe_entity)
+    assert readable_dataframe(dataframe_entity).columnar_relative_path is None
+    assert read_registered_dataframe(dataframe_entity, columns=['note'])['note'].tolist() == ['changed'] * 300
+    assert not is_columnar_copy_current(dataframe_entity)
+
+    ensure_columnar_copy(dataframe_entity)
+    assert is_columnar_copy_current(dataframe_entity)
+    assert readable_dataframe(dataframe_entity) is dataframe_entity
+    assert read_registered_dataframe(dataframe_entity, columns=['n'])['n'].tolist() == list(range(0, 600, 2))
+
+
+def test_zone_maps_describe_the_row_groups(register, dataframe):
+    zone_maps = register('zones', dataframe).zone_maps
+    assert zone_maps["row_counts"] == [128, 128, 128, 128, 88]
+    for index, start in enumerate(range(0, 600, 128)):
+        chunk = dataframe.iloc[start:start + 128]
+        assert zone_maps["columns"]["n"]["min"][index] == chunk['n'].min()
+        assert zone_maps["columns"]["n"]["max"][index] == chunk['n'].max()
+        assert zone_maps["columns"]["a"]["null_count"][index] == chunk['a'].isna().sum()
+
+
+@pytest.mark.parametrize('single_transformation', [
+    {"name": "inequality", "column": 'n', "type": '<', "value": 100, "negation": False},
+    {"name": "inequality", "column": 'n', "type": '>=', "value": 300, "negation": True},
+    {"name": "limit_range", "column": 'n', "lower_bound": [250, 'open'], "upper_bound": [260, 'closed'],
+     "negation": False},
+    {"name": "limit_range", "column": 'a', "lower_bound": [-0.5, 'closed'], "upper_bound": [0.5, 'open'],
+     "negation": True},
+    {"name": "equality", "column": 'subject', "value": 's2', "negation": False},
+    {"name": "equality", "column": 'n', "value": 1000, "negation": False}
+])
+def test_zone_maps_admit_the_row_groups_of_the_kept_rows(register, dataframe, single_transformation):
+    dataframe_entity = register('zones', dataframe)
+    admitted = zone_map_row_groups(dataframe_entity.zone_maps, [single_transformation])
+    kept_row_groups = set(transform_dataframe(dataframe, {"transformations": [single_transformation]}).index // 128)
+    assert kept_row_groups <= set(numpy.flatnonzero(admitted).tolist())
+    if single_transformation["column"] == 'n':
+        # the rows are sorted by `n`, so the row groups without kept rows are skipped
+        assert kept_row_groups == set(numpy.flatnonzero(admitted).tolist())
+
+
+def test_skipped_row_groups_are_not_read(register, dataframe, monkeypatch):
+    dataframe_entity = register('zones', dataframe)
+    read_row_groups = []
+    iterate_registered_dataframe = warehouse.iterate_registered_dataframe
+
+    def recorded_iteration(*arguments, **keywords):
+        read_row_groups.append(keywords.get("row_groups"))
+        return iterate_registered_dataframe(*arguments, **keywords)
+
+    monkeypatch.setattr(warehouse, 'iterate_registered_dataframe', recorded_iteration)
+    guide = {"transformations": [{"name": "inequality", "column": 'n', "type": '>=', "value": 520, "negation": False}]}
+    output = pandas.concat(list(read_transformed_chunks(dataframe_entity, guide)))
+    assert read_row_groups == [[4]]
+    assert output['n'].tolist() == list(range(520, 600))
+
+
+def test_zone_maps_of_the_appended_rows_match_a_rebuild(register, application_directory, dataframe):
+    dataframe_entity = register('zones', dataframe.iloc[:300])
+    dataframe.iloc[300:].to_csv(
+        os.path.join(application_directory, dataframe_entity.relative_path), mode='a', header=False, index=False)
+    ensure_columnar_copy(dataframe_entity)
+    appended = dataframe_entity.zone_maps
+    build_columnar_copy(dataframe_entity)
+    assert appended["row_counts"] == [128, 128, 128, 128, 88]
+    assert appended == dataframe_entity.zone_maps
+
+
+@pytest.fixture
+def typed_dataframe() -> pandas.DataFrame:
+    generator = numpy.random.default_rng(0)
+    return pandas.DataFrame({
+        'small': generator.integers(-100, 100, 600),
+        'medium': generator.integers(0, 40000, 600),
+        'large': generator.integers(0, 2 ** 40, 600),
+        'halves': generator.integers(0, 100, 600) / 2,
+        'fractions': generator.normal(size=600),
+        'day': pandas.Series(pandas.Timestamp('2019-01-01') + pandas.to_timedelta(
+            generator.integers(0, 700, 600), unit='D')).dt.strftime('%Y-%m-%d'),
+        'loose_day': ['2019-1-{}'.format(e % 28 + 1) for e in range(600)],
+        'label': generator.choice(['x', 'y', 'z'], 600),
+        'name': ['name {}'.format(e) for e in range(600)],
+        'flag': generator.choice([True, False], 600)
+    })
+
+
+def test_compact_dtypes_are_inferred(application_directory, typed_dataframe):
+    csv_path = os.path.join(application_directory, 'typed.csv')
+    typed_dataframe.to_csv(csv_path, index=False)
+    column_dtypes = infer_column_dtypes(csv_path, chunk_size=128)
+    assert column_dtypes == {
+        'small': {"dtype": 'int8'},
+        'medium': {"dtype": 'int32'},
+        'halves': {"dtype": 'float32'},
+        'day': {"dtype": 'datetime64[ns]', "format": '%Y-%m-%d'},
+        'label': {"dtype": 'category', "categories": ['x', 'y', 'z']},
+        # the dates which are not written exactly in one of the formats are not parsed
+        'loose_day': {"dtype": 'category', "categories": sorted(typed_dataframe['loose_day'].unique().tolist())}
+    }
+
+
+def test_compact_dtypes_keep_the_values(register, typed_dataframe):
+    dataframe_entity = register('typed', typed_dataframe)
+    compacted = read_registered_dataframe(dataframe_entity)
+    assert compacted['small'].dtype == numpy.int8 and compacted['halves'].dtype == numpy.float32
+    assert isinstance(compacted['label'].dtype, pandas.CategoricalDtype)
+    assert compacted['day'].dtype == numpy.dtype('datetime64[ns]')
+    assert compacted.memory_usage(deep=True).sum() < typed_dataframe.memory_usage(deep=True).sum()
+
+    numpy.testing.assert_array_equal(compacted['small'].to_numpy(), typed_dataframe['small'].to_numpy())
+    numpy.testing.assert_array_equal(compacted['halves'].astype(float), typed_dataframe['halves'])
+    numpy.testing.assert_array_equal(compacted['large'].to_numpy(), typed_dataframe['large'].to_numpy())
+    assert compacted['label'].astype(str).tolist() == typed_dataframe['label'].tolist()
+    assert compacted['day'].dt.strftime('%Y-%m-%d').tolist() == typed_dataframe['day'].tolist()
+    assert compacted['loose_day'].astype(str).tolist() == typed_dataframe['loose_day'].tolist()
+
+
+def test_compacted_columns_are_not_copied(typed_dataframe):
+    column_dtypes = {'small': {"dtype": 'int8'}}
+    compacted = compact_dataframe(typed_dataframe, column_dtypes)
+    assert compacted['small'].dtype == numpy.int8
+    assert compact_dataframe(compacted, column_dtypes) is compacted
+    assert compact_dataframe(typed_dataframe, None) is typed_dataframe
+
+
+@pytest.mark.parametrize('transformation', [
+    {"name": "inequality", "column": 'single', "type": '>=', "value": 2.00000001, "negation": False},
+    {"name": "inequality", "column": 'single', "type": '<', "value": 0.50000001, "negation": False},
+    {"name": "equality", "column": 'single', "value": 2.00000001, "negation": True},
+    {"name": "limit_range", "column": 'single', "lower_bound": [2.00000001, 'closed'], "upper_bound": [3, 'closed'],
+     "negation": False}
+])
+def test_float32_columns_keep_the_rows_of_the_filters(register, transformation):
+    # the values are exact in float32, the values of the filters are not
+    dataframe = pandas.DataFrame({'n': numpy.arange(200), 'single': [0.25, 0.5, 2.0, 3.0] * 50})
+    dataframe_entity = register('single', dataframe)
+    assert read_registered_dataframe(dataframe_entity)['single'].dtype == numpy.float32
+
+    guide = {"transformations": [transformation]}
+    expected = transform_dataframe(dataframe, guide)
+    assert read_transformed_dataframe(dataframe_entity, guide)['n'].tolist() == expected['n'].tolist()
+
+
+def test_partitions_hold_the_rows_of_each_subject(register, dataframe):
+    dataframe_entity = register('subjects', dataframe)
+    assert sorted(dataframe_entity.partitions["index"].keys()) == ['s1', 's2', 's3']
+    whole = read_registered_dataframe(dataframe_entity)
+    for subject in ['s1', 's2', 's3']:
+        expected = whole[whole['subject'] == subject]
+        partition = read_registered_dataframe(dataframe_entity, columns=['n', 'a'], partition=subject)
+        assert partition.columns.tolist() == ['n', 'a']
+        numpy.testing.assert_array_equal(partition['n'].to_numpy(), expected['n'].to_numpy())
+        numpy.testing.assert_array_equal(partition['a'].to_numpy(), expected['a'].to_numpy())
+        streamed = pandas.concat(list(iterate_registered_dataframe(
+            dataframe_entity, columns=['n'], batch_size=50, partition=subject)))
+        numpy.testing.assert_array_equal(streamed['n'].to_numpy(), expected['n'].to_numpy())
+
+    # the subjects without rows have an empty partition
+    assert read_registered_dataframe(dataframe_entity, columns=['n'], partition='s4').shape == (0, 1)
+
+
+def test_transformed_partitions_match_the_filtered_rows(register, dataframe):
+    dataframe_entity = register('subjects', dataframe)
+    guide = {"transformations": [{"name": "inequality", "column": 'a', "type": '>', "value": 0, "negation": False}]}
+    partition = read_transformed_dataframe(dataframe_entity, guide, partition='s2')
+    expected = transform_dataframe(dataframe[dataframe['subject'] == 's2'], guide)
+    assert partition['n'].tolist() == expected['n'].tolist()
+
+
+def test_dataframes_without_subjects_are_not_partitioned(register, dataframe):
+    dataframe_entity = register('no_subjects', dataframe.drop(columns=['subject']))
+    assert dataframe_entity.partitions is None
+    assert read_registered_dataframe(dataframe_entity, columns=['n'], partition='s1').shape == (600, 1)
+
+
+def test_partitions_of_the_appended_rows_match_a_rebuild(register, application_directory, dataframe):
+    dataframe_entity = register('subjects', dataframe.iloc[:300])
+    appended = dataframe.iloc[300:].copy()
+    appended.loc[appended.index[:10], 'subject'] = 's4'
+    appended.to_csv(
+        os.path.join(application_directory, dataframe_entity.relative_path), mode='a', header=False, index=False)
+    whole = pandas.concat([dataframe.iloc[:300], appended])
+    ensure_columnar_copy(dataframe_entity)
+    assert sorted(dataframe_entity.partitions["index"].keys()) == ['s1', 's2', 's3', 's4']
+    for subject in ['s1', 's2', 's3', 's4']:
+        partition = read_registered_dataframe(dataframe_entity, columns=['n'], partition=subject)
+        assert partition['n'].tolist() == whole.loc[whole['subject'] == subject, 'n'].tolist()
+
+
+@pytest.mark.parametrize('appended', [True, False])
+def test_replaced_partitions_are_removed_after_the_commit(
+        register, application_directory, dataframe, monkeypatch, appended):
+    dataframe_entity = register('subjects', dataframe.iloc[:300])
+    directory = os.path.join(application_directory, 'warehouse', 'partitions', str(dataframe_entity.id))
+    previous = [os.path.join(application_directory, e) for e in dataframe_entity.partitions["index"].values()]
+    # the rows are either appended or the file is written again, in which case the partitions are built again
+    rows = dataframe.iloc[300:] if appended else dataframe.iloc[::-1]
+    rows.to_csv(os.path.join(application_directory, dataframe_entity.relative_path),
+                mode='a' if appended else 'w', header=not appended, index=False)
+
+    commit = warehouse.db.session.commit
+    committed = []
+
+    def recorded_commit():
+        committed.append(all(os.path.isfile(e) for e in previous))
+        commit()
+    monkeypatch.setattr(warehouse.db.session, 'commit', recorded_commit)
+    ensure_columnar_copy(dataframe_entity)
+    # the files of the previous version are kept until the new one is committed
+    assert committed == [True]
+    assert not any(os.path.isfile(e) for e in previous)
+    assert sorted(os.listdir(directory)) == sorted(
+        os.path.basename(e) for e in dataframe_entity.partitions["index"].values())
+    for subject in ['s1', 's2', 's3']:
+        expected = rows if not appended else dataframe
+        partition = read_registered_dataframe(dataframe_entity, columns=['n'], partition=subject)
+        assert partition['n'].tolist() == expected.loc[expected['subject'] == subject, 'n'].tolist()
+
+
+@pytest.fixture
+def dated_dataframe() -> pandas.DataFrame:
+    generator = numpy.random.default_rng(0)
+    dates = pandas.Series(
+        pandas.Timestamp('2019-01-01') + pandas.to_timedelta(generator.integers(0, 700, 600), unit='D'))
+    return pandas.DataFrame({
+        'n': numpy.arange(600),
+        'subject': generator.choice(['s1', 's2'], 600),
+        'timestamp': dates.dt.strftime('%Y-%m-%d %H:%M:%S').where(numpy.arange(600) % 50 != 0, None)
+    })
+
+
+@pytest.mark.parametrize('partition', [None, 's2'])
+def test_date_window_rows_match_the_dates_in_the_window(register, dated_dataframe, partition):
+    dataframe_entity = register('dated', dated_dataframe)
+    if partition is not None:
+        dated_dataframe = dated_dataframe[dated_dataframe['subject'] == partition].reset_index(drop=True)
+    days = dated_dataframe['timestamp'].str.slice(0, 10)
+    generator = numpy.random.default_rng(1)
+    for _ in range(50):
+        start = pandas.Timestamp('2018-12-01') + pandas.Timedelta(days=int(generator.integers(0, 760)))
+        end = start + pandas.Timedelta(days=int(generator.integers(0, 120)))
+        window = {"column": 'timestamp', "start": start.strftime('%Y-%m-%d'), "end": end.strftime('%Y-%m-%d')}
+        rows = date_window_rows(dataframe_entity, window, 'timestamp', partition=partition)
+        expected = numpy.flatnonzero(((days >= window["start"]) & (days <= window["end"])).to_numpy())
+        numpy.testing.assert_array_equal(rows, expected)
+
+
+def test_windowed_reads_match_the_filtered_rows(register, dated_dataframe):
+    dataframe_entity = register('dated', dated_dataframe)
+    window = {"column": 'timestamp', "start": '2019-03-01', "end": '2019-03-31'}
+    days = dated_dataframe['timestamp'].str.slice(0, 10)
+    expected = dated_dataframe[(days >= window["start"]) & (days <= window["end"])]
+    windowed = read_transformed_dataframe(dataframe_entity, dict(), window=window)
+    assert windowed['n'].tolist() == expected['n'].tolist()
+
+
+def test_columns_that_are_not_dates_have_no_window(register, dated_dataframe):
+    dataframe_entity = register('dated', dated_dataframe)
+    window = {"column": 'subject', "start": '2019-03-01', "end": '2019-03-31'}
+    assert date_window_rows(dataframe_entity, window, 'subject') is None
+    assert date_window_rows(dataframe_entity, window, 'missing') is None
@@ -4,6 +4,7 @@ __credits__ = 'ER Lab - CS@UCLA'
 
 # libraries
 import os
+from typing import Any, Dict
 from flask import Flask, url_for
 from configurations import Configurations
 from flask_sqlalchemy import SQLAlchemy
@@ -11,11 +12,40 @@ from flask_migrate import Migrate
 import flask_admin
 from flask_security import Security, SQLAlchemyUserDatastore, login_required
 from flask_admin import helpers as admin_helpers
+from application.libraries.caching import LRUCache
+from application.libraries.text import TextAggregation
+from application.libraries.jobs import JobQueue
 
 db = SQLAlchemy()
 migrate = Migrate()
 admin = flask_admin.Admin()
 security = Security()
+dataframe_cache = LRUCache(config_key='DATAFRAME_CACHE_MAX_BYTES')
+transformation_cache = LRUCache(config_key='TRANSFORMATION_CACHE_MAX_BYTES')
+chart_payload_cache = LRUCache(config_key='CHART_PAYLOAD_CACHE_MAX_BYTES')
+text_aggregation = TextAggregation(config_key='TEXT_AGGREGATION_PROCESSES')
+
+
+def initialize_job_worker(configuration: Dict[str, Any]) -> None:
+    """
+    The :func:`initialize_job_worker` applies the budgets of the caches in each worker process of the `ml_jobs`,
+    which imports this package without creating the application (please refer to :func:`create_app`).
+
+    Parameters
+    ----------
+    configuration: `Dict[str, Any]`, required
+        The budgets from the application configuration
+    """
+    for cache in [dataframe_cache, transformation_cache]:
+        cache.max_bytes = configuration.get(cache.config_key, cache.max_bytes)
+
+
+ml_jobs = JobQueue(
+    processes_key='ML_JOB_PROCESSES',
+    max_queued_key='ML_JOB_MAX_QUEUED',
+    initializer=initialize_job_worker,
+    initializer_keys=['DATAFRAME_CACHE_MAX_BYTES', 'TRANSFORMATION_CACHE_MAX_BYTES']
+)
 
 application_directory = os.path.abspath(os.path.dirname(__file__))
 
@@ -39,6 +69,11 @@ def create_app(configuration_class: object = Configurations):
     app.config.from_object(configuration_class)
     db.init_app(app=app)
     migrate.init_app(app=app, db=db)
+    dataframe_cache.init_app(app=app)
+    transformation_cache.init_app(app=app)
+    chart_payload_cache.init_app(app=app)
+    text_aggregation.init_app(app=app)
+    ml_jobs.init_app(app=app)
     # Create admin
     admin.__init__(
         app,
@@ -71,6 +106,10 @@ def create_app(configuration_class: object = Configurations):
     from application.blueprints.questionnaires import bp as questionnaires_bp
     app.register_blueprint(questionnaires_bp)
 
+    from application.commands import dataframes_cli, payloads_cli
+    app.cli.add_command(dataframes_cli)
+    app.cli.add_command(payloads_cli)
+
     return app, user_datastore
 
 
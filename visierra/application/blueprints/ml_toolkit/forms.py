@@ -4,8 +4,8 @@ __credits__ = 'ER Lab - CS@UCLA'
 
 
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, TextAreaField, IntegerField
-from wtforms.validators import DataRequired, ValidationError
+from wtforms import StringField, SubmitField, TextAreaField, IntegerField, FloatField, SelectField
+from wtforms.validators import DataRequired, ValidationError, NumberRange, InputRequired, Optional
 import json
 
 
@@ -21,6 +21,16 @@ class MLKitForm(FlaskForm):
     label_column = StringField('Label Column', validators=[DataRequired()])
     hidden_layer_config = StringField('Hidden Layer Configurations', validators=[DataRequired()])
     pca = IntegerField('PCA Dimension', validators=[DataRequired()], default=0)
+    train_fraction = FloatField(
+        'Train Fraction', validators=[InputRequired(), NumberRange(min=0.01, max=0.99)], default=0.8)
+    balancing = SelectField(
+        'Balancing',
+        choices=[('none', 'None'), ('under', 'Under-sample'), ('over', 'Over-sample')],
+        default='none'
+    )
+    seed = IntegerField('Seed', validators=[InputRequired()], default=2019)
+    # the id of a finished experiment, the layouts of the categorical columns of which are reused
+    layouts_job = StringField('Reuse The Category Layouts Of Experiment', validators=[Optional()])
     guide = TextAreaField(
         'Guide',
         validators=[],
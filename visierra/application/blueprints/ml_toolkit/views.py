@@ -2,17 +2,19 @@ __author__ = 'Shayan Fazeli'
 __email__ = 'shayan@cs.ucla.edu'
 __credits__ = 'ER Lab - CS@UCLA'
 
-from flask import url_for
+from flask import url_for, abort, jsonify, request, current_app, Response
+from flask_wtf.csrf import generate_csrf, validate_csrf
+from wtforms.validators import ValidationError
 from flask_admin import BaseView, expose
-import pandas
-import os
-from application import application_directory
+from application import ml_jobs
 from application.blueprints.ml_toolkit.forms import MLKitForm
 from flask import render_template
 import json
 from application.entities import Dataframe
-from application.libraries.transformation import transform_dataframe
-from application.libraries.ml_toolkit.utilities import prepare_the_dataframe_for_ml, ffnn_experiment
+from application.libraries.transformation import guide_columns, compile_transformations
+from application.libraries.warehouse import available_columns, readable_dataframe, detached_dataframe
+from application.libraries.jobs import JobQueueFull
+from application.libraries.ml_toolkit.utilities import ffnn_experiment_job
 
 
 class MachineLearningToolkit(BaseView):
@@ -29,38 +31,65 @@ class MachineLearningToolkit(BaseView):
             hidden_layer_config = tuple(hidden_layer_config)
             label_column = form.label_column.data
             pca_dimension = form.pca.data
+            train_fraction = form.train_fraction.data
+            balancing = form.balancing.data
+            seed = form.seed.data
             guide_json = json.loads(str(form.guide.data))
             dataframe = Dataframe.query.filter_by(name=form.dataframe.data).first()
-            data = pandas.read_csv(os.path.join(application_directory, dataframe.relative_path))
 
+            # the layouts that the columns were encoded with in a previous experiment
+            category_layouts = None
+            if form.layouts_job.data:
+                category_layouts = ml_jobs.output(form.layouts_job.data.strip(), name='layouts.json')
+                if category_layouts is None:
+                    form.layouts_job.errors.append("The experiment is not known or not done.")
+                    return self.render(
+                        'admin/ml_kit.html',
+                        scheme=scheme,
+                        form=form,
+                        image_url=url_for('static', filename='ml_toolkit/default.png')
+                    )
+                category_layouts = json.loads(category_layouts)
+
+            # the guide is only checked here, the dataframe is read and transformed by the job itself
             try:
-                data = transform_dataframe(dataframe=data, guide=guide_json)
-            except Exception as e:
+                compile_transformations(guide_json.get("transformations", []))
+                if not set(guide_columns(guide_json)).issubset(available_columns(dataframe)):
+                    raise ValueError("the guide refers to columns that the dataframe does not have")
+            except Exception:
                 return render_template("errors/failed_transformation.html")
 
-            # saving cache if needed
-            # data.to_csv(os.path.join(application_directory, 'warehouse/cache/mltoolkit_cache.csv'))
-            X_train, y_train, X_test, y_test, original_label_layout = prepare_the_dataframe_for_ml(
-                input_dataframe=data,
-                label_column=label_column,
-                feature_columns=feature_columns
-            )
-
-            ffnn_experiment(
-                X_train=X_train,
-                X_test=X_test,
-                y_train=y_train,
-                y_test=y_test,
-                list_of_labels=original_label_layout,
-                perform_pca=(pca_dimension>0),
-                pca_dim=pca_dimension,
-                hidden_layer_config=hidden_layer_config)
+            # the experiment runs in the pool of the job queue, and the page polls its status
+            try:
+                job_id = ml_jobs.submit(
+                    ffnn_experiment_job,
+                    dataframe=detached_dataframe(readable_dataframe(dataframe)),
+                    guide=guide_json,
+                    label_column=label_column,
+                    feature_columns=feature_columns,
+                    hidden_layer_config=hidden_layer_config,
+                    pca_dim=pca_dimension,
+                    train_fraction=train_fraction,
+                    balancing=balancing,
+                    seed=seed,
+                    category_layouts=category_layouts
+                )
+            except JobQueueFull as e:
+                return self.render(
+                    'admin/ml_kit.html',
+                    scheme=scheme,
+                    form=form,
+                    image_url=url_for('static', filename='ml_toolkit/default.png'),
+                    job_error=str(e)
+                )
 
             return self.render(
                 'admin/ml_kit.html',
-                image_url=url_for('static', filename='ml_toolkit/ffnn_experiment.png'),
+                image_url=url_for('static', filename='ml_toolkit/default.png'),
                 scheme=scheme,
-                form=form
+                form=form,
+                job_id=job_id,
+                csrf_token=generate_csrf()
             )
         return self.render(
             'admin/ml_kit.html',
@@ -68,3 +97,44 @@ class MachineLearningToolkit(BaseView):
             form=form,
             image_url=url_for('static', filename='ml_toolkit/default.png')
         )
+
+    @expose('/jobs/<job_id>')
+    def job(self, job_id):
+        # the status of an experiment, which the page polls until it is finished
+        status = ml_jobs.status(job_id)
+        if status is None:
+            abort(404)
+        status["job_id"] = job_id
+        status["output_url"] = url_for('.job_output', job_id=job_id) if status["status"] == 'done' else None
+        status["layouts_url"] = url_for('.job_layouts', job_id=job_id) if status["status"] == 'done' else None
+        return jsonify(status)
+
+    @expose('/jobs/<job_id>/output')
+    def job_output(self, job_id):
+        output = ml_jobs.output(job_id)
+        if output is None:
+            abort(404)
+        response = Response(output, mimetype='image/png')
+        response.cache_control.private = True
+        response.cache_control.max_age = 3600
+        return response
+
+    @expose('/jobs/<job_id>/layouts')
+    def job_layouts(self, job_id):
+        # the layouts that the columns of the experiment were encoded with, please refer to `ffnn_experiment_job`
+        layouts = ml_jobs.output(job_id, name='layouts.json')
+        if layouts is None:
+            abort(404)
+        return Response(layouts, mimetype='application/json')
+
+    @expose('/jobs/<job_id>/cancel', methods=['POST'])
+    def cancel_job(self, job_id):
+        # the page sends the token of its form along with the request, please refer to `ml_kit.html`
+        if current_app.config.get('WTF_CSRF_ENABLED', True):
+            try:
+                validate_csrf(request.headers.get('X-CSRFToken'))
+            except ValidationError:
+                abort(400)
+        if not ml_jobs.cancel(job_id):
+            abort(404)
+        return jsonify(ml_jobs.status(job_id))
@@ -6,13 +6,63 @@ __credits__ = 'ER Lab - CS@UCLA'
 from flask_admin import BaseView, expose
 import pandas
 import os
-from application import application_directory
+import gzip
+from application import application_directory, dataframe_cache, transformation_cache, chart_payload_cache
 from application.blueprints.visualizations.forms import VisualizationForm
-from flask import render_template
+from flask import render_template, current_app, request, abort, Response, url_for, redirect, jsonify
+from flask_security import current_user
+from markupsafe import Markup
 import json
+from typing import Optional
 from application.entities import Dataframe
-from application.libraries.transformation import transform_dataframe
-from application.blueprints.visualizations.visualizations import WalkingPieChartDuringDateRange, ProgressThroughTimeCircularVisualization, ProgressThroughTimeVisualization, WordCloudsVisualization
+from application.libraries.transformation import guide_columns, guide_fingerprint, is_deterministic
+from application.libraries.downsampling import downsample_series, validate_max_points
+from application.libraries.payloads import PAYLOAD_FORMATS, serialize_payload, inline_payload, store_payload, \
+    payload_token, chart_payload
+from application.libraries.warehouse import read_transformed_dataframe, read_transformed_chunks, is_streamed, \
+    read_step_rollup, read_token_frequencies, readable_dataframe, explain_transformations
+from application.blueprints.visualizations.visualizations import WalkingPieChartDuringDateRange, \
+    ProgressThroughTimeCircularVisualization, ProgressThroughTimeVisualization, WordCloudsVisualization
+
+
+def payload_source(
+        body: bytes,
+        mimetype: str,
+        compress: bool = False,
+        token: Optional[str] = None,
+        stored: bool = False
+) -> Markup:
+    """
+    The :func:`payload_source` returns the JavaScript expression that a rendered page reads a payload from. The
+    payloads up to `CHART_PAYLOAD_INLINE_MAX_BYTES` are put in the page itself (please refer to
+    :func:`inline_payload`), so nothing is written for them, and they are only kept in this process if they have
+    a `token` to be reused by. The larger ones are stored (please refer to :func:`store_payload`, unless they are
+    `stored` already) and the page fetches them from their URL.
+
+    Parameters
+    ----------
+    body: `bytes`, required
+        The payload
+    mimetype: `str`, required
+        The mime type of the payload
+    compress: `bool`, optional (default=False)
+        Whether or not to keep the stored payload compressed with gzip
+    token: `str`, optional (default=None)
+        The token of the payload (please refer to :func:`payload_token`), if `None`, a new one is used.
+    stored: `bool`, optional (default=False)
+        Whether or not the payload was stored already under the `token` (e.g. a picture that was rendered before)
+
+    Returns
+    ----------
+    The expression as `Markup`.
+    """
+    if len(body) <= current_app.config['CHART_PAYLOAD_INLINE_MAX_BYTES']:
+        if token is not None and not stored:
+            store_payload(body, mimetype, token=token, shared=False)
+        return inline_payload(body, mimetype)
+    if not stored:
+        token = store_payload(body, mimetype, compress=compress, token=token)
+    return Markup(json.dumps(url_for('palette.payload', token=token)))
 
 
 class TableBoard(BaseView):
@@ -55,6 +105,19 @@ class VisualizationPalette(BaseView):
             except:
                 return render_template("errors/bad_json.html")
 
+            # the point budget of the progress through time is checked before anything is read
+            if scheme == "progress_through_time":
+                try:
+                    validate_max_points(guide_json.get('max_points'), number_of_series=3)
+                except ValueError as e:
+                    form.guide.errors.append(str(e))
+                    return self.render(
+                        'admin/visualization_palette.html',
+                        form=form,
+                        scheme=scheme,
+                        visualization_information=visualization_information
+                    )
+
             # preparing the visualization agent
             # according to the selected scheme
             if scheme == "progress_through_time":
@@ -94,33 +157,80 @@ class VisualizationPalette(BaseView):
 
             # reading the registered dataframe and performing the requested transformation before
             # proceeding to visualize it...
-            dataframe = Dataframe.query.filter_by(name=form.dataframe.data).first()
-            data = pandas.read_csv(os.path.join(application_directory, dataframe.relative_path))
-            try:
-                data = transform_dataframe(dataframe=data, guide=guide_json)
-            except Exception as e:
-                return render_template("errors/failed_transformation.html")
+            # only the columns that the visualization and the guide need are read from the columnar copy,
+            # and the output of the same guide on the same dataframe is reused.
+            # the csv file is read as it is if the columnar copy has not been refreshed since it was changed
+            dataframe = readable_dataframe(Dataframe.query.filter_by(name=form.dataframe.data).first())
+
+            # the word clouds that were rendered for the same version of the dataframe, guide and parameters are
+            # served again without reading the dataframe
+            image_token = None
+            if scheme == "word_clouds" and is_deterministic(guide_json):
+                image_token = payload_token(
+                    dataframe.id, dataframe.source_version, guide_fingerprint(guide_json), agent.picture_parameters())
+                picture = chart_payload(image_token)
+                if picture is not None:
+                    rendering_arguments_dict['form'] = form
+                    rendering_arguments_dict['image_source'] = payload_source(
+                        picture[0], 'image/png', token=image_token, stored=True)
+                    return self.render(**rendering_arguments_dict)
+
+            columns = agent.required_columns()
+            if columns is not None:
+                columns = columns + guide_columns(guide_json)
+            # only the rows of the subject of the visualization are read if the dataframe is partitioned by subject
+            partition = agent.partition_key()
+            # the step visualizations are answered from the rollup of the dataframe if the guide keeps its rows
+            rollup = read_step_rollup(dataframe, guide=guide_json, partition=partition)
+            data = None if rollup is None else agent.rollup_morphing(rollup)
+            if data is None and is_streamed(
+                    dataframe, threshold=current_app.config['STREAMING_THRESHOLD_BYTES'], partition=partition):
+                # the dataframe is too large to be loaded in memory, so its chunks are transformed, checked
+                # and morphed as they are read
+                def checked_chunks(chunks):
+                    for chunk in chunks:
+                        agent.check_dataframe_sanity(dataframe=chunk)
+                        yield chunk
 
-            # visualization specific sanity checking
-            agent.check_dataframe_sanity(dataframe=data)
+                try:
+                    data = agent.chunked_morphing(
+                        checked_chunks(read_transformed_chunks(
+                            dataframe, guide=guide_json, columns=columns, window=agent.date_window(),
+                            partition=partition)))
+                except Exception as e:
+                    return render_template("errors/failed_transformation.html")
+            elif data is None:
+                try:
+                    data = read_transformed_dataframe(
+                        dataframe, guide=guide_json, columns=columns, partition=partition, window=agent.date_window())
+                except Exception as e:
+                    return render_template("errors/failed_transformation.html")
 
-            # visualization specific morphing to render data consistent with our template
-            data = agent.visualization_specific_morphing(dataframe=data)
+                # visualization specific sanity checking
+                agent.check_dataframe_sanity(dataframe=data)
 
-            # saving to the cache csv
-            data.to_csv(os.path.join(application_directory, 'static/warehouse/palette_cache.csv'), index=False)
+                # visualization specific morphing to render data consistent with our template
+                data = agent.visualization_specific_morphing(dataframe=data)
+
+            # e.g. the subject of the guide has no rows in the dataframe, or none in the date range
+            if data.shape[0] == 0:
+                return render_template("errors/no_data.html")
 
             # preparing the visualization agent
             # according to the selected scheme
             rendering_arguments_dict['form'] = form
-            rendering_arguments_dict['chart_data'] = data
 
             # any special argument for visualization, comes here
             if scheme == "progress_through_time":
                 y_range_l = int(data.loc[:, ['toe', 'flat', 'normal']].to_numpy().ravel().min())
                 y_range_u = int(data.loc[:, ['toe', 'flat', 'normal']].to_numpy().ravel().max())
                 rendering_arguments_dict['y_range'] = [y_range_l, y_range_u]
-                rendering_arguments_dict['x_range'] = [int(data.loc[:, 'timestamp'].min()), int(data.loc[:, 'timestamp'].max())]
+                rendering_arguments_dict['x_range'] = [
+                    int(data.loc[:, 'timestamp'].min()), int(data.loc[:, 'timestamp'].max())]
+
+                # the ranges are computed on all of the points, and the series are then reduced to the point
+                # budget of the guide (if any), which keeps their extremes
+                data = downsample_series(data, ['toe', 'flat', 'normal'], max_points=guide_json.get('max_points'))
             elif scheme == "walking_chart_during_date_range":
                 # getting the step layout
                 step_layout = agent.step_layout
@@ -137,12 +247,28 @@ class VisualizationPalette(BaseView):
 
                 rendering_arguments_dict['piechart_dict'] = piechart_dict
             elif scheme == "word_clouds":
-                agent.generate_word_cloud_picture(data)
+                # the words of the kept rows are counted from the token index of the dataframe (if it has one),
+                # the index of the transformed dataframe holds the positions of its rows
+                frequencies = read_token_frequencies(
+                    dataframe, guide=guide_json, rows=data.index.to_numpy(), collocations=agent.collocations)
+                if frequencies is None:
+                    frequencies = agent.word_frequencies(data)
+                rendering_arguments_dict['image_source'] = payload_source(
+                    agent.generate_word_cloud_picture(frequencies), 'image/png', token=image_token)
             elif scheme == "progress_through_time_circular":
                 pass
             else:
                 raise NotImplementedError
 
+            # the data of this request (if the page reads it) is put in the page, or kept under a token of its own
+            rendering_arguments_dict['chart_data'] = data
+            if agent.payload_format() is not None:
+                rendering_arguments_dict['chart_source'] = payload_source(
+                    serialize_payload(data, payload_format=agent.payload_format()),
+                    PAYLOAD_FORMATS[agent.payload_format()],
+                    compress=True
+                )
+
             return self.render(**rendering_arguments_dict)
 
         return self.render(
@@ -152,5 +278,69 @@ class VisualizationPalette(BaseView):
             visualization_information=visualization_information
         )
 
-    # that the model has to go through, and second, being the information that the plot needs which is specified beforehand, and
-    # with the information such as column mappings (note that the plot needs it too).
+    @expose('/payloads/<token>')
+    def payload(self, token):
+        # the morphed data of a rendered visualization, which is not changed once stored (so that the
+        # conditional requests of the page are answered with `304 Not Modified`)
+        payload = chart_payload(token)
+        if payload is None:
+            abort(404)
+        body, entity_tag, mimetype, compressed = payload
+        # the compressed payloads are only decompressed for the clients that do not accept gzip
+        if compressed and 'gzip' in request.accept_encodings:
+            response = Response(body, mimetype=mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+            response.set_etag(entity_tag + '-gzip')
+        else:
+            response = Response(gzip.decompress(body) if compressed else body, mimetype=mimetype)
+            response.set_etag(entity_tag)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.private = True
+        response.cache_control.max_age = 3600
+        return response.make_conditional(request)
+
+    # that the model has to go through, and second, being the information that the plot needs which is specified
+    # beforehand, and with the information such as column mappings (note that the plot needs it too).
+
+
+class WarehouseDiagnostics(BaseView):
+    """
+    The :class:`WarehouseDiagnostics` shows (as json, to the superusers only) how the warehouse serves the
+    visualizations: the counters of the in-memory caches, and the plan of the transformations of a guide.
+    """
+    def is_accessible(self):
+        return current_user.is_active and current_user.is_authenticated and current_user.has_role('superuser')
+
+    def _handle_view(self, name, **kwargs):
+        """
+        Override builtin _handle_view in order to redirect users when a view is not accessible.
+        """
+        if not self.is_accessible():
+            if current_user.is_authenticated:
+                # permission denied
+                abort(403)
+            else:
+                # login
+                return redirect(url_for('security.login', next=request.url))
+
+    @expose('/')
+    def index(self):
+        # the hits, misses, evictions and sizes of the caches, please refer to `LRUCache.statistics`
+        return jsonify({
+            "dataframe_cache": dataframe_cache.statistics(),
+            "transformation_cache": transformation_cache.statistics(),
+            "chart_payload_cache": chart_payload_cache.statistics()
+        })
+
+    @expose('/explain')
+    def explain(self):
+        # the order that the filters of the guide are applied in, e.g. /explain?dataframe=name&guide={...}
+        dataframe = Dataframe.query.filter_by(name=request.args.get('dataframe', '')).first()
+        if dataframe is None:
+            abort(404)
+        try:
+            guide_json = json.loads(request.args.get('guide', '{}'))
+            plan = explain_transformations(dataframe, guide=guide_json)
+        except Exception as e:
+            abort(400, description=str(e))
+        return jsonify({"dataframe": dataframe.name, "plan": plan})
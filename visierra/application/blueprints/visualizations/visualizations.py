@@ -4,14 +4,25 @@ __credit__ = 'ERLab - CS@UCLA'
 
 import pandas
 from overrides import overrides
-from typing import Dict, Any
-from application import application_directory
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+from application import application_directory, text_aggregation
+from application.libraries.dates import quantize_dates
+from application.libraries.rollups import ROLLUP_RESOLUTIONS
+from application.libraries.text import comment_column
+import io
 import os
-from copy import deepcopy
+import calendar
+import functools
 import numpy
-from wordcloud import WordCloud, STOPWORDS, ImageColorGenerator
+from wordcloud import WordCloud, ImageColorGenerator
 from PIL import Image
 
+# the picture that the word clouds are shaped and colored by (relative to the application directory)
+WORD_CLOUD_MASK = "static/warehouse/word_clouds/bruin.png"
+
+# the parameters of the word clouds
+WORD_CLOUD_PARAMETERS = {"background_color": "white", "max_words": 2000, "max_font_size": 40, "random_state": 42}
+
 
 class VisualizationBase:
     """
@@ -42,6 +53,42 @@ class VisualizationBase:
         """
         raise NotImplementedError
 
+    def required_columns(self) -> Optional[List[str]]:
+        """
+        This method returns the columns that the visualization needs (the same ones that
+        :meth:`check_dataframe_sanity` looks for), so that only these are read from the registered dataframe.
+        If a visualization can work with one of several column names, all of them can be listed.
+
+        Returns
+        ----------
+        The `List[str]` of the column names, or `None` if the visualization needs all of the columns.
+        """
+        return None
+
+    def date_window(self) -> Optional[Dict[str, str]]:
+        """
+        This method returns the range of dates that the visualization keeps in its morphing, so that
+        the chunks of a large dataframe which fall entirely outside of it do not have to be read.
+
+        Returns
+        ----------
+        A `Dict[str, str]` with the `column` holding the dates and the `start` and `end` dates in `yyyy-mm-dd`
+        format, or `None` if the visualization keeps all of the dates.
+        """
+        return None
+
+    def partition_key(self) -> Optional[Any]:
+        """
+        This method returns the subject that the visualization is about, so that only the rows of that subject
+        are read from the registered dataframes which are partitioned by subject (please refer to
+        :func:`application.libraries.partitions.build_partitions`).
+
+        Returns
+        ----------
+        The subject, or `None` if the visualization needs the rows of all of the subjects.
+        """
+        return None
+
     def visualization_specific_morphing(self, dataframe: pandas.DataFrame) -> pandas.DataFrame:
         """
         According to the type of the visualization (along with any other new
@@ -61,6 +108,54 @@ class VisualizationBase:
         """
         raise NotImplementedError
 
+    def chunked_morphing(self, chunks: Iterator[pandas.DataFrame]) -> pandas.DataFrame:
+        """
+        This is the streaming counterpart of :meth:`visualization_specific_morphing`, which is used for the
+        dataframes that are too large to be loaded in memory. By default, the chunks (which only include the rows
+        that remain after the guide's transformations) are put together and morphed, but the visualizations
+        can instead morph each chunk and combine the partial outputs.
+
+        Parameters
+        ----------
+        chunks: `Iterator[pandas.DataFrame]`, required
+            The chunks of the input dataframe
+
+        Returns
+        ----------
+        The output of this method is the now-altered instance of `pandas.DataFrame`.
+        """
+        return self.visualization_specific_morphing(pandas.concat(list(chunks)))
+
+    def rollup_morphing(self, rollup: pandas.DataFrame) -> Optional[pandas.DataFrame]:
+        """
+        The step visualizations can answer from the rollup of a step dataframe (please refer to
+        :mod:`application.libraries.rollups`) instead of its rows, in time proportional to the number of buckets.
+
+        Parameters
+        ----------
+        rollup: `pandas.DataFrame`, required
+            The rollup, with the `resolution`, `subject`, `timestamp`, `step_type` and `number_of_steps` columns,
+            which only holds the buckets of the subject of :meth:`partition_key`
+
+        Returns
+        ----------
+        The same output as :meth:`visualization_specific_morphing`, or `None` if the visualization cannot be
+        answered from the rollup.
+        """
+        return None
+
+    def payload_format(self) -> Optional[str]:
+        """
+        This method returns the format that the template of the visualization reads its data in, please refer
+        to :func:`application.libraries.payloads.serialize_payload`.
+
+        Returns
+        ----------
+        One of the `PAYLOAD_FORMATS` (`csv` or `columnar_json`), `csv` by default, or `None` if the template
+        does not read the data.
+        """
+        return 'csv'
+
     def help(self) -> str:
         """
         Each visualization must implement a "help" method which upon calling outputs the specifics of the
@@ -82,6 +177,106 @@ class VisualizationBase:
         raise NotImplementedError
 
 
+def quantized_date_range(start_date: str, end_date: str, resolution: str) -> List[int]:
+    """
+    The :func:`quantized_date_range` quantizes the start and end dates of a visualization, please refer to
+    :func:`quantize_dates`. At the `hour` resolution, the whole end date is included.
+
+    Parameters
+    ----------
+    start_date: `str`, required
+        The start date in `yyyy-mm-dd` format
+    end_date: `str`, required
+        The end date in `yyyy-mm-dd` format
+    resolution: `str`, required
+        One of the `DATE_RESOLUTIONS`
+
+    Returns
+    ----------
+    The quantized start and end dates as a `List[int]`.
+    """
+    return [
+        int(quantize_dates(pandas.Series([start_date]), resolution)[0]),
+        int(quantize_dates(pandas.Series([end_date]), resolution, default_hour=23)[0])
+    ]
+
+
+def pivot_aggregate(
+        keys: numpy.ndarray,
+        categories: pandas.Series,
+        values: pandas.Series,
+        category_layout: List[Any],
+        key_name: str = 'timestamp'
+) -> pandas.DataFrame:
+    """
+    The :func:`pivot_aggregate` sums up the values of each (key, category) pair in one pass, directly into
+    a matrix with one row per distinct key and one column per category of the layout. Only the distinct keys
+    (and the cells of the integer values) are sorted, and the rows of the other categories (or with missing values)
+    only contribute their keys.
+
+    Parameters
+    ----------
+    keys: `numpy.ndarray`, required
+        The key of each row (e.g. the quantized timestamp), without missing values
+    categories: `pandas.Series`, required
+        The category of each row (e.g. the step type)
+    values: `pandas.Series`, required
+        The value of each row (e.g. the number of steps)
+    category_layout: `List[Any]`, required
+        The categories which become the columns of the output, in this order
+    key_name: `str`, optional (default='timestamp')
+        The name of the index of the output
+
+    Returns
+    ----------
+    The `pandas.DataFrame` with the sorted distinct keys as its index and the sums of the categories as its columns,
+    which are integers if the values are integers.
+    """
+    key_codes, unique_keys = pandas.factorize(numpy.asarray(keys), sort=True)
+    category_codes = pandas.Index(category_layout).get_indexer(categories)
+    values = numpy.asarray(values)
+    kept = category_codes >= 0
+    if values.dtype.kind == 'f':
+        kept &= ~numpy.isnan(values)
+
+    cells = key_codes[kept] * len(category_layout) + category_codes[kept]
+    if values.dtype.kind in 'iub':
+        # the integers are summed up as integers, so that the large totals stay exact. the rows are sorted by their
+        # cells, and the values of each run of a cell are summed up at once
+        matrix = numpy.zeros(len(unique_keys) * len(category_layout),
+                             dtype=numpy.uint64 if values.dtype.kind == 'u' else numpy.int64)
+        order = numpy.argsort(cells, kind='stable')
+        cells = cells[order]
+        starts = numpy.flatnonzero(numpy.diff(cells, prepend=-1))
+        if len(starts) > 0:
+            matrix[cells[starts]] = numpy.add.reduceat(values[kept][order].astype(matrix.dtype), starts)
+    else:
+        matrix = numpy.bincount(
+            cells, weights=values[kept].astype(numpy.float64), minlength=len(unique_keys) * len(category_layout))
+    matrix = matrix.reshape(len(unique_keys), len(category_layout))
+
+    return pandas.DataFrame(matrix, index=pandas.Index(unique_keys, name=key_name), columns=category_layout)
+
+
+def combine_progress_partials(partials: List[pandas.DataFrame]) -> pandas.DataFrame:
+    """
+    The :func:`combine_progress_partials` combines the outputs of the progress-through-time morphing on
+    different chunks of a dataframe, by summing up the step counts of each timestamp.
+
+    Parameters
+    ----------
+    partials: `List[pandas.DataFrame]`, required
+        The morphed chunks, including the `timestamp` column and one column per step type
+
+    Returns
+    ----------
+    The combined `pandas.DataFrame`, in the same format as the morphed chunks.
+    """
+    output = pandas.concat(partials).reset_index(drop=True).groupby('timestamp').sum()
+    output['timestamp'] = output.index.tolist()
+    return output.loc[:, partials[0].columns.tolist()]
+
+
 class ProgressThroughTimeVisualization(VisualizationBase):
     """
     The :class:`ProgressThroughTimeVisualization` is provided to visualize the time-series
@@ -108,7 +303,7 @@ class ProgressThroughTimeVisualization(VisualizationBase):
         scheme: `str`, required
             The visualization scheme
         resolution: `str`, required
-            The choices are `day`, `month`, and `year`
+            The choices are `hour`, `day`, `week`, `month`, and `year`
         """
         super(ProgressThroughTimeVisualization, self).__init__()
         self.subject = subject
@@ -128,79 +323,66 @@ class ProgressThroughTimeVisualization(VisualizationBase):
         assert "number_of_steps" in columns
 
     @overrides
-    def visualization_specific_morphing(self, dataframe: pandas.DataFrame) -> pandas.DataFrame:
+    def partition_key(self) -> Optional[Any]:
         """
         Please refer to the method's description in parent class's documentation.
         """
-        step_layout = [
-            'toe',
-            'flat',
-            'normal'
-        ]
+        return self.subject
 
-        # copying the dataframe
-        output = deepcopy(dataframe)
-
-        def quantize_date(date: str, resolution: str):
-            """
-            This mini function is for date quantization
-
-            Parameters
-            ----------
-            date: `str`, required
-                The string of date in `yyyy-mm-dd` format
-            resolution: `str`, required
-                The resolution, which is either `month` or `year`
-
-            Returns
-            -----------
-            This method returns the quantized month as a `yyyy-mm` instance of `str`, or other types
-            of quantized `str` outputs.
-            """
-            date = date.replace('_', '-')
-            date_parts = date.split('-')
-
-            if resolution == 'year':
-                return '-'.join(date_parts[:1])
-            elif resolution == 'month':
-                return '-'.join(date_parts[:2])
-            elif resolution == 'day':
-                return '-'.join(date_parts[:3])
-            else:
-                raise NotImplementedError
-
-        # using the internal :meth:`quantize_date`, the dates are quantized
-        output["timestamp"] = output["timestamp"].apply(
-            lambda x: int(quantize_date(x, self.resolution).replace('-', ''))
-        )
+    @overrides
+    def required_columns(self) -> Optional[List[str]]:
+        """
+        Please refer to the method's description in parent class's documentation.
+        """
+        return ["timestamp", "step_type", "number_of_steps"]
 
-        start_date_parts = self.start_date.split('-')
-        end_date_parts = self.end_date.split('-')
+    @overrides
+    def date_window(self) -> Optional[Dict[str, str]]:
+        """
+        Please refer to the method's description in parent class's documentation. The dates are compared
+        at the resolution of the visualization, so the window covers the whole first and last periods.
+        """
+        start_date_parts = self.start_date.replace('_', '-').split('-')
+        end_date_parts = self.end_date.replace('_', '-').split('-')
         if self.resolution == "year":
-            timestamp_lowerbound = int(start_date_parts[0])
-            timestamp_upperbound = int(end_date_parts[0])
+            start, end = start_date_parts[0] + '-01-01', end_date_parts[0] + '-12-31'
         elif self.resolution == "month":
-            timestamp_lowerbound = int(''.join(start_date_parts[:2]))
-            timestamp_upperbound = int(''.join(end_date_parts[:2]))
-        elif self.resolution == "day":
-            timestamp_lowerbound = int(''.join(start_date_parts[:3]))
-            timestamp_upperbound = int(''.join(end_date_parts[:3]))
+            # the last day of the end month, e.g. 2020-02-29
+            end_year, end_month = int(end_date_parts[0]), int(end_date_parts[1])
+            start = '-'.join(start_date_parts[:2]) + '-01'
+            end = '{:04d}-{:02d}-{:02d}'.format(end_year, end_month, calendar.monthrange(end_year, end_month)[1])
+        elif self.resolution in ["day", "hour"]:
+            start, end = '-'.join(start_date_parts[:3])[:10], '-'.join(end_date_parts[:3])[:10]
+        elif self.resolution == "week":
+            # the weeks of the start and end dates are included entirely
+            start = (pandas.Timestamp(self.start_date[:10].replace('_', '-')) - pandas.Timedelta(days=6))
+            end = (pandas.Timestamp(self.end_date[:10].replace('_', '-')) + pandas.Timedelta(days=6))
+            start, end = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
         else:
             raise NotImplementedError
+        return {"column": "timestamp", "start": start, "end": end}
 
-        output = output[output['timestamp'] <= timestamp_upperbound]
-        output = output[output['timestamp'] >= timestamp_lowerbound]
-
-        # forming the morphed dataframe and filling the not a numbers
-        for step_type in step_layout:
-            output[step_type] = output[output['step_type'] == step_type]['number_of_steps']
-            output[step_type].fillna(0, inplace=True)
+    @overrides
+    def visualization_specific_morphing(self, dataframe: pandas.DataFrame) -> pandas.DataFrame:
+        """
+        Please refer to the method's description in parent class's documentation.
+        """
+        step_layout = [
+            'toe',
+            'flat',
+            'normal'
+        ]
 
-        # sorting by timestamp strings
-        output = output.sort_values(by='timestamp')
+        # the dates are quantized, along with the start and end dates
+        dataframe = dataframe[dataframe['timestamp'].notna()]
+        timestamps = quantize_dates(dataframe["timestamp"], self.resolution)
+        timestamp_lowerbound, timestamp_upperbound = quantized_date_range(
+            self.start_date, self.end_date, self.resolution)
+        kept = (timestamps >= timestamp_lowerbound) & (timestamps <= timestamp_upperbound)
 
-        # grouping by timestamp and summing up
-        output = output.groupby('timestamp').sum()
+        # summing up the steps of each step type per timestamp
+        output = pivot_aggregate(
+            timestamps[kept], dataframe['step_type'][kept], dataframe['number_of_steps'][kept], step_layout)
 
         # getting the timestamps and adding them to the list
         output['timestamp'] = output.index.tolist()
@@ -211,6 +393,40 @@ class ProgressThroughTimeVisualization(VisualizationBase):
         # returning it
         return output
 
+    @overrides
+    def rollup_morphing(self, rollup: pandas.DataFrame) -> Optional[pandas.DataFrame]:
+        """
+        Please refer to the method's description in parent class's documentation.
+        """
+        if self.resolution not in ROLLUP_RESOLUTIONS:
+            return None
+        buckets = rollup[(rollup['resolution'] == self.resolution) & rollup['timestamp'].notna()]
+        timestamps = buckets['timestamp'].to_numpy(dtype=numpy.int64)
+        timestamp_lowerbound, timestamp_upperbound = quantized_date_range(
+            self.start_date, self.end_date, self.resolution)
+        kept = (timestamps >= timestamp_lowerbound) & (timestamps <= timestamp_upperbound)
+
+        step_layout = ['toe', 'flat', 'normal']
+        output = pivot_aggregate(
+            timestamps[kept], buckets['step_type'][kept], buckets['number_of_steps'][kept], step_layout)
+        output['timestamp'] = output.index.tolist()
+        return output.loc[:, ['timestamp'] + step_layout]
+
+    @overrides
+    def chunked_morphing(self, chunks: Iterator[pandas.DataFrame]) -> pandas.DataFrame:
+        """
+        Please refer to the method's description in parent class's documentation. Each chunk is aggregated
+        on its own, and the partial step counts of each timestamp are summed up.
+        """
+        return combine_progress_partials([self.visualization_specific_morphing(chunk) for chunk in chunks])
+
+    @overrides
+    def payload_format(self) -> Optional[str]:
+        """
+        Please refer to the method's description in parent class's documentation.
+        """
+        return 'columnar_json'
+
     @overrides
     def help(self) -> str:
         """
@@ -224,7 +440,8 @@ class ProgressThroughTimeVisualization(VisualizationBase):
             - `step_type`: the step type column in which each row's value belongs to ["toe", "normal", "flat"]
             - `number_of_steps`: This column signifies the number of steps attributed to this category in that time.
             Note that it is easily possible to have multiple many recordings in any dates, dates have no
-            uniqueness constraint.
+            uniqueness constraint. The guide can include `max_points` (an integer, at least 8) to limit the number
+            of plotted points, in which case the series are downsampled while keeping their extremes.
         """
 
     @overrides
@@ -277,7 +494,7 @@ class ProgressThroughTimeCircularVisualization(VisualizationBase):
         scheme: `str`, required
             The visualization scheme
         resolution: `str`, required
-            The choices are `day`, `month`, and `year`
+            The choices are `hour`, `day`, `week`, `month`, and `year`
         """
         super(ProgressThroughTimeCircularVisualization, self).__init__()
         self.subject = subject
@@ -296,6 +513,20 @@ class ProgressThroughTimeCircularVisualization(VisualizationBase):
         assert "step_type" in columns
         assert "number_of_steps" in columns
 
+    @overrides
+    def partition_key(self) -> Optional[Any]:
+        """
+        Please refer to the method's description in parent class's documentation.
+        """
+        return self.subject
+
+    @overrides
+    def required_columns(self) -> Optional[List[str]]:
+        """
+        Please refer to the method's description in parent class's documentation.
+        """
+        return ["timestamp", "step_type", "number_of_steps"]
+
     @overrides
     def visualization_specific_morphing(self, dataframe: pandas.DataFrame) -> pandas.DataFrame:
         """
@@ -307,50 +538,50 @@ class ProgressThroughTimeCircularVisualization(VisualizationBase):
             'normal'
         ]
 
-        output = deepcopy(dataframe)
-
-        def quantize_date(date: str, resolution: str):
-            """
-            This mini function is for date quantization
-
-            Parameters
-            ----------
-            date: `str`, required
-                The string of date in `yyyy-mm-dd` format
-            resolution: `str`, required
-                The resolution, which is either `month` or `year`
-
-            Returns
-            -----------
-            This method returns the quantized month as a yyyymm instance of `float`.
-            """
-            date = date.replace('_', '-')
-            date_parts = date.split('-')
-
-            if resolution == 'year':
-                return '-'.join(date_parts[:1])
-            elif resolution == 'month':
-                return '-'.join(date_parts[:2])
-            elif resolution == 'day':
-                return '-'.join(date_parts[:3])
-            else:
-                raise NotImplementedError
-
-        output["timestamp"] = output["timestamp"].apply(
-            lambda x: int(quantize_date(x, self.resolution).replace('-', '')))
-
-        for step_type in step_layout:
-            output[step_type] = output[output['step_type'] == step_type]['number_of_steps']
-            output[step_type].fillna(0, inplace=True)
-
-        output = output.sort_values(by='timestamp')
-        output = output.groupby('timestamp').sum()
+        dataframe = dataframe[dataframe['timestamp'].notna()]
+        output = pivot_aggregate(
+            quantize_dates(dataframe["timestamp"], self.resolution),
+            dataframe['step_type'],
+            dataframe['number_of_steps'],
+            step_layout
+        )
         output['timestamp'] = output.index.tolist()
 
         output = output.loc[:, ['timestamp'] + step_layout]
 
         return output
 
+    @overrides
+    def rollup_morphing(self, rollup: pandas.DataFrame) -> Optional[pandas.DataFrame]:
+        """
+        Please refer to the method's description in parent class's documentation.
+        """
+        if self.resolution not in ROLLUP_RESOLUTIONS:
+            return None
+        buckets = rollup[(rollup['resolution'] == self.resolution) & rollup['timestamp'].notna()]
+
+        step_layout = ['toe', 'flat', 'normal']
+        output = pivot_aggregate(
+            buckets['timestamp'].to_numpy(dtype=numpy.int64), buckets['step_type'], buckets['number_of_steps'],
+            step_layout)
+        output['timestamp'] = output.index.tolist()
+        return output.loc[:, ['timestamp'] + step_layout]
+
+    @overrides
+    def chunked_morphing(self, chunks: Iterator[pandas.DataFrame]) -> pandas.DataFrame:
+        """
+        Please refer to the method's description in parent class's documentation. Each chunk is aggregated
+        on its own, and the partial step counts of each timestamp are summed up.
+        """
+        return combine_progress_partials([self.visualization_specific_morphing(chunk) for chunk in chunks])
+
+    @overrides
+    def payload_format(self) -> Optional[str]:
+        """
+        Please refer to the method's description in parent class's documentation.
+        """
+        return 'columnar_json'
+
     @overrides
     def help(self) -> str:
         """
@@ -424,13 +655,24 @@ class WalkingPieChartDuringDateRange(VisualizationBase):
         assert "number_of_steps" in columns
 
     @overrides
-    def visualization_specific_morphing(self, dataframe: pandas.DataFrame) -> pandas.DataFrame:
+    def partition_key(self) -> Optional[Any]:
         """
         Please refer to the method's description in parent class's documentation.
         """
+        return self.subject
 
-        # preparing the output dataframe's core data storage as a dictionary.
-        output = dict()
+    @overrides
+    def required_columns(self) -> Optional[List[str]]:
+        """
+        Please refer to the method's description in parent class's documentation.
+        """
+        return ["timestamp", "step_type", "number_of_steps"]
+
+    @overrides
+    def visualization_specific_morphing(self, dataframe: pandas.DataFrame) -> pandas.DataFrame:
+        """
+        Please refer to the method's description in parent class's documentation.
+        """
 
         # preparing the step layout
         step_layout = [
@@ -442,16 +684,43 @@ class WalkingPieChartDuringDateRange(VisualizationBase):
         # this step_layout will be used in the html as well, so let's make it class variable
         self.step_layout = step_layout
 
-        # filling the information by summing up all of the step counts during the entire time
-        # selected by the user.
-        for step_type in step_layout:
-            output[step_type] = [
-                numpy.sum(dataframe[dataframe['step_type'] == step_type]['number_of_steps'].to_numpy())]
+        # summing up all of the step counts during the entire time selected by the user, with a single key
+        output = pivot_aggregate(
+            numpy.zeros(dataframe.shape[0], dtype=numpy.int64),
+            dataframe['step_type'],
+            dataframe['number_of_steps'],
+            step_layout
+        )
 
-        # forming the dataframe by that dictionary
-        output = pandas.DataFrame(output)
+        # the single row of the sums, or no row if there is no row in the dataframe
+        return output.reset_index(drop=True)
 
-        return output
+    @overrides
+    def rollup_morphing(self, rollup: pandas.DataFrame) -> Optional[pandas.DataFrame]:
+        """
+        Please refer to the method's description in parent class's documentation. The coarsest buckets
+        are summed up.
+        """
+        return self.visualization_specific_morphing(rollup[rollup['resolution'] == ROLLUP_RESOLUTIONS[-1]])
+
+    @overrides
+    def chunked_morphing(self, chunks: Iterator[pandas.DataFrame]) -> pandas.DataFrame:
+        """
+        Please refer to the method's description in parent class's documentation. The step counts of
+        the chunks are summed up.
+        """
+        partials = pandas.concat([self.visualization_specific_morphing(chunk) for chunk in chunks], ignore_index=True)
+        if partials.shape[0] == 0:
+            return partials
+        return pandas.DataFrame({step_type: [partials[step_type].sum()] for step_type in self.step_layout})
+
+    @overrides
+    def payload_format(self) -> Optional[str]:
+        """
+        Please refer to the method's description in parent class's documentation. The page only shows the
+        counts of the step types (please refer to :meth:`visualization_information`).
+        """
+        return None
 
     @overrides
     def help(self) -> str:
@@ -489,6 +758,26 @@ class WalkingPieChartDuringDateRange(VisualizationBase):
         }
 
 
+@functools.lru_cache(maxsize=None)
+def word_cloud_coloring(relative_path: str) -> Tuple[numpy.ndarray, ImageColorGenerator]:
+    """
+    The :func:`word_cloud_coloring` decodes the mask of the word clouds and builds its color generator once per
+    process, the mask is only read.
+
+    Parameters
+    ----------
+    relative_path: `str`, required
+        The path to the picture of the mask, relative to the application directory
+
+    Returns
+    ----------
+    The mask as a `numpy.ndarray` and the `ImageColorGenerator` of its colors.
+    """
+    the_coloring = numpy.array(Image.open(os.path.join(application_directory, relative_path)))
+    the_coloring.setflags(write=False)
+    return the_coloring, ImageColorGenerator(the_coloring)
+
+
 class WordCloudsVisualization(VisualizationBase):
     """
     The :class:`WordCloudsVisualization` is mainly responsible for the visualizations of the palette using
@@ -496,16 +785,30 @@ class WordCloudsVisualization(VisualizationBase):
     """
     def __init__(self, guide):
         super(WordCloudsVisualization, self).__init__(guide=guide)
+        # the frequent pairs of adjacent words are counted as words of their own, unless the guide turns them off
+        self.collocations = bool(guide.get("collocations", True))
 
     @overrides
     def check_dataframe_sanity(self, dataframe: pandas.DataFrame) -> None:
         columns = dataframe.columns.tolist()
         assert ("COMMENT" in columns) or ("PatientComment" in columns)
 
+    @overrides
+    def required_columns(self) -> Optional[List[str]]:
+        return ["COMMENT", "PatientComment"]
+
     @overrides
     def visualization_specific_morphing(self, dataframe: pandas.DataFrame) -> pandas.DataFrame:
         return dataframe
 
+    @overrides
+    def payload_format(self) -> Optional[str]:
+        """
+        Please refer to the method's description in parent class's documentation. The page only shows the
+        rendered picture.
+        """
+        return None
+
     @overrides
     def help(self) -> str:
         return """
@@ -531,37 +834,60 @@ class WordCloudsVisualization(VisualizationBase):
             """
         }
 
-    def generate_word_cloud_picture(self, dataframe: pandas.DataFrame):
+    def word_frequencies(self, dataframe: pandas.DataFrame) -> Dict[str, int]:
         """
-        The function to generate and save the word cloud picture.
+        The function to count the words (and the collocations, unless the guide turns them off) of the comments of
+        a dataframe the same way as `WordCloud.generate` does, which is used for the dataframes that do not have a
+        token index (please refer to :func:`application.libraries.warehouse.read_token_frequencies`).
 
         Parameters
         ----------
         dataframe: `pandas.DataFrame`, required
             The input dataframe
+
+        Returns
+        ----------
+        The frequency of each word as a `Dict[str, int]`.
         """
-        if "PatientComment" in dataframe.columns.tolist():
-            comment_column = "PatientComment"
-        elif "COMMENT" in dataframe.columns.tolist():
-            comment_column = "COMMENT"
-        else:
+        comment_column_name = comment_column(dataframe.columns.tolist())
+        if comment_column_name is None:
             raise Exception("Please double check the dataframe to make sure comment column exists in it.")
 
-        full_text = " ".join([e for e in dataframe[comment_column].tolist() if type(e) == str])
+        return text_aggregation.count_tokens([dataframe[comment_column_name]], collocations=self.collocations)
+
+    def picture_parameters(self) -> Dict[str, Any]:
+        """
+        The function which returns the parameters that the picture depends on (other than the dataframe and the
+        guide's transformations), which are a part of the key of the rendered pictures.
+
+        Returns
+        ----------
+        The `Dict[str, Any]` of the parameters.
+        """
+        return dict(WORD_CLOUD_PARAMETERS, collocations=self.collocations, mask=WORD_CLOUD_MASK)
 
+    def generate_word_cloud_picture(self, frequencies: Dict[str, int]) -> bytes:
+        """
+        The function to generate the word cloud picture.
 
-        the_coloring = numpy.array(Image.open(os.path.join(application_directory, "static/warehouse/word_clouds/bruin.png")))
-        stopwords = set(STOPWORDS)
-        stopwords.add("said")
+        Parameters
+        ----------
+        frequencies: `Dict[str, int]`, required
+            The frequency of each word, please refer to :meth:`word_frequencies`.
 
-        wc = WordCloud(background_color="white", max_words=2000, mask=the_coloring,
-                       stopwords=stopwords, max_font_size=40, random_state=42)
-        # generate word cloud
-        wc.generate(full_text)
+        Returns
+        ----------
+        The picture in png format as `bytes`.
+        """
+        the_coloring, image_colors = word_cloud_coloring(WORD_CLOUD_MASK)
 
-        # create coloring from image
-        image_colors = ImageColorGenerator(the_coloring)
+        # the stopwords are already left out of the frequencies
+        wc = WordCloud(mask=the_coloring, **WORD_CLOUD_PARAMETERS)
+        # generate word cloud
+        wc.generate_from_frequencies(frequencies)
 
         the_cloud = wc.recolor(color_func=image_colors)
 
-        the_cloud.to_file(os.path.join(application_directory, "static/warehouse/word_clouds/wc.png"))
\ No newline at end of file
+        picture = io.BytesIO()
+        the_cloud.to_image().save(picture, format='png')
+        return picture.getvalue()
@@ -0,0 +1,69 @@
+__author__ = 'Shayan Fazeli'
+__email__ = 'shayan@cs.ucla.edu'
+__credits__ = 'ER Lab - CS@UCLA'
+
+# libraries
+import click
+from flask.cli import AppGroup
+
+# the commands which maintain the registered dataframes, e.g. `flask dataframes refresh`
+dataframes_cli = AppGroup('dataframes', help='Maintain the registered dataframes.')
+
+
+@dataframes_cli.command('register')
+@click.argument('name')
+@click.argument('relative_path')
+@click.option('--description', default='', help='The description of the dataframe.')
+def register_dataframes(name, relative_path, description):
+    """
+    Registers the csv file at RELATIVE_PATH (relative to the `application` folder, e.g. `warehouse/sample_df.csv`)
+    as a dataframe named NAME, which is the name that the users enter in the forms, and builds its columnar copy.
+    """
+    import os
+    from application import application_directory
+    from application.entities import Dataframe
+    from application.libraries.warehouse import register_dataframe
+    if not os.path.isfile(os.path.join(application_directory, relative_path)):
+        raise click.ClickException('There is no csv file at "{}".'.format(relative_path))
+    if Dataframe.query.filter_by(name=name).first() is not None:
+        raise click.ClickException('There is a dataframe registered as "{}" already.'.format(name))
+    dataframe_entity = register_dataframe(name=name, description=description, relative_path=relative_path)
+    click.echo('{}: registered'.format(dataframe_entity.name))
+
+
+@dataframes_cli.command('refresh')
+@click.argument('name', required=False)
+def refresh_dataframes(name):
+    """
+    Brings the columnar copies of the registered dataframes up to date with their csv files. The requests do not
+    refresh them (please refer to :func:`readable_dataframe`), so this is to be run after a csv file is changed
+    (e.g. by the job which appends the new rows to it). If a NAME is given, only that dataframe is refreshed.
+    """
+    from application.entities import Dataframe
+    from application.libraries.warehouse import ensure_columnar_copy, is_columnar_copy_current
+    query = Dataframe.query if name is None else Dataframe.query.filter_by(name=name)
+    dataframes = query.order_by(Dataframe.id).all()
+    if name is not None and len(dataframes) == 0:
+        raise click.ClickException('There is no dataframe registered as "{}".'.format(name))
+    for dataframe_entity in dataframes:
+        if is_columnar_copy_current(dataframe_entity):
+            click.echo('{}: up to date'.format(dataframe_entity.name))
+            continue
+        ensure_columnar_copy(dataframe_entity)
+        click.echo('{}: refreshed'.format(dataframe_entity.name))
+
+
+# the commands which maintain the stored chart payloads, e.g. `flask payloads sweep`
+payloads_cli = AppGroup('payloads', help='Maintain the stored chart payloads.')
+
+
+@payloads_cli.command('sweep')
+@click.option('--max-age', type=float, default=None, help='The age (in seconds) of the oldest payloads to keep.')
+def sweep_payloads(max_age):
+    """
+    Removes the stored payloads (the large chart data and pictures that the rendered pages fetch by their token)
+    which are older than the max age, a day by default. This is to be run periodically (e.g. by cron).
+    """
+    from application.libraries.payloads import PAYLOAD_MAX_AGE, remove_old_payloads
+    removed = remove_old_payloads(max_age=PAYLOAD_MAX_AGE if max_age is None else max_age)
+    click.echo('{} payloads removed'.format(removed))
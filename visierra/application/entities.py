@@ -21,7 +21,8 @@ class User(db.Model, UserMixin):
     `first_name`, `last_name`, `email`, `active`, and `password` which are other characteristics
     of the user along with `roles` associated with each user.
 
-    Note that this and the similar functionalities are developed according to https://github.com/jonalxh/Flask-Admin-Dashboard
+    Note that this and the similar functionalities are developed according to
+    https://github.com/jonalxh/Flask-Admin-Dashboard
     """
 
     # preparing the attribuets
@@ -54,8 +55,28 @@ class Dataframe(db.Model):
     """
     The :class:`Dataframe` entity helps with registration of dataframes in ViSierra platform. In its attributes,
     there is path variables as well which will be used to read the dataframe.
+
+    The `relative_path` points to the registered csv file, and `columnar_relative_path` points to its
+    columnar (parquet) copy which is built once by :mod:`application.libraries.warehouse` and used for
+    the actual reads. The `source_version` marks the version of the csv that the columnar copy was built from,
+    and `source_state` records the state of the csv that it covers, so that the rows appended to the csv later
+    on are added to it without building it again. The `zone_maps` keeps the per row group statistics of the
+    columnar copy which help with skipping the row groups that cannot match the filters. The `column_dtypes`
+    are the compact dtypes of the columns (e.g. categorical or downcast integers) which are found at
+    registration and used in every read. For the step dataframes, `rollup` points to the pre-aggregated step
+    counts and records the state of the csv that they cover. The `partitions` index the per subject files of the
+    dataframes which have a `subject` column, and for the dataframes with comments, `token_index` points to the
+    token counts of each comment and records the state of the csv that they cover.
     """
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), unique=True)
     description = db.Column(db.String(1000))
     relative_path = db.Column(db.String(1000))
+    columnar_relative_path = db.Column(db.String(1000))
+    source_version = db.Column(db.String(255))
+    source_state = db.Column(db.JSON)
+    zone_maps = db.Column(db.JSON)
+    column_dtypes = db.Column(db.JSON)
+    rollup = db.Column(db.JSON)
+    partitions = db.Column(db.JSON)
+    token_index = db.Column(db.JSON)
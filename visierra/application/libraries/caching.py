@@ -0,0 +1,172 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+import numpy
+import pandas
+
+
+def size_in_bytes(value: Any) -> int:
+    """
+    The :func:`size_in_bytes` estimates the memory footprint of a cached value.
+
+    Parameters
+    ----------
+    value: `Any`, required
+        The value, usually a `pandas.Series`, `pandas.DataFrame` or `numpy.ndarray`
+
+    Returns
+    ----------
+    The estimated size in bytes as an `int`.
+    """
+    if isinstance(value, pandas.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    elif isinstance(value, pandas.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    elif isinstance(value, numpy.ndarray):
+        return int(value.nbytes)
+    elif isinstance(value, bytes):
+        return len(value)
+    else:
+        return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    The :class:`LRUCache` is a thread-safe least-recently-used cache with a budget in bytes, which is
+    shared by the request handlers of a process. It keeps the `hits`, `misses` and `evictions` counters
+    to help with tuning the budget.
+
+    Similar to the flask extensions, the instance is created at import time and its budget is read from the
+    application configuration in :meth:`init_app`.
+    """
+
+    def __init__(
+            self,
+            config_key: Optional[str] = None,
+            max_bytes: int = 512 * 1024 * 1024,
+            size_of: Callable[[Any], int] = size_in_bytes
+    ):
+        """
+        The constructor method of :class:`LRUCache`
+
+        Parameters
+        ----------
+        config_key: `str`, optional (default=None)
+            The key of the configuration parameter which holds the budget (in bytes)
+        max_bytes: `int`, optional (default=512MB)
+            The budget in bytes, used if the configuration does not include the `config_key`
+        size_of: `Callable[[Any], int]`, optional (default=size_in_bytes)
+            The function that estimates the size of each value
+        """
+        self.config_key = config_key
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app) -> None:
+        """
+        The :meth:`init_app` reads the budget from the application configuration.
+
+        Parameters
+        ----------
+        app: `Flask`, required
+            The application
+        """
+        if self.config_key is not None:
+            self.max_bytes = app.config.get(self.config_key, self.max_bytes)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        The :meth:`get` returns the cached value and marks it as the most recently used one.
+
+        Parameters
+        ----------
+        key: `Hashable`, required
+            The key
+        default: `Any`, optional (default=None)
+            The value to return on a miss
+
+        Returns
+        ----------
+        The cached value, or the `default` if it is not cached.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        """
+        The :meth:`put` caches a value, evicting the least recently used ones if the budget is exceeded.
+        Values larger than the whole budget are not cached.
+
+        Parameters
+        ----------
+        key: `Hashable`, required
+            The key
+        value: `Any`, required
+            The value
+        size: `int`, optional (default=None)
+            The size of the value in bytes, estimated with `size_of` if not given
+        """
+        if size is None:
+            size = self.size_of(value)
+        with self.lock:
+            if key in self.entries:
+                self.current_bytes -= self.entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> None:
+        """
+        The :meth:`invalidate` removes the entries the keys of which satisfy the predicate.
+
+        Parameters
+        ----------
+        predicate: `Callable[[Hashable], bool]`, required
+            The function which receives a key and returns `True` if it has to be removed
+        """
+        with self.lock:
+            for key in [e for e in self.entries.keys() if predicate(e)]:
+                self.current_bytes -= self.entries.pop(key)[1]
+
+    def clear(self) -> None:
+        """
+        The :meth:`clear` removes all of the entries.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def statistics(self) -> Dict[str, int]:
+        """
+        The :meth:`statistics` returns the counters of the cache.
+
+        Returns
+        ----------
+        A `Dict[str, int]` with the `hits`, `misses`, `evictions`, `entries`, `current_bytes` and `max_bytes`.
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes
+            }
@@ -0,0 +1,90 @@
+import numpy
+import pandas
+from typing import Dict
+
+# the parts of a date in `str` format: year, month, day and (optionally) hour, separated by `-` or `_`
+DATE_PATTERN = r'^(\d{1,4})(?:[-_](\d{1,2}))?(?:[-_](\d{1,2}))?(?:[ T_](\d{1,2}))?'
+
+# the resolutions that the dates can be quantized to
+DATE_RESOLUTIONS = ['year', 'month', 'week', 'day', 'hour']
+
+
+def date_parts(column: pandas.Series, default_hour: int = 0) -> Dict[str, numpy.ndarray]:
+    """
+    The :func:`date_parts` extracts the year, month, day and hour of a column of dates without a per-row python
+    call. The distinct `str` dates (e.g. `yyyy-mm-dd` or `yyyy_mm_dd hh`) are split by a vectorized regular
+    expression and looked up by the rows, the parsed (`datetime64`) dates are read from their fields, and the
+    categorical ones are split once per category. The `str` dates are not validated as calendar dates.
+
+    Parameters
+    ----------
+    column: `pandas.Series`, required
+        The dates, without missing values
+    default_hour: `int`, optional (default=0)
+        The hour of the `str` dates that do not include one
+
+    Returns
+    ----------
+    A `Dict[str, numpy.ndarray]` with the `year`, `month`, `day` and `hour` of each row as `int64` arrays.
+    """
+    if isinstance(column.dtype, pandas.CategoricalDtype):
+        categories = pandas.Series(column.cat.categories).astype(column.cat.categories.dtype)
+        codes = column.cat.codes.to_numpy()
+        return {key: value[codes] for key, value in date_parts(categories, default_hour=default_hour).items()}
+
+    if pandas.api.types.is_datetime64_any_dtype(column.dtype):
+        return {
+            "year": column.dt.year.to_numpy(dtype=numpy.int64),
+            "month": column.dt.month.to_numpy(dtype=numpy.int64),
+            "day": column.dt.day.to_numpy(dtype=numpy.int64),
+            "hour": column.dt.hour.to_numpy(dtype=numpy.int64)
+        }
+
+    # the dates repeat a lot, so only the distinct ones are split
+    codes, uniques = pandas.factorize(column.astype(str))
+    parts = pandas.Series(uniques, dtype=str).str.extract(DATE_PATTERN)
+    if parts[0].isna().any():
+        raise ValueError("the dates must be in yyyy-mm-dd format")
+    return {
+        key: parts[index].fillna(default).astype(numpy.int64).to_numpy()[codes]
+        for index, (key, default) in enumerate([("year", 0), ("month", 1), ("day", 1), ("hour", default_hour)])
+    }
+
+
+def quantize_dates(column: pandas.Series, resolution: str, default_hour: int = 0) -> numpy.ndarray:
+    """
+    The :func:`quantize_dates` quantizes a column of dates to integers with integer arithmetic on their parts
+    (please refer to :func:`date_parts`), e.g. `2019-09-05` becomes `2019` at the `year` resolution, `201909`
+    at the `month` resolution and `20190905` at the `day` resolution. The `week` resolution gives the ISO year and
+    week (e.g. `201936`) and the `hour` resolution appends the hour to the day (e.g. `2019090513`).
+
+    Parameters
+    ----------
+    column: `pandas.Series`, required
+        The dates, without missing values
+    resolution: `str`, required
+        One of the `DATE_RESOLUTIONS`
+    default_hour: `int`, optional (default=0)
+        The hour of the `str` dates that do not include one
+
+    Returns
+    ----------
+    The quantized dates as an `int64` `numpy.ndarray`.
+    """
+    parts = date_parts(column, default_hour=default_hour)
+    if resolution == 'year':
+        return parts["year"]
+    elif resolution == 'month':
+        return parts["year"] * 100 + parts["month"]
+    elif resolution == 'day':
+        return parts["year"] * 10000 + parts["month"] * 100 + parts["day"]
+    elif resolution == 'hour':
+        return parts["year"] * 1000000 + parts["month"] * 10000 + parts["day"] * 100 + parts["hour"]
+    elif resolution == 'week':
+        # the days past the end of a month (e.g. `2019-02-30`) roll over to the next month
+        dates = (parts["year"] - 1970).astype('datetime64[Y]') + (parts["month"] - 1).astype('timedelta64[M]')
+        dates = dates.astype('datetime64[D]') + (parts["day"] - 1).astype('timedelta64[D]')
+        calendar = pandas.DatetimeIndex(dates).isocalendar()
+        return calendar["year"].to_numpy(dtype=numpy.int64) * 100 + calendar["week"].to_numpy(dtype=numpy.int64)
+    else:
+        raise NotImplementedError
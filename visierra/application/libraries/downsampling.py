@@ -0,0 +1,122 @@
+import numpy
+import pandas
+from typing import List, Optional, Any
+
+
+def min_max_positions(values: numpy.ndarray, number_of_bins: int) -> numpy.ndarray:
+    """
+    The :func:`min_max_positions` splits a series into consecutive bins with the same number of points, and
+    finds the positions of the minimum and the maximum of each bin without a loop over the bins.
+
+    Parameters
+    ----------
+    values: `numpy.ndarray`, required
+        The values of the series, the missing ones (`nan`) are never selected unless a whole bin is missing
+    number_of_bins: `int`, required
+        The number of bins
+
+    Returns
+    ----------
+    The positions of the minimums and the maximums as an `int64` `numpy.ndarray` (not sorted, and maybe repeated).
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    bin_size = -(-len(values) // number_of_bins)
+    number_of_bins = -(-len(values) // bin_size)
+    offsets = numpy.arange(number_of_bins, dtype=numpy.int64) * bin_size
+
+    # the bins are the rows of a matrix, and the padding at the end of the last one is never selected
+    padded = numpy.full(number_of_bins * bin_size, numpy.nan)
+    padded[:len(values)] = values
+    padded = padded.reshape(number_of_bins, bin_size)
+    minimums = numpy.where(numpy.isnan(padded), numpy.inf, padded).argmin(axis=1)
+    maximums = numpy.where(numpy.isnan(padded), -numpy.inf, padded).argmax(axis=1)
+    positions = numpy.concatenate([offsets + minimums, offsets + maximums])
+    return positions[positions < len(values)]
+
+
+def minimum_points(number_of_series: int) -> int:
+    """
+    The :func:`minimum_points` finds the smallest budget of points that :func:`downsample_series` can keep, which
+    is the first and the last rows and the minimum and the maximum of a single bin of each series.
+
+    Parameters
+    ----------
+    number_of_series: `int`, required
+        The number of value columns
+
+    Returns
+    ----------
+    The number of points as an `int`.
+    """
+    return 2 + 2 * number_of_series
+
+
+def validate_max_points(max_points: Any, number_of_series: int) -> Optional[int]:
+    """
+    The :func:`validate_max_points` checks the budget of points of a guide (e.g. its `max_points`).
+
+    Parameters
+    ----------
+    max_points: `Any`, required
+        The budget as given in the guide, or `None`
+    number_of_series: `int`, required
+        The number of value columns
+
+    Returns
+    ----------
+    The budget as an `int`, or `None` if there is none.
+
+    Raises
+    ----------
+    `ValueError` (with a message that can be shown to the user) if the budget is not an integer, or if it is
+    smaller than :func:`minimum_points`.
+    """
+    if max_points is None:
+        return None
+    if isinstance(max_points, bool) or not isinstance(max_points, (int, numpy.integer)):
+        raise ValueError("The max_points of the guide has to be an integer.")
+    if max_points < minimum_points(number_of_series):
+        raise ValueError("The max_points of the guide has to be at least {} (the first and the last points, and "
+                         "the minimum and the maximum of each of the {} series).".format(
+                             minimum_points(number_of_series), number_of_series))
+    return int(max_points)
+
+
+def downsample_series(
+        dataframe: pandas.DataFrame,
+        value_columns: List[str],
+        max_points: Optional[int] = None
+) -> pandas.DataFrame:
+    """
+    The :func:`downsample_series` reduces the rows of a time series (sorted by its time column) to a budget
+    of points with the min/max-per-bin method. For each of the value columns, the rows are split into equal
+    bins and the minimum and the maximum of each bin are kept, along with the first and the last rows. The
+    rows that are kept are the same for all of the columns, so the series still share their time axis, and
+    the extremes of each series as well as the range of the time column are preserved.
+
+    Parameters
+    ----------
+    dataframe: `pandas.DataFrame`, required
+        The time series, one row per point
+    value_columns: `List[str]`, required
+        The columns of the series which are plotted
+    max_points: `int`, optional (default=None)
+        The largest number of rows to keep (please refer to :func:`validate_max_points`), if `None`, all of the
+        rows are kept.
+
+    Returns
+    ----------
+    The `pandas.DataFrame` with the kept rows in their original order.
+
+    Raises
+    ----------
+    `ValueError` if the budget is not valid, please refer to :func:`validate_max_points`.
+    """
+    max_points = validate_max_points(max_points, len(value_columns))
+    if max_points is None or dataframe.shape[0] <= max_points:
+        return dataframe
+    number_of_bins = (max_points - 2) // (2 * len(value_columns))
+    positions = [numpy.array([0, dataframe.shape[0] - 1], dtype=numpy.int64)]
+    for column in value_columns:
+        positions.append(min_max_positions(dataframe[column].to_numpy(), number_of_bins))
+    return dataframe.iloc[numpy.unique(numpy.concatenate(positions))]
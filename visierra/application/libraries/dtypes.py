@@ -0,0 +1,197 @@
+import numpy
+import pandas
+from typing import Optional, Dict, Any
+
+# the `str` columns with at most this many distinct values, which are at most a fraction of the rows, are categorical
+MAXIMUM_CATEGORIES = 1024
+MAXIMUM_CATEGORY_FRACTION = 0.5
+
+# the formats of the dates that are parsed at registration, the dates must be written exactly in one of these
+DATE_FORMATS = ['%Y-%m-%d', '%Y-%m-%d %H:%M:%S']
+
+
+def infer_column_dtypes(csv_path: str, chunk_size: int) -> Dict[str, Dict[str, Any]]:
+    """
+    The :func:`infer_column_dtypes` reads a csv file in chunks and finds the compact dtype of each column which
+    holds all of its values without any loss:
+
+    - the integer columns are downcast to the smallest integer type that holds their range,
+    - the float columns become `float32` if all of their values are exactly representable in it,
+    - the `str` columns that hold dates written in one of the `DATE_FORMATS` are parsed as dates, and
+    - the other `str` columns with few distinct values become categorical.
+
+    Parameters
+    ----------
+    csv_path: `str`, required
+        The path to the csv file
+    chunk_size: `int`, required
+        The number of rows in each chunk
+
+    Returns
+    ----------
+    A `Dict[str, Dict[str, Any]]` which maps the name of each compacted column to its `dtype` (`int8`, `int16`,
+    `int32`, `float32`, `category` or `datetime64[ns]`), along with the sorted `categories` of categorical columns
+    and the `format` of date columns. The other columns are left out.
+    """
+    summaries = dict()
+    for chunk in pandas.read_csv(csv_path, chunksize=chunk_size):
+        for column in chunk.columns:
+            summary = summaries.setdefault(column, {
+                "kinds": set(), "count": 0, "minimum": None, "maximum": None, "float32": True,
+                "categories": set(), "date_format": None, "dates": True
+            })
+            summary["count"] += chunk.shape[0]
+            values = chunk[column].dropna()
+            if values.shape[0] == 0:
+                continue
+
+            if pandas.api.types.is_bool_dtype(values.dtype):
+                summary["kinds"].add("other")
+            elif pandas.api.types.is_integer_dtype(values.dtype):
+                summary["kinds"].add("integer")
+                minimum, maximum = int(values.min()), int(values.max())
+                summary["minimum"] = minimum if summary["minimum"] is None else min(minimum, summary["minimum"])
+                summary["maximum"] = maximum if summary["maximum"] is None else max(maximum, summary["maximum"])
+            elif pandas.api.types.is_float_dtype(values.dtype):
+                summary["kinds"].add("float")
+                summary["float32"] &= bool((values.astype(numpy.float32).astype(values.dtype) == values).all())
+            elif pandas.api.types.is_string_dtype(values.dtype) or pandas.api.types.is_object_dtype(values.dtype):
+                summary["kinds"].add("string")
+                values = values.astype(str)
+                if summary["dates"]:
+                    if summary["date_format"] is None:
+                        summary["date_format"] = next((
+                            e for e in DATE_FORMATS if is_written_in_date_format(values.iloc[:1], e)), None)
+                    summary["dates"] = summary["date_format"] is not None and is_written_in_date_format(
+                        values, summary["date_format"])
+                if len(summary["categories"]) <= MAXIMUM_CATEGORIES:
+                    summary["categories"].update(values.unique().tolist())
+            else:
+                summary["kinds"].add("other")
+
+    column_dtypes = dict()
+    for column, summary in summaries.items():
+        if summary["kinds"] == {"integer"}:
+            dtype = next((e for e in ['int8', 'int16', 'int32'] if numpy.iinfo(e).min <= summary["minimum"] and
+                          summary["maximum"] <= numpy.iinfo(e).max), None)
+            if dtype is not None:
+                column_dtypes[column] = {"dtype": dtype}
+        elif summary["kinds"] == {"float"} and summary["float32"]:
+            column_dtypes[column] = {"dtype": "float32"}
+        elif summary["kinds"] == {"string"} and summary["dates"]:
+            column_dtypes[column] = {"dtype": "datetime64[ns]", "format": summary["date_format"]}
+        elif summary["kinds"] == {"string"} and len(summary["categories"]) <= MAXIMUM_CATEGORIES and \
+                len(summary["categories"]) <= MAXIMUM_CATEGORY_FRACTION * summary["count"]:
+            column_dtypes[column] = {"dtype": "category", "categories": sorted(summary["categories"])}
+    return column_dtypes
+
+
+def is_written_in_date_format(values: pandas.Series, date_format: str) -> bool:
+    """
+    The :func:`is_written_in_date_format` checks whether all of the values are valid dates written exactly in
+    the given format, so that parsing them loses nothing.
+
+    Parameters
+    ----------
+    values: `pandas.Series`, required
+        The (non-missing) `str` values
+    date_format: `str`, required
+        The format, e.g. `%Y-%m-%d`
+
+    Returns
+    ----------
+    `True` if all of the values are dates in that format.
+    """
+    dates = pandas.to_datetime(values, format=date_format, errors='coerce')
+    return not dates.isna().any() and bool((dates.dt.strftime(date_format) == values).all())
+
+
+def compact_dataframe(
+        dataframe: pandas.DataFrame,
+        column_dtypes: Optional[Dict[str, Dict[str, Any]]]
+) -> pandas.DataFrame:
+    """
+    The :func:`compact_dataframe` converts the columns of a dataframe to their compact dtypes (please refer to
+    :func:`infer_column_dtypes`). The columns that already have these dtypes are not copied.
+
+    Parameters
+    ----------
+    dataframe: `pandas.DataFrame`, required
+        The dataframe as read from the csv file (or the columnar copy)
+    column_dtypes: `Dict[str, Dict[str, Any]]`, optional
+        The compact dtypes of the columns, if `None`, the dataframe is returned as it is.
+
+    Returns
+    ----------
+    The `pandas.DataFrame` with the compact dtypes.
+    """
+    columns = dict()
+    for column, layout in (column_dtypes or dict()).items():
+        if column not in dataframe.columns:
+            continue
+        if layout["dtype"] == "category":
+            dtype = pandas.CategoricalDtype(layout["categories"])
+        else:
+            dtype = numpy.dtype(layout["dtype"])
+        if dataframe[column].dtype == dtype:
+            continue
+        if layout["dtype"] == "datetime64[ns]":
+            columns[column] = pandas.to_datetime(dataframe[column], format=layout["format"]).astype(dtype)
+        else:
+            columns[column] = dataframe[column].astype(dtype)
+
+    if len(columns) == 0:
+        return dataframe
+    return dataframe.assign(**columns)
+
+
+def appended_column_dtypes(
+        dataframe: pandas.DataFrame,
+        column_dtypes: Optional[Dict[str, Dict[str, Any]]]
+) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    The :func:`appended_column_dtypes` checks whether the rows appended to a csv file still fit the compact dtypes
+    of its columns (please refer to :func:`infer_column_dtypes`) without any loss. The new values of the categorical
+    columns are added to their categories, as long as there are at most `MAXIMUM_CATEGORIES` of them.
+
+    Parameters
+    ----------
+    dataframe: `pandas.DataFrame`, required
+        The appended rows as read from the csv file
+    column_dtypes: `Dict[str, Dict[str, Any]]`, optional
+        The compact dtypes of the columns
+
+    Returns
+    ----------
+    The compact dtypes of the columns including the appended rows, or `None` if the rows do not fit them.
+    """
+    if column_dtypes is None:
+        return None
+    column_dtypes = dict(column_dtypes)
+    for column, layout in column_dtypes.items():
+        if column not in dataframe.columns:
+            return None
+        values = dataframe[column].dropna()
+        if values.shape[0] == 0:
+            continue
+        if layout["dtype"] == "category":
+            categories = set(layout["categories"]) | set(values.astype(str).unique().tolist())
+            if len(categories) > MAXIMUM_CATEGORIES:
+                return None
+            if len(categories) > len(layout["categories"]):
+                column_dtypes[column] = dict(layout, categories=sorted(categories))
+        elif layout["dtype"] == "datetime64[ns]":
+            if not (pandas.api.types.is_string_dtype(values.dtype) or pandas.api.types.is_object_dtype(values.dtype)) \
+                    or not is_written_in_date_format(values.astype(str), layout["format"]):
+                return None
+        elif layout["dtype"] == "float32":
+            if not pandas.api.types.is_numeric_dtype(values.dtype) or pandas.api.types.is_bool_dtype(values.dtype):
+                return None
+            if not bool((values.astype(numpy.float32).astype(numpy.float64) == values.astype(numpy.float64)).all()):
+                return None
+        else:
+            if not pandas.api.types.is_integer_dtype(values.dtype) or \
+                    int(values.min()) < numpy.iinfo(layout["dtype"]).min or \
+                    int(values.max()) > numpy.iinfo(layout["dtype"]).max:
+                return None
+    return column_dtypes
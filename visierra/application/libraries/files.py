@@ -0,0 +1,59 @@
+import os
+import uuid
+import contextlib
+from typing import BinaryIO, Iterator
+
+
+def temporary_path(path: str) -> str:
+    """
+    The :func:`temporary_path` names a temporary file (or folder) next to a path, which is unique to the caller so
+    that the concurrent writers never write to the same file. The output is moved to the path with `os.replace`
+    once it is complete.
+
+    Parameters
+    ----------
+    path: `str`, required
+        The path
+
+    Returns
+    ----------
+    The path of the temporary file as a `str`.
+    """
+    return '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+
+
+@contextlib.contextmanager
+def replaced_file(path: str) -> Iterator[BinaryIO]:
+    """
+    The :func:`replaced_file` opens a temporary file (please refer to :func:`temporary_path`) to be written instead
+    of a file, and moves it to the path of the file once it is written, so that the other processes (and threads)
+    never read a partial file. The temporary file is removed if the writing fails.
+
+    Parameters
+    ----------
+    path: `str`, required
+        The path of the file
+    """
+    temporary = temporary_path(path)
+    try:
+        with open(temporary, 'wb') as handle:
+            yield handle
+        os.replace(temporary, path)
+    finally:
+        if os.path.isfile(temporary):
+            os.remove(temporary)
+
+
+def replace_file(path: str, body: bytes) -> None:
+    """
+    The :func:`replace_file` writes a file at once, please refer to :func:`replaced_file`.
+
+    Parameters
+    ----------
+    path: `str`, required
+        The path of the file
+    body: `bytes`, required
+        The content of the file
+    """
+    with replaced_file(path) as handle:
+        handle.write(body)
@@ -0,0 +1,500 @@
+import os
+import re
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from application.libraries.files import replace_file
+
+# the statuses of the jobs, the last three of which are final
+JOB_STATUSES = ['queued', 'running', 'done', 'failed', 'cancelled']
+FINAL_JOB_STATUSES = ['done', 'failed', 'cancelled']
+
+# the ids of the jobs are hex uuids (please refer to :meth:`JobQueue.submit`)
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class JobCancelled(Exception):
+    """
+    The :class:`JobCancelled` is raised in a running job when it reports its progress after being cancelled.
+    """
+    pass
+
+
+class JobQueueFull(Exception):
+    """
+    The :class:`JobQueueFull` is raised when a job is submitted while as many jobs as allowed are waiting.
+    """
+    pass
+
+
+def read_job_json(path: str) -> Optional[Dict[str, Any]]:
+    """
+    The :func:`read_job_json` reads a json file of a job.
+
+    Parameters
+    ----------
+    path: `str`, required
+        The path of the file
+
+    Returns
+    ----------
+    The content of the file, or `None` if it does not exist (e.g. the job is not known or removed already).
+    """
+    try:
+        with open(path, 'r') as handle:
+            return json.load(handle)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def process_is_alive(pid: int) -> bool:
+    """
+    The :func:`process_is_alive` checks whether or not a process (e.g. a worker of the server) is still running.
+
+    Parameters
+    ----------
+    pid: `int`, required
+        The id of the process
+
+    Returns
+    ----------
+    `False` if the process does not exist, `True` otherwise.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobProgress:
+    """
+    The :class:`JobProgress` is handed to each job (in its worker process) to report its progress with. The
+    progress is written to the folder of the job, which every process of the server reads it from, and the
+    cancellation of a running job is noticed when it reports its progress, please refer to :meth:`update`.
+    """
+
+    def __init__(self, job_id: str, job_directory: str):
+        """
+        The constructor method of :class:`JobProgress`
+
+        Parameters
+        ----------
+        job_id: `str`, required
+            The id of the job
+        job_directory: `str`, required
+            The folder of the job (please refer to :meth:`JobQueue.job_directory`)
+        """
+        self.job_id = job_id
+        self.job_directory = job_directory
+
+    def update(self, fraction: float, stage: str) -> None:
+        """
+        The :meth:`update` reports the progress of the job.
+
+        Parameters
+        ----------
+        fraction: `float`, required
+            The fraction of the job that is done, between 0 and 1
+        stage: `str`, required
+            The description of the current stage of the job
+        """
+        if os.path.exists(os.path.join(self.job_directory, 'cancelled')):
+            raise JobCancelled()
+        replace_file(
+            os.path.join(self.job_directory, 'progress.json'),
+            json.dumps({"progress": fraction, "stage": stage}).encode('utf-8')
+        )
+
+    def write_file(self, name: str, body: bytes) -> None:
+        """
+        The :meth:`write_file` keeps a file along with the output of the job, please refer to :meth:`JobQueue.output`.
+
+        Parameters
+        ----------
+        name: `str`, required
+            The name of the file (e.g. `layouts.json`)
+        body: `bytes`, required
+            The content of the file
+        """
+        replace_file(os.path.join(self.job_directory, name), body)
+
+
+def run_job(function: Callable[..., Any], progress: JobProgress, arguments: Dict[str, Any]) -> Any:
+    """
+    The :func:`run_job` runs a job in a worker process of the :class:`JobQueue`.
+
+    Parameters
+    ----------
+    function: `Callable[..., Any]`, required
+        The function of the job, which receives the `progress` and the `arguments` as keyword arguments
+    progress: `JobProgress`, required
+        The progress of the job
+    arguments: `Dict[str, Any]`, required
+        The arguments of the job
+
+    Returns
+    ----------
+    The output of the function.
+    """
+    progress.update(0.0, 'started')
+    return function(progress=progress, **arguments)
+
+
+class JobQueue:
+    """
+    The :class:`JobQueue` runs the long jobs (e.g. the experiments of the ML toolkit) in a pool of processes, so
+    that the requests which submit them return right away with the id of the job, and the status, progress
+    and output of the job are polled afterwards. The jobs which are waiting are cancelled right away, and the
+    running ones once they report their progress next.
+
+    The state of each job (its status, progress, output and cancellation) is kept in a folder of its own, so that
+    the polls which reach the other processes of the server find it, and the limits hold across all of them.
+
+    Similar to the flask extensions, the instance is created at import time, and its limits are read from the
+    application configuration in :meth:`init_app`. Its folder and its pool (with the `spawn` context, as the server
+    is threaded) are only created when the first job is submitted, so that the processes of the server (and the
+    `flask` commands) which never run a job do not start one. The worker processes import the application package
+    without creating the application, so the configuration they need is handed to the `initializer` of the pool.
+    """
+
+    def __init__(
+            self,
+            processes_key: Optional[str] = None,
+            max_queued_key: Optional[str] = None,
+            processes: int = 1,
+            max_queued: int = 8,
+            max_finished: int = 64,
+            directory: str = 'warehouse/jobs',
+            initializer: Optional[Callable[[Dict[str, Any]], None]] = None,
+            initializer_keys: Optional[List[str]] = None
+    ):
+        """
+        The constructor method of :class:`JobQueue`
+
+        Parameters
+        ----------
+        processes_key: `str`, optional (default=None)
+            The key of the configuration parameter which holds the number of processes (the jobs that run at once)
+        max_queued_key: `str`, optional (default=None)
+            The key of the configuration parameter which holds the number of jobs that can wait for a process
+        processes: `int`, optional (default=1)
+            The number of processes, used if the configuration does not include the `processes_key`
+        max_queued: `int`, optional (default=8)
+            The number of jobs that can wait, used if the configuration does not include the `max_queued_key`
+        max_finished: `int`, optional (default=64)
+            The number of finished jobs that are kept (with their outputs) for polling
+        directory: `str`, optional (default='warehouse/jobs')
+            The folder that the jobs are kept in, relative to the root path of the application
+        initializer: `Callable[[Dict[str, Any]], None]`, optional (default=None)
+            The (picklable) function which is called once in each worker process, with the values of the
+            `initializer_keys` in the application configuration (e.g. to apply the budgets of the caches)
+        initializer_keys: `List[str]`, optional (default=None)
+            The keys of the configuration parameters which are handed to the `initializer`
+        """
+        self.processes_key = processes_key
+        self.max_queued_key = max_queued_key
+        self.processes = processes
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.directory = directory
+        self.initializer = initializer
+        self.initializer_keys = initializer_keys or []
+        self.initializer_configuration = dict()
+        self.lock = threading.Lock()
+        self.futures = dict()
+        self.executor = None
+
+    def init_app(self, app) -> None:
+        """
+        The :meth:`init_app` reads the limits, and the configuration of the worker processes, from the application
+        configuration.
+
+        Parameters
+        ----------
+        app: `Flask`, required
+            The application
+        """
+        if self.processes_key is not None:
+            self.processes = app.config.get(self.processes_key, self.processes)
+        if self.max_queued_key is not None:
+            self.max_queued = app.config.get(self.max_queued_key, self.max_queued)
+        self.directory = os.path.join(app.root_path, self.directory)
+        self.initializer_configuration = {e: app.config[e] for e in self.initializer_keys if e in app.config}
+
+    def pool(self) -> ProcessPoolExecutor:
+        """
+        The :meth:`pool` returns the pool of processes, and starts a new one if there is none (e.g. the previous
+        one broke). The caller holds the `lock`.
+
+        Returns
+        ----------
+        The `ProcessPoolExecutor` of the queue.
+        """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=self.initializer,
+                initargs=(self.initializer_configuration,)
+            )
+        return self.executor
+
+    def job_directory(self, job_id: str) -> Optional[str]:
+        """
+        The :meth:`job_directory` returns the folder of a job.
+
+        Parameters
+        ----------
+        job_id: `str`, required
+            The id of the job
+
+        Returns
+        ----------
+        The path of the folder as a `str`, or `None` if the `job_id` is not a valid id.
+        """
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        return os.path.join(self.directory, job_id)
+
+    @contextlib.contextmanager
+    def queue_lock(self) -> Iterator[None]:
+        """
+        The :meth:`queue_lock` holds an exclusive lock on a file of the queue folder, so that the jobs are submitted
+        and finished one at a time across the processes of the server.
+        """
+        with self.lock, open(os.path.join(self.directory, 'queue.lock'), 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def read_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        The :meth:`read_status` reads the recorded status of a job. A job that is not finished while the process
+        that submitted it (and whose pool runs it) is gone is reported as failed.
+
+        Parameters
+        ----------
+        job_id: `str`, required
+            The id of the job
+
+        Returns
+        ----------
+        The recorded status as a `Dict[str, Any]`, or `None` if the job is not known.
+        """
+        job_directory = self.job_directory(job_id)
+        if job_directory is None:
+            return None
+        job = read_job_json(os.path.join(job_directory, 'status.json'))
+        if job is not None and job["status"] not in FINAL_JOB_STATUSES and not process_is_alive(job["pid"]):
+            job.update(status='failed', error="The server process that ran the job has stopped.")
+        return job
+
+    def jobs(self) -> Dict[str, Dict[str, Any]]:
+        """
+        The :meth:`jobs` reads the recorded statuses of all of the jobs.
+
+        Returns
+        ----------
+        A `Dict[str, Dict[str, Any]]` from the ids of the jobs to their statuses (please refer to
+        :meth:`read_status`).
+        """
+        statuses = dict()
+        if not os.path.isdir(self.directory):
+            # no job has been submitted yet
+            return statuses
+        for job_id in os.listdir(self.directory):
+            job = self.read_status(job_id) if os.path.isdir(os.path.join(self.directory, job_id)) else None
+            if job is not None:
+                statuses[job_id] = job
+        return statuses
+
+    def submit(self, function: Callable[..., Any], **arguments) -> str:
+        """
+        The :meth:`submit` queues a job.
+
+        Parameters
+        ----------
+        function: `Callable[..., Any]`, required
+            The function of the job, which has to be picklable (e.g. a module-level function), and receives
+            a :class:`JobProgress` as its `progress` argument along with the `arguments`
+        arguments: `Dict[str, Any]`, required
+            The (picklable) keyword arguments of the function
+
+        Returns
+        ----------
+        The id of the job as a `str`.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self.queue_lock():
+            active = [e for e in self.jobs().values() if e["status"] not in FINAL_JOB_STATUSES]
+            if len(active) >= self.processes + self.max_queued:
+                raise JobQueueFull("There are {} jobs in the queue already.".format(len(active)))
+
+            job_id = uuid.uuid4().hex
+            job_directory = self.job_directory(job_id)
+            os.makedirs(job_directory)
+            job = {
+                "status": 'queued',
+                "submitted": time.time(),
+                "finished": None,
+                "error": None,
+                "pid": os.getpid()
+            }
+            replace_file(os.path.join(job_directory, 'status.json'), json.dumps(job).encode('utf-8'))
+            future = self.pool().submit(run_job, function, JobProgress(job_id, job_directory), arguments)
+            self.futures[job_id] = future
+        future.add_done_callback(partial(self.finish, job_id))
+        return job_id
+
+    def finish(self, job_id: str, future: Future) -> None:
+        """
+        The :meth:`finish` records the output (or the failure) of a job once its future is done, and removes the
+        oldest finished jobs beyond `max_finished`.
+
+        Parameters
+        ----------
+        job_id: `str`, required
+            The id of the job
+        future: `Future`, required
+            The future of the job
+        """
+        output, error = None, None
+        exception = None if future.cancelled() else future.exception()
+        if future.cancelled() or isinstance(exception, JobCancelled):
+            status = 'cancelled'
+        elif exception is not None:
+            status, error = 'failed', "{}: {}".format(type(exception).__name__, exception)
+        else:
+            status, output = 'done', future.result()
+
+        with self.queue_lock():
+            self.futures.pop(job_id, None)
+            if isinstance(exception, BrokenProcessPool):
+                # a worker process was terminated abruptly, the next job starts a new pool
+                self.executor = None
+            job_directory = self.job_directory(job_id)
+            job = read_job_json(os.path.join(job_directory, 'status.json'))
+            if job is None:
+                return
+            if output is not None:
+                replace_file(os.path.join(job_directory, 'output'), output)
+            job.update(status=status, error=error, finished=time.time())
+            replace_file(os.path.join(job_directory, 'status.json'), json.dumps(job).encode('utf-8'))
+
+            finished = sorted(
+                [(v["finished"] or v["submitted"], k) for k, v in self.jobs().items()
+                 if v["status"] in FINAL_JOB_STATUSES])
+            for _, key in finished[:max(len(finished) - self.max_finished, 0)]:
+                shutil.rmtree(self.job_directory(key), ignore_errors=True)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        The :meth:`cancel` cancels a job. The waiting jobs are cancelled right away, and the running ones stop the
+        next time they report their progress (please refer to :meth:`JobProgress.update`).
+
+        Parameters
+        ----------
+        job_id: `str`, required
+            The id of the job
+
+        Returns
+        ----------
+        `True` if the job was waiting or running, `False` if it is not known or finished already.
+        """
+        job = self.read_status(job_id)
+        if job is None or job["status"] in FINAL_JOB_STATUSES:
+            return False
+        replace_file(os.path.join(self.job_directory(job_id), 'cancelled'), b'')
+        with self.lock:
+            future = self.futures.get(job_id)
+        if future is not None and future.cancel():
+            # the done callback of a cancelled future is called right away, which records the status
+            return True
+
+        # the job may be waiting in the pool already (which hands the next jobs to its processes ahead of time), or
+        # in the pool of another process of the server. it stops as soon as it starts, as it is marked cancelled
+        with self.queue_lock():
+            job = self.read_status(job_id)
+            job_directory = self.job_directory(job_id)
+            started = os.path.exists(os.path.join(job_directory, 'progress.json'))
+            if job is not None and job["status"] == 'queued' and not started:
+                job.update(status='cancelled', finished=time.time())
+                replace_file(os.path.join(job_directory, 'status.json'), json.dumps(job).encode('utf-8'))
+        return True
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        The :meth:`status` returns the status of a job.
+
+        Parameters
+        ----------
+        job_id: `str`, required
+            The id of the job
+
+        Returns
+        ----------
+        A `Dict[str, Any]` with the `status` (one of `JOB_STATUSES`), the `progress` (between 0 and 1), the
+        `stage`, the `error` of the failed jobs, whether it is being `cancelled`, and the `submitted` and
+        `finished` times, or `None` if the job is not known.
+        """
+        job = self.read_status(job_id)
+        if job is None:
+            return None
+        job_directory = self.job_directory(job_id)
+        progress = read_job_json(os.path.join(job_directory, 'progress.json'))
+
+        status = job["status"]
+        fraction, stage = (1.0, status) if status in FINAL_JOB_STATUSES else (0.0, 'queued')
+        cancelled = False
+        if status not in FINAL_JOB_STATUSES:
+            cancelled = os.path.exists(os.path.join(job_directory, 'cancelled'))
+            if progress is not None:
+                status, fraction, stage = 'running', progress["progress"], progress["stage"]
+        return {
+            "status": status,
+            "progress": fraction,
+            "stage": stage,
+            "error": job["error"],
+            "cancelled": cancelled,
+            "submitted": job["submitted"],
+            "finished": job["finished"]
+        }
+
+    def output(self, job_id: str, name: str = 'output') -> Optional[bytes]:
+        """
+        The :meth:`output` returns the output of a job, or a file that it kept along with it (please refer to
+        :meth:`JobProgress.write_file`).
+
+        Parameters
+        ----------
+        job_id: `str`, required
+            The id of the job
+        name: `str`, optional (default='output')
+            The name of the file, `output` for the output of the function of the job
+
+        Returns
+        ----------
+        The content of the file as `bytes`, or `None` if the job is not done (or not known), or has no such file.
+        """
+        job = self.read_status(job_id)
+        if job is None or job["status"] != 'done':
+            return None
+        try:
+            with open(os.path.join(self.job_directory(job_id), name), 'rb') as handle:
+                return handle.read()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
@@ -1,91 +1,245 @@
-from typing import List, Any, Tuple
+from typing import List, Any, Tuple, Optional, Dict
 import os
+import json
+import tempfile
 import pandas
 import numpy
-from copy import deepcopy
-from sklearn.utils import shuffle
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.decomposition import PCA
 from sklearn.neural_network import MLPClassifier
 from sklearn.metrics import confusion_matrix
-from plauthor.plotters.matrix import visualize_matrix
 from application import application_directory
-import pickle
-from flask import Response
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-from matplotlib.figure import Figure
+from application.libraries.jobs import JobProgress
+from application.libraries.transformation import guide_columns
+from application.libraries.warehouse import read_transformed_dataframe
 
-def category_to_class(x: Any, category_layout: List[Any]):
-    assert x in category_layout, "the provided category layout is not valid"
-    return int(category_layout.index(x))
+# the ways of handling the categories that are not in the given layout of a column, please refer to
+# :func:`encode_categories`
+UNSEEN_CATEGORY_HANDLINGS = ['error', 'ignore']
+
+# the ways of balancing the labels of the train set, please refer to :func:`stratified_split`
+BALANCING_STRATEGIES = ['none', 'under', 'over']
+
+
+def encode_categories(
+        values: pandas.Series,
+        layout: Optional[List[Any]] = None,
+        unseen: str = 'error'
+) -> Tuple[numpy.ndarray, List[Any]]:
+    """
+    The :func:`encode_categories` encodes the categories of a column as the positions of the categories in its
+    layout. If the layout is not given, it is made of the categories in the order of their first appearance.
+
+    Parameters
+    ----------
+    values: `pandas.Series`, required
+        The categories of the rows (without missing values)
+    layout: `List[Any]`, optional (default=None)
+        The layout to reuse (e.g. the one that a model was trained with)
+    unseen: `str`, optional (default='error')
+        The handling of the categories that are not in the given layout, which is one of
+        `UNSEEN_CATEGORY_HANDLINGS`: either a `ValueError` is raised, or they are encoded as `-1`
+
+    Returns
+    ----------
+    The codes as a `numpy.ndarray` of integers and the layout as a `List[Any]`.
+    """
+    assert unseen in UNSEEN_CATEGORY_HANDLINGS, "unknown handling of the unseen categories: {}".format(unseen)
+    if layout is None:
+        codes, uniques = pandas.factorize(values, sort=False)
+        return codes, uniques.tolist()
+
+    codes = pandas.Index(layout).get_indexer(values)
+    if unseen == 'error' and (codes < 0).any():
+        raise ValueError("The categories {} are not in the layout.".format(
+            pandas.unique(values[codes < 0])[:10].tolist()))
+    return codes, list(layout)
+
+
+def stratified_split(
+        labels: numpy.ndarray,
+        train_fraction: float = 0.8,
+        balancing: str = 'none',
+        seed: int = 2019
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    The :func:`stratified_split` splits the rows into the train and test sets with the same fraction of each
+    label in the train set, and balances the labels of the train set if asked to.
+
+    Parameters
+    ----------
+    labels: `numpy.ndarray`, required
+        The label of each row
+    train_fraction: `float`, optional (default=0.8)
+        The fraction of the rows of each label that are put in the train set
+    balancing: `str`, optional (default='none')
+        One of `BALANCING_STRATEGIES`: the train set is kept as it is (`none`), each label is sampled down to the
+        number of rows of the rarest one without replacement (`under`), or the rows of each label are
+        resampled with replacement up to the number of rows of the most common one (`over`)
+    seed: `int`, optional (default=2019)
+        The seed of the random split and sampling
+
+    Returns
+    ----------
+    The positions of the rows of the train set (shuffled) and of the test set (in order), as `numpy.ndarray`s.
+    """
+    assert balancing in BALANCING_STRATEGIES, "unknown balancing strategy: {}".format(balancing)
+    assert 0.0 < train_fraction < 1.0, "the train fraction has to be between 0 and 1"
+    generator = numpy.random.default_rng(seed)
+
+    # the rows are shuffled, and then grouped by their labels (keeping the shuffled order in each group)
+    permutation = generator.permutation(len(labels))
+    _, groups, counts = numpy.unique(labels[permutation], return_inverse=True, return_counts=True)
+    assert (counts > 5).all(), "not enough example is provided"
+    order = permutation[numpy.argsort(groups, kind='stable')]
+    starts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+    ranks = numpy.arange(len(order)) - numpy.repeat(starts, counts)
+
+    train_counts = numpy.maximum((train_fraction * counts).astype(numpy.int64), 1)
+    in_train = ranks < numpy.repeat(train_counts, counts)
+    train_positions, test_positions = order[in_train], numpy.sort(order[~in_train])
+    train_starts = numpy.concatenate([[0], numpy.cumsum(train_counts)[:-1]])
+
+    if balancing == 'under':
+        train_ranks = ranks[in_train]
+        train_positions = train_positions[train_ranks < train_counts.min()]
+    elif balancing == 'over':
+        # the missing rows of each label are drawn from its own rows of the train set
+        missing = train_counts.max() - train_counts
+        missing_groups = numpy.repeat(numpy.arange(len(counts)), missing)
+        offsets = generator.integers(0, train_counts[missing_groups])
+        train_positions = numpy.concatenate([train_positions, train_positions[train_starts[missing_groups] + offsets]])
+
+    return generator.permutation(train_positions), test_positions
 
 
 def prepare_the_dataframe_for_ml(
         input_dataframe: pandas.DataFrame,
         label_column: str,
-        feature_columns: List[str]
+        feature_columns: List[str],
+        category_layouts: Optional[Dict[str, List[Any]]] = None,
+        unseen: str = 'error',
+        train_fraction: float = 0.8,
+        balancing: str = 'none',
+        seed: int = 2019,
+        dtype: type = numpy.float32
 ):
-    # deep copy just in case
-    input_dataframe = deepcopy(input_dataframe)
+    """
+    The :func:`prepare_the_dataframe_for_ml` encodes the feature and label columns as numbers and splits the rows
+    into the train and test sets.
 
-    # filling all of the not a numbers
-    input_dataframe.fillna(0, inplace=True)
+    Parameters
+    ----------
+    input_dataframe: `pandas.DataFrame`, required
+        The transformed dataframe
+    label_column: `str`, required
+        The label column
+    feature_columns: `List[str]`, required
+        The feature columns
+    category_layouts: `Dict[str, List[Any]]`, optional (default=None)
+        The layouts of the columns to reuse (please refer to :func:`encode_categories`), e.g. the ones of the
+        experiment that a model was trained in, so that the rows it predicts are encoded the same way. The
+        numeric feature columns that have a layout are encoded with it as well.
+    unseen: `str`, optional (default='error')
+        The handling of the labels that are not in the given layout, please refer to :func:`encode_categories`.
+        The rows with such labels are left out. The unseen categories of the features always raise a
+        `ValueError`, as their codes would be fed to the model as values.
+    train_fraction: `float`, optional (default=0.8)
+        Please refer to :func:`stratified_split`.
+    balancing: `str`, optional (default='none')
+        Please refer to :func:`stratified_split`.
+    seed: `int`, optional (default=2019)
+        Please refer to :func:`stratified_split`.
+    dtype: `type`, optional (default=numpy.float32)
+        The dtype of the features, `numpy.float32` or `numpy.float64`
+
+    Returns
+    ----------
+    The features (as c-contiguous matrices of the `dtype`, which are views of the same matrix) and labels (as their
+    positions in the layout) of the train and test sets, the layout of the labels (the numeric labels are laid
+    out in the order of their values), and the layouts of all of the encoded columns as a `Dict[str, List[Any]]`
+    (which are kept along with the outputs of the experiment to be reused).
+    """
+    category_layouts = dict(category_layouts or dict())
 
-    # filtering out features and label columns
+    # filtering out features and label columns, the input itself is never modified (it is shared with the cache)
     input_dataframe = input_dataframe.loc[:, feature_columns + [label_column]]
 
-    # checking feature and label columns and categorizing if necessary
-    for column_name in feature_columns:
-        try:
-            tmp_column = input_dataframe.loc[:, column_name].astype(float)
-            input_dataframe.loc[:, column_name] = tmp_column
-        except Exception as e:
-            try:
-                tmp_column = input_dataframe.loc[:, column_name].astype(str)
-                tmp_layout = tmp_column.unique().tolist()
-                tmp_column = tmp_column.apply(lambda x: category_to_class(x, tmp_layout))
-                input_dataframe.loc[:, column_name] = tmp_column
-            except Exception as e:
-                Exception("Protocol failed on the dataframe, not supported dataset")
-
-    ## for label column
-    column_name = label_column
-    try:
-        tmp_column = input_dataframe.loc[:, column_name].astype(float)
-        input_dataframe.loc[:, column_name] = tmp_column
-    except Exception as e:
-        try:
-            tmp_column = input_dataframe.loc[:, column_name].astype(str)
-            original_label_layout = tmp_column.unique().tolist()
-            tmp_column = tmp_column.apply(lambda x: category_to_class(x, original_label_layout))
-            input_dataframe.loc[:, column_name] = tmp_column
-        except Exception as e:
-            Exception("Protocol failed on the dataframe, not supported dataset")
+    # the compact (categorical and date) columns are turned back into their values so that they can be filled,
+    # the missing dates stay missing rather than becoming 'NaT' values
+    input_dataframe = input_dataframe.astype({
+        column: input_dataframe[column].cat.categories.dtype
+        for column in input_dataframe.columns
+        if isinstance(input_dataframe[column].dtype, pandas.CategoricalDtype)
+    })
+    input_dataframe = input_dataframe.assign(**{
+        column: input_dataframe[column].astype(str).mask(input_dataframe[column].isna())
+        for column in input_dataframe.columns
+        if pandas.api.types.is_datetime64_any_dtype(input_dataframe[column].dtype)
+    })
 
-    list_of_labels = input_dataframe.loc[:, label_column].unique().tolist()
+    # filling all of the not a numbers
+    input_dataframe = input_dataframe.fillna(0)
 
-    train_dfs = []
-    test_dfs = []
+    # checking feature and label columns and categorizing if necessary
+    for column_name in feature_columns + [label_column]:
+        column_unseen = unseen if column_name == label_column else 'error'
+        try:
+            input_dataframe[column_name] = input_dataframe.loc[:, column_name].astype(float)
+        except Exception:
+            codes, category_layouts[column_name] = encode_categories(
+                input_dataframe.loc[:, column_name].astype(str),
+                layout=category_layouts.get(column_name),
+                unseen=column_unseen
+            )
+            input_dataframe[column_name] = codes
+        else:
+            if column_name in category_layouts and column_name != label_column:
+                codes, category_layouts[column_name] = encode_categories(
+                    input_dataframe.loc[:, column_name],
+                    layout=category_layouts[column_name],
+                    unseen=column_unseen
+                )
+                input_dataframe[column_name] = codes
+            elif column_name == label_column:
+                # the numeric labels are encoded the same way, laid out in the order of their values
+                values = input_dataframe.loc[:, column_name]
+                layout = numpy.unique(values.to_numpy())
+                if numpy.all(numpy.mod(layout, 1) == 0):
+                    layout = layout.astype(numpy.int64)
+                codes, category_layouts[column_name] = encode_categories(
+                    values,
+                    layout=category_layouts.get(column_name, layout.tolist()),
+                    unseen=unseen
+                )
+                input_dataframe[column_name] = codes
 
-    for label in list_of_labels:
-        sub_dataframe = input_dataframe[input_dataframe[label_column] == label]
-        assert sub_dataframe.shape[0] > 5, "not enough example is provided"
-        test_example_count = int(0.2 * sub_dataframe.shape[0])
-        test_dfs.append(sub_dataframe.iloc[test_example_count:, :])
-        train_dfs.append(sub_dataframe.iloc[:test_example_count, :].sample(n=1000, replace=True))
+    original_label_layout = category_layouts[label_column]
+    # the rows with the labels that are not in the layout cannot be used
+    input_dataframe = input_dataframe[input_dataframe[label_column].to_numpy() >= 0]
 
-    train_dataframe = shuffle(pandas.concat(train_dfs))
-    test_dataframe = pandas.concat(test_dfs)
+    labels = input_dataframe[label_column].to_numpy().astype(numpy.int64)
+    train_positions, test_positions = stratified_split(
+        labels,
+        train_fraction=train_fraction,
+        balancing=balancing,
+        seed=seed
+    )
 
-    X_train = train_dataframe.to_numpy()
-    y_train = X_train[:, -1].ravel()
-    X_train = X_train[:, :-1]
+    # the features are put together once in a single c-contiguous matrix of the requested dtype, which every
+    # stage of the experiment works on without converting it again. its rows are ordered as the train set followed
+    # by the test set, so that both sets are slices (views) of it rather than copies
+    positions = numpy.concatenate([train_positions, test_positions])
+    features = numpy.empty((len(positions), len(feature_columns)), dtype=dtype, order='C')
+    for index, column_name in enumerate(feature_columns):
+        features[:, index] = input_dataframe[column_name].to_numpy()[positions]
+    labels = labels[positions]
 
-    X_test = test_dataframe.to_numpy()
-    y_test = X_test[:, -1].ravel()
-    X_test = X_test[:, :-1]
+    number_of_train_rows = len(train_positions)
+    X_train, y_train = features[:number_of_train_rows], labels[:number_of_train_rows]
+    X_test, y_test = features[number_of_train_rows:], labels[number_of_train_rows:]
 
-    return X_train, y_train, X_test, y_test, original_label_layout
+    return X_train, y_train, X_test, y_test, original_label_layout, category_layouts
 
 
 def ffnn_experiment(
@@ -96,15 +250,21 @@ def ffnn_experiment(
         list_of_labels: List[Any],
         hidden_layer_config: Tuple[int] = (60,2),
         perform_pca: int = 1,
-        pca_dim: int = 50
+        pca_dim: int = 50,
+        output_path: Optional[str] = None,
+        progress: Optional[JobProgress] = None
 ):
-    output_path = os.path.join(application_directory, 'static/ml_toolkit/ffnn_experiment.png')
+    if output_path is None:
+        output_path = os.path.join(application_directory, 'static/ml_toolkit/ffnn_experiment.png')
 
-    if os.path.isfile(output_path):
-        os.system('rm ' + output_path)
+    if os.path.exists(output_path):
+        os.remove(output_path)
 
-    # min-max scaling
-    scaler = MinMaxScaler()
+    if progress is not None:
+        progress.update(0.2, 'scaling')
+
+    # min-max scaling (in place, keeping the dtype of the features)
+    scaler = MinMaxScaler(copy=False)
 
     # fitting the scaler
     scaler.fit(X_train)
@@ -115,9 +275,10 @@ def ffnn_experiment(
 
     # pca
     if perform_pca == 1:
+        if progress is not None:
+            progress.update(0.3, 'pca')
         pca = PCA(n_components=pca_dim)
         pca.fit(X_train)
-        coverage = numpy.sum(pca.explained_variance_ratio_)
         X_train = pca.transform(X_train)
         X_test = pca.transform(X_test)
 
@@ -130,11 +291,112 @@ def ffnn_experiment(
         max_iter=1000,
         shuffle=True)
 
+    if progress is not None:
+        progress.update(0.4, 'training')
+
     classifier.fit(X_train, y_train.ravel())
 
+    if progress is not None:
+        progress.update(0.9, 'evaluating')
+
     y_pred = classifier.predict(X_test)
 
-    conf_mat = confusion_matrix(y_pred, y_test, numpy.arange(len(list_of_labels)).tolist())
+    conf_mat = confusion_matrix(y_pred, y_test, labels=numpy.arange(len(list_of_labels)).tolist())
+
+    if progress is not None:
+        progress.update(0.95, 'rendering')
+
+    # plauthor is only needed for rendering, so the rest of the toolkit can be used without it
+    from plauthor.plotters.matrix import visualize_matrix
+    visualize_matrix(
+        conf_mat, column_names=list_of_labels, row_names=list_of_labels, save_to_file=output_path, show=False,
+        figure_size=10.0)
+
+
+def ffnn_experiment_job(
+        progress: JobProgress,
+        dataframe: Any,
+        guide: Dict[Any, Any],
+        label_column: str,
+        feature_columns: List[str],
+        hidden_layer_config: Tuple[int] = (60, 2),
+        pca_dim: int = 0,
+        train_fraction: float = 0.8,
+        balancing: str = 'none',
+        seed: int = 2019,
+        category_layouts: Optional[Dict[str, List[Any]]] = None
+) -> bytes:
+    """
+    The :func:`ffnn_experiment_job` runs an experiment of the ML toolkit (please refer to
+    :func:`prepare_the_dataframe_for_ml` and :func:`ffnn_experiment`) as a job of the
+    :class:`application.libraries.jobs.JobQueue`. The dataframe is read and transformed in the worker process
+    (from its columnar copy, if it is up to date), so that only the entity and the guide are passed to it. The
+    layouts of the encoded columns are kept in the `layouts.json` file of the job, to be reused by the experiments
+    (or the predictions) that follow it.
+
+    Parameters
+    ----------
+    progress: `JobProgress`, required
+        The progress of the job
+    dataframe: `SimpleNamespace`, required
+        The registered dataframe, detached from the database session (please refer to
+        :func:`application.libraries.warehouse.detached_dataframe`)
+    guide: `Dict[Any, Any]`, required
+        The guide which is applied to the dataframe
+    label_column: `str`, required
+        The label column
+    feature_columns: `List[str]`, required
+        The feature columns
+    hidden_layer_config: `Tuple[int]`, optional (default=(60, 2))
+        The sizes of the hidden layers
+    pca_dim: `int`, optional (default=0)
+        The number of principal components, the features are used as they are if it is 0
+    train_fraction: `float`, optional (default=0.8)
+        Please refer to :func:`stratified_split`.
+    balancing: `str`, optional (default='none')
+        Please refer to :func:`stratified_split`.
+    seed: `int`, optional (default=2019)
+        Please refer to :func:`stratified_split`.
+    category_layouts: `Dict[str, List[Any]]`, optional (default=None)
+        The layouts to reuse, please refer to :func:`prepare_the_dataframe_for_ml`.
+
+    Returns
+    ----------
+    The confusion matrix of the experiment as the `bytes` of a png picture.
+    """
+    progress.update(0.02, 'reading')
+    input_dataframe = read_transformed_dataframe(
+        dataframe,
+        guide=guide,
+        columns=feature_columns + [label_column] + guide_columns(guide)
+    ).loc[:, feature_columns + [label_column]]
 
-    visualize_matrix(conf_mat, column_names=list_of_labels, row_names=list_of_labels, save_to_file=output_path, show=False, figure_size=10.0)
+    progress.update(0.05, 'preparing')
+    X_train, y_train, X_test, y_test, original_label_layout, category_layouts = prepare_the_dataframe_for_ml(
+        input_dataframe=input_dataframe,
+        label_column=label_column,
+        feature_columns=feature_columns,
+        category_layouts=category_layouts,
+        train_fraction=train_fraction,
+        balancing=balancing,
+        seed=seed
+    )
+    progress.write_file('layouts.json', json.dumps(category_layouts).encode('utf-8'))
 
+    # each job draws its own picture, so that the concurrent jobs do not overwrite each other's
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, 'ffnn_experiment.png')
+        ffnn_experiment(
+            X_train=X_train,
+            X_test=X_test,
+            y_train=y_train,
+            y_test=y_test,
+            list_of_labels=original_label_layout,
+            perform_pca=int(pca_dim > 0),
+            pca_dim=pca_dim,
+            hidden_layer_config=hidden_layer_config,
+            output_path=output_path,
+            progress=progress
+        )
+        with open(output_path, 'rb') as handle:
+            return handle.read()
@@ -0,0 +1,200 @@
+import os
+import uuid
+import shutil
+import numpy
+import pandas
+import pyarrow
+import pyarrow.parquet
+from typing import List, Optional, Any, Iterator
+from application import application_directory
+from application.libraries.files import temporary_path, replaced_file
+from application.libraries.rollups import SUBJECT_COLUMN, subject_key
+
+# the rows of each subject are kept in a file of their own in this folder (relative to the application directory)
+PARTITION_DIRECTORY = 'warehouse/partitions'
+
+
+def build_partitions(dataframe_entity) -> None:
+    """
+    The :func:`build_partitions` splits the columnar copy of a registered dataframe which has a `SUBJECT_COLUMN`
+    into one parquet file per subject, so that the visualizations of a subject only read its rows (please refer
+    to :func:`application.libraries.warehouse.read_registered_dataframe`). The index from each subject (please
+    refer to :func:`subject_key`) to the path of its file is kept in the `partitions` of the entity, and the rows
+    without a subject are left out of the partitions. The files are written under new names, and the ones of the
+    previous version of the entity are only removed once it is committed (please refer to :func:`sweep_partitions`).
+    The entity is updated in place, and committing it is left to the caller.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    """
+    directory = os.path.join(PARTITION_DIRECTORY, str(dataframe_entity.id))
+    parquet_file = None if dataframe_entity.columnar_relative_path is None else pyarrow.parquet.ParquetFile(
+        os.path.join(application_directory, dataframe_entity.columnar_relative_path))
+    if parquet_file is None or SUBJECT_COLUMN not in parquet_file.schema_arrow.names:
+        dataframe_entity.partitions = None
+        return
+
+    os.makedirs(os.path.join(application_directory, directory), exist_ok=True)
+    version = uuid.uuid4().hex
+    index, writers, temporary_paths = dict(), dict(), dict()
+    try:
+        for row_group in range(parquet_file.num_row_groups):
+            for subject, table in subject_slices(parquet_file.read_row_group(row_group)):
+                if subject not in writers:
+                    index[subject] = os.path.join(directory, '{}-{}.parquet'.format(len(index), version))
+                    # writing to temporary files first so that a failed build leaves no partial partition
+                    temporary_paths[subject] = temporary_path(os.path.join(application_directory, index[subject]))
+                    writers[subject] = pyarrow.parquet.ParquetWriter(
+                        temporary_paths[subject], parquet_file.schema_arrow)
+                writers[subject].write_table(table)
+        for writer in writers.values():
+            writer.close()
+        for subject, relative_path in index.items():
+            os.replace(temporary_paths[subject], os.path.join(application_directory, relative_path))
+    finally:
+        for writer in writers.values():
+            writer.close()
+        for path in temporary_paths.values():
+            if os.path.isfile(path):
+                os.remove(path)
+
+    dataframe_entity.partitions = {"column": SUBJECT_COLUMN, "index": index}
+
+
+def subject_slices(table: pyarrow.Table) -> Iterator[Any]:
+    """
+    The :func:`subject_slices` splits the rows of a table by their subjects, the rows without a subject are left out.
+
+    Parameters
+    ----------
+    table: `pyarrow.Table`, required
+        The rows, including the `SUBJECT_COLUMN`
+
+    Returns
+    ----------
+    This generator yields the subject (please refer to :func:`subject_key`) and the table of its rows (in their
+    order) for each subject.
+    """
+    codes, subjects = pandas.factorize(table.column(SUBJECT_COLUMN).to_pandas())
+    # sorting the rows by subject once, so that the rows of each subject are a single slice
+    order = numpy.argsort(codes, kind='stable')
+    table = table.take(pyarrow.array(order))
+    counts = numpy.bincount(codes[codes >= 0], minlength=len(subjects))
+    start = int((codes < 0).sum())
+    for subject, count in zip(subjects, counts):
+        yield subject_key(subject), table.slice(start, int(count))
+        start += int(count)
+
+
+def append_partitions(dataframe_entity, number_of_rows: int) -> None:
+    """
+    The :func:`append_partitions` adds the rows which were appended to the columnar copy of a registered dataframe
+    to the partitions of their subjects (please refer to :func:`build_partitions`). Only the files of the subjects
+    of the new rows are written again, under new names, and the files they replace are only removed once the entity
+    is committed (please refer to :func:`sweep_partitions`). The entity is updated in place, and committing it is
+    left to the caller.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    number_of_rows: `int`, required
+        The number of rows of the columnar copy before the rows were appended
+    """
+    if dataframe_entity.partitions is None:
+        return
+    directory = os.path.join(PARTITION_DIRECTORY, str(dataframe_entity.id))
+    os.makedirs(os.path.join(application_directory, directory), exist_ok=True)
+    parquet_file = pyarrow.parquet.ParquetFile(
+        os.path.join(application_directory, dataframe_entity.columnar_relative_path))
+
+    appended, offset = dict(), 0
+    for row_group in range(parquet_file.num_row_groups):
+        rows = parquet_file.metadata.row_group(row_group).num_rows
+        if offset + rows > number_of_rows:
+            table = parquet_file.read_row_group(row_group)
+            table = table.slice(max(number_of_rows - offset, 0))
+            for subject, rows_of_subject in subject_slices(table):
+                appended.setdefault(subject, []).append(rows_of_subject)
+        offset += rows
+
+    index = dict(dataframe_entity.partitions["index"])
+    for subject, tables in appended.items():
+        if subject in index:
+            tables = [pyarrow.parquet.read_table(os.path.join(application_directory, index[subject]))] + tables
+        relative_path = os.path.join(directory, '{}-{}.parquet'.format(len(index), uuid.uuid4().hex))
+        with replaced_file(os.path.join(application_directory, relative_path)) as handle:
+            pyarrow.parquet.write_table(pyarrow.concat_tables(tables).cast(parquet_file.schema_arrow), handle)
+        index[subject] = relative_path
+    dataframe_entity.partitions = dict(dataframe_entity.partitions, index=index)
+
+
+def sweep_partitions(dataframe_entity) -> None:
+    """
+    The :func:`sweep_partitions` removes the partition files of a registered dataframe which its (committed) entity
+    does not refer to anymore, namely the ones replaced by :func:`build_partitions` or :func:`append_partitions`.
+    It is called after the entity is committed, so that the readers of the previous version never miss its files.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    """
+    directory = os.path.join(application_directory, PARTITION_DIRECTORY, str(dataframe_entity.id))
+    if not os.path.isdir(directory):
+        return
+    if dataframe_entity.partitions is None:
+        shutil.rmtree(directory)
+        return
+    kept = set(os.path.basename(e) for e in dataframe_entity.partitions["index"].values())
+    for name in os.listdir(directory):
+        if name not in kept:
+            os.remove(os.path.join(directory, name))
+
+
+def requested_partition(dataframe_entity, partition: Optional[Any]) -> Optional[str]:
+    """
+    The :func:`requested_partition` finds the partition which has to be read.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    partition: `Any`, optional
+        The requested subject, or `None` for all of the rows
+
+    Returns
+    ----------
+    The subject as a `str` (please refer to :func:`subject_key`), or `None` if all of the rows have to be read
+    (which is also the case for the dataframes that are not partitioned).
+    """
+    if partition is None or dataframe_entity.partitions is None:
+        return None
+    return subject_key(partition)
+
+
+def read_partition(dataframe_entity, partition: str, columns: List[str]) -> pandas.DataFrame:
+    """
+    The :func:`read_partition` reads the columns of the rows of a subject, please refer to :func:`build_partitions`.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    partition: `str`, required
+        The subject
+    columns: `List[str]`, required
+        The columns
+
+    Returns
+    ----------
+    The `pandas.DataFrame` of the rows of the subject, which is empty if the subject has no rows.
+    """
+    relative_path = dataframe_entity.partitions["index"].get(partition)
+    if relative_path is None:
+        return pyarrow.parquet.read_schema(
+            os.path.join(application_directory, dataframe_entity.columnar_relative_path)
+        ).empty_table().select(columns).to_pandas()
+    return pandas.read_parquet(os.path.join(application_directory, relative_path), columns=columns)
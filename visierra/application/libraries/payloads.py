@@ -0,0 +1,226 @@
+import os
+import re
+import time
+import gzip
+import json
+import uuid
+import base64
+import hashlib
+import pandas
+from markupsafe import Markup
+from typing import Optional, Tuple, Any
+from application import application_directory, chart_payload_cache
+from application.libraries.files import replaced_file
+
+# the formats that the chart data can be served in, and their mime types
+PAYLOAD_FORMATS = {
+    "csv": "text/csv",
+    "columnar_json": "application/json"
+}
+
+# the level of the gzip compression of the payloads, the faster levels compress the repetitive chart data well enough
+COMPRESSION_LEVEL = 5
+
+# the shared payloads are kept in this folder (relative to the application directory) as well, so that the requests
+# which reach the other processes of the server find them, and the ones older than `PAYLOAD_MAX_AGE` seconds are
+# removed by `flask payloads sweep`
+PAYLOAD_DIRECTORY = 'warehouse/payloads'
+PAYLOAD_MAX_AGE = 24 * 3600
+
+# the tokens are hex digests (please refer to :func:`store_payload` and :func:`payload_token`)
+TOKEN_PATTERN = re.compile(r'^[0-9a-f]{32,64}$')
+
+
+def serialize_payload(dataframe: pandas.DataFrame, payload_format: str = 'csv') -> bytes:
+    """
+    The :func:`serialize_payload` serializes the morphed data of a visualization in one of the `PAYLOAD_FORMATS`:
+
+    - `csv`: the rows in csv format, similar to `DataFrame.to_csv`.
+    - `columnar_json`: a json object with the `columns` (in order), the `length`, the `dtypes` of the columns and
+      the `data`, which holds the array of the values of each column (the missing values are `null`), so that
+      the numeric columns are read into typed arrays without parsing each row.
+
+    Parameters
+    ----------
+    dataframe: `pandas.DataFrame`, required
+        The morphed data of the visualization
+    payload_format: `str`, optional (default='csv')
+        One of the `PAYLOAD_FORMATS`
+
+    Returns
+    ----------
+    The serialized payload as `bytes`.
+    """
+    if payload_format == 'csv':
+        return dataframe.to_csv(index=False).encode('utf-8')
+    elif payload_format == 'columnar_json':
+        data = dict()
+        for column in dataframe.columns:
+            values = dataframe[column]
+            if not (pandas.api.types.is_numeric_dtype(values.dtype) or pandas.api.types.is_bool_dtype(values.dtype)):
+                values = values.astype(object).map(str, na_action='ignore')
+            if values.isna().any():
+                values = values.astype(object).where(values.notna(), None)
+            data[str(column)] = values.tolist()
+        return json.dumps({
+            "columns": [str(e) for e in dataframe.columns],
+            "length": int(dataframe.shape[0]),
+            "dtypes": {str(e): str(dataframe[e].dtype) for e in dataframe.columns},
+            "data": data
+        }, separators=(',', ':')).encode('utf-8')
+    else:
+        raise ValueError("unknown payload format: {}".format(payload_format))
+
+
+def inline_payload(body: bytes, mimetype: str) -> Markup:
+    """
+    The :func:`inline_payload` writes a payload as a JavaScript expression, so that it is put in the rendered page
+    itself rather than stored and fetched again: the json payloads (e.g. the `columnar_json` chart data) are
+    written as they are, and the others (e.g. the rendered pictures) as the string of a data URL. The characters
+    which could end the script element early are escaped.
+
+    Parameters
+    ----------
+    body: `bytes`, required
+        The payload
+    mimetype: `str`, required
+        The mime type of the payload
+
+    Returns
+    ----------
+    The expression as `Markup`, which is not escaped again by the templates.
+    """
+    if mimetype == PAYLOAD_FORMATS["columnar_json"]:
+        expression = body.decode('utf-8')
+    else:
+        expression = json.dumps('data:{};base64,{}'.format(mimetype, base64.b64encode(body).decode('ascii')))
+    return Markup(expression.replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026'))
+
+
+def store_payload(
+        body: bytes,
+        mimetype: str,
+        compress: bool = False,
+        token: Optional[str] = None,
+        shared: bool = True
+) -> str:
+    """
+    The :func:`store_payload` keeps a payload (e.g. the data of a chart or a rendered picture) in the process-wide
+    `chart_payload_cache`, and if it is `shared`, in a file of the `PAYLOAD_DIRECTORY` which the other processes of
+    the server read it from (please refer to :func:`chart_payload`).
+
+    Parameters
+    ----------
+    body: `bytes`, required
+        The payload
+    mimetype: `str`, required
+        The mime type of the payload
+    compress: `bool`, optional (default=False)
+        Whether or not to keep the payload compressed with gzip (which is not useful for the compressed
+        formats, such as png)
+    token: `str`, optional (default=None)
+        The token of the payload (please refer to :func:`payload_token`), if `None`, a new one is used.
+    shared: `bool`, optional (default=True)
+        Whether or not to write the payload to its file, which is only needed for the payloads that the pages
+        fetch by their token (please refer to :func:`inline_payload` for the others).
+
+    Returns
+    ----------
+    The token of the payload as a `str`.
+    """
+    entity_tag = hashlib.sha1(body).hexdigest()
+    if compress:
+        body = gzip.compress(body, compresslevel=COMPRESSION_LEVEL)
+    if token is None:
+        token = uuid.uuid4().hex
+    payload = (body, entity_tag, mimetype, compress)
+    chart_payload_cache.put(token, payload, size=len(body))
+    if not shared:
+        return token
+
+    payload_path = os.path.join(application_directory, PAYLOAD_DIRECTORY, token)
+    os.makedirs(os.path.dirname(payload_path), exist_ok=True)
+    # the other processes never read a partial payload
+    with replaced_file(payload_path) as handle:
+        header = {"entity_tag": entity_tag, "mimetype": mimetype, "compressed": compress}
+        handle.write(json.dumps(header).encode('utf-8'))
+        handle.write(b'\n')
+        handle.write(body)
+    return token
+
+
+def remove_old_payloads(max_age: float = PAYLOAD_MAX_AGE) -> int:
+    """
+    The :func:`remove_old_payloads` removes the files of the payloads which are older than `max_age` seconds. It is
+    not called while handling the requests, but by the `flask payloads sweep` command.
+
+    Parameters
+    ----------
+    max_age: `float`, optional (default=PAYLOAD_MAX_AGE)
+        The age (in seconds) of the oldest payloads that are kept
+
+    Returns
+    ----------
+    The number of removed payloads as an `int`.
+    """
+    directory = os.path.join(application_directory, PAYLOAD_DIRECTORY)
+    if not os.path.isdir(directory):
+        return 0
+    now, removed = time.time(), 0
+    for name in os.listdir(directory):
+        try:
+            if now - os.path.getmtime(os.path.join(directory, name)) > max_age:
+                os.remove(os.path.join(directory, name))
+                removed += 1
+        except FileNotFoundError:
+            # removed by another process in the meantime
+            pass
+    return removed
+
+
+def payload_token(*parts: Any) -> str:
+    """
+    The :func:`payload_token` finds the token of a payload which only depends on its parts (e.g. the version of
+    the dataframe and the guide that a picture is rendered from), so that it is stored once and reused.
+
+    Parameters
+    ----------
+    parts: `Any`, required
+        The parts, which have to be json serializable
+
+    Returns
+    ----------
+    The token as a `str`.
+    """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def chart_payload(token: str) -> Optional[Tuple[bytes, str, str, bool]]:
+    """
+    The :func:`chart_payload` finds the payload which was stored by :func:`store_payload`, in the process-wide
+    `chart_payload_cache` or else in its file (e.g. if it was stored by another process of the server).
+
+    Parameters
+    ----------
+    token: `str`, required
+        The token of the payload
+
+    Returns
+    ----------
+    The body of the payload as `bytes`, its entity tag (the digest of the uncompressed body), its mime type and
+    whether or not the body is compressed with gzip, or `None` if the token is not known (or the payload was
+    removed).
+    """
+    payload = chart_payload_cache.get(token)
+    if payload is not None or TOKEN_PATTERN.match(token) is None:
+        return payload
+
+    try:
+        with open(os.path.join(application_directory, PAYLOAD_DIRECTORY, token), 'rb') as handle:
+            header = json.loads(handle.readline().decode('utf-8'))
+            body = handle.read()
+    except FileNotFoundError:
+        return None
+    payload = (body, header["entity_tag"], header["mimetype"], header["compressed"])
+    chart_payload_cache.put(token, payload, size=len(body))
+    return payload
@@ -0,0 +1,233 @@
+import os
+import hashlib
+import numpy
+import pandas
+from typing import List, Optional, Dict, Any, Iterator
+from application.libraries.dates import quantize_dates
+
+# the rollups of the registered step dataframes are kept in this folder (relative to the application directory)
+ROLLUP_DIRECTORY = 'warehouse/rollups'
+
+# the columns of a step dataframe, and the (optional) column which identifies the subject of each row
+STEP_COLUMNS = ['timestamp', 'step_type', 'number_of_steps']
+SUBJECT_COLUMN = 'subject'
+
+# the resolutions that the rollups are kept at, the coarser ones are computed from the `day` buckets
+ROLLUP_RESOLUTIONS = ['day', 'month', 'year']
+
+# number of bytes at the end of the csv file which are compared to make sure the file was only appended to
+TAIL_SIZE = 4096
+
+
+def is_step_dataframe(columns: List[str]) -> bool:
+    """
+    The :func:`is_step_dataframe` checks whether a dataframe holds step data, for which rollups are kept.
+
+    Parameters
+    ----------
+    columns: `List[str]`, required
+        The columns of the dataframe
+
+    Returns
+    ----------
+    `True` if the dataframe has all of the `STEP_COLUMNS`.
+    """
+    return all(e in columns for e in STEP_COLUMNS)
+
+
+def aggregate_steps(dataframe: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    The :func:`aggregate_steps` sums up the steps of a chunk of step data per (subject, day, step type). The
+    missing subjects, days and step types are kept as buckets of their own, so that the rollup can answer
+    everything that the raw rows can.
+
+    Parameters
+    ----------
+    dataframe: `pandas.DataFrame`, required
+        The step data, including the `STEP_COLUMNS` and optionally the `SUBJECT_COLUMN`
+
+    Returns
+    ----------
+    The `pandas.DataFrame` with the `subject`, `timestamp` (`yyyymmdd` as a nullable integer), `step_type` and
+    the sum of the `number_of_steps` of each bucket.
+    """
+    timestamps = pandas.Series(pandas.NA, index=dataframe.index, dtype='Int64')
+    present = dataframe['timestamp'].notna().to_numpy()
+    timestamps[present] = quantize_dates(dataframe['timestamp'][present], 'day')
+
+    buckets = pandas.DataFrame({
+        'subject': dataframe[SUBJECT_COLUMN].astype(object) if SUBJECT_COLUMN in dataframe.columns else None,
+        'timestamp': timestamps,
+        'step_type': dataframe['step_type'].astype(object),
+        'number_of_steps': dataframe['number_of_steps']
+    }, index=dataframe.index)
+    return buckets.groupby(['subject', 'timestamp', 'step_type'], dropna=False, sort=False).agg(
+        number_of_steps=('number_of_steps', 'sum')).reset_index()
+
+
+def merge_rollups(rollups: List[pandas.DataFrame]) -> pandas.DataFrame:
+    """
+    The :func:`merge_rollups` adds up the buckets of several rollups (e.g. of the chunks of a dataframe, or of
+    its existing rows and the appended ones), please refer to :func:`aggregate_steps`.
+
+    Parameters
+    ----------
+    rollups: `List[pandas.DataFrame]`, required
+        The rollups at the `day` resolution
+
+    Returns
+    ----------
+    The merged rollup, sorted by subject, timestamp and step type.
+    """
+    rollup = pandas.concat(rollups, ignore_index=True)
+    rollup['number_of_steps'] = rollup['number_of_steps'].astype('int64' if all(
+        pandas.api.types.is_integer_dtype(e['number_of_steps'].dtype) for e in rollups) else 'float64')
+    return rollup.groupby(['subject', 'timestamp', 'step_type'], dropna=False).agg(
+        number_of_steps=('number_of_steps', 'sum')).reset_index()
+
+
+def rollup_resolutions(rollup: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    The :func:`rollup_resolutions` computes the `month` and `year` buckets from the `day` buckets of a rollup,
+    in which the timestamps are quantized the same way as :func:`quantize_dates`.
+
+    Parameters
+    ----------
+    rollup: `pandas.DataFrame`, required
+        The rollup at the `day` resolution
+
+    Returns
+    ----------
+    The rollup at all of the `ROLLUP_RESOLUTIONS`, with the `resolution` of each bucket as an extra column.
+    """
+    levels = []
+    for resolution, divisor in zip(ROLLUP_RESOLUTIONS, [1, 100, 10000]):
+        level = rollup.assign(timestamp=rollup['timestamp'] // divisor)
+        if divisor > 1:
+            level = merge_rollups([level])
+        levels.append(level.assign(resolution=resolution))
+    return pandas.concat(levels, ignore_index=True).loc[
+        :, ['resolution', 'subject', 'timestamp', 'step_type', 'number_of_steps']]
+
+
+def file_state(csv_path: str) -> Dict[str, Any]:
+    """
+    The :func:`file_state` records the size of a csv file and the digest of its last `TAIL_SIZE` bytes, which
+    help with finding out whether the file was only appended to later on.
+
+    Parameters
+    ----------
+    csv_path: `str`, required
+        The path to the csv file
+
+    Returns
+    ----------
+    A `Dict[str, Any]` with the `size` and the `tail_digest` of the file.
+    """
+    size = os.path.getsize(csv_path)
+    return {"size": size, "tail_digest": tail_digest(csv_path, size)}
+
+
+def tail_digest(csv_path: str, size: int) -> str:
+    """
+    The :func:`tail_digest` computes the digest of the `TAIL_SIZE` bytes before a position in a file.
+
+    Parameters
+    ----------
+    csv_path: `str`, required
+        The path to the file
+    size: `int`, required
+        The position
+
+    Returns
+    ----------
+    The hex digest as a `str`.
+    """
+    with open(csv_path, 'rb') as handle:
+        handle.seek(max(size - TAIL_SIZE, 0))
+        return hashlib.sha1(handle.read(size - max(size - TAIL_SIZE, 0))).hexdigest()
+
+
+def appended_chunks(csv_path: str, state: Dict[str, Any], chunk_size: int) -> Optional[Iterator[pandas.DataFrame]]:
+    """
+    The :func:`appended_chunks` reads the rows that were appended to a csv file since its state was recorded
+    (please refer to :func:`file_state`), without parsing the rows before them.
+
+    Parameters
+    ----------
+    csv_path: `str`, required
+        The path to the csv file
+    state: `Dict[str, Any]`, required
+        The recorded state of the file
+    chunk_size: `int`, required
+        The number of rows in each chunk
+
+    Returns
+    ----------
+    An iterator over the chunks of the appended rows, or `None` if the file was changed in any other way
+    (in which case the rollup has to be built again).
+    """
+    size = os.path.getsize(csv_path)
+    if size < state["size"] or tail_digest(csv_path, state["size"]) != state["tail_digest"]:
+        return None
+    with open(csv_path, 'rb') as handle:
+        handle.seek(max(state["size"] - 1, 0))
+        if state["size"] > 0 and handle.read(1) != b'\n':
+            # the last row was not complete when the state was recorded
+            return None
+
+    def chunks():
+        columns = pandas.read_csv(csv_path, nrows=0).columns.tolist()
+        with open(csv_path, 'rb') as handle:
+            handle.seek(state["size"])
+            if size > state["size"]:
+                for chunk in pandas.read_csv(handle, header=None, names=columns, chunksize=chunk_size):
+                    yield chunk
+
+    return chunks()
+
+
+def subject_key(subject: Any) -> str:
+    """
+    The :func:`subject_key` writes a subject as the `str` that the partitions and rollups are looked up by. The
+    subjects of a numeric column (e.g. `12.0`, if some rows have no subject) are written as the user types them
+    (`12`).
+
+    Parameters
+    ----------
+    subject: `Any`, required
+        The subject
+
+    Returns
+    ----------
+    The subject as a `str`.
+    """
+    if isinstance(subject, (float, numpy.floating)) and float(subject).is_integer():
+        return str(int(subject))
+    return str(subject)
+
+
+def subject_buckets(rollup: pandas.DataFrame, subject: Any, has_subject_column: bool) -> pandas.DataFrame:
+    """
+    The :func:`subject_buckets` keeps the buckets of a subject, the same way as the partitions of the registered
+    dataframes (please refer to :func:`application.libraries.partitions.build_partitions`) keep its rows: the
+    rollups of the dataframes without a `SUBJECT_COLUMN` are kept as they are, and the buckets without a subject
+    are left out otherwise.
+
+    Parameters
+    ----------
+    rollup: `pandas.DataFrame`, required
+        The rollup
+    subject: `Any`, required
+        The subject
+    has_subject_column: `bool`, required
+        Whether or not the dataframe of the rollup has a `SUBJECT_COLUMN`
+
+    Returns
+    ----------
+    The buckets of the subject.
+    """
+    if not has_subject_column:
+        return rollup
+    subjects = rollup['subject']
+    return rollup[subjects.notna().to_numpy() & (subjects.map(subject_key) == subject_key(subject)).to_numpy()]
@@ -0,0 +1,431 @@
+import threading
+import multiprocessing
+import numpy
+import pandas
+import pyarrow
+import pyarrow.compute
+import scipy.sparse
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Optional, Iterator, Tuple, Callable, Any
+from wordcloud import STOPWORDS as WORD_CLOUD_STOPWORDS
+from wordcloud.tokenization import score as collocation_score
+
+# the columns which hold the comments, in the order of preference
+COMMENT_COLUMNS = ['PatientComment', 'COMMENT']
+
+# the tokens are the words of the comments (the same as the ones of the word clouds), which are split by these
+TOKEN_SEPARATOR_PATTERN = r"[^\p{L}\p{N}_']+"
+
+# the tokens which are not counted (in any case)
+STOPWORDS = frozenset(set(e.lower() for e in WORD_CLOUD_STOPWORDS) | {'said'})
+
+# the pairs of adjacent tokens which score above this are counted as collocations, the same as the word clouds
+COLLOCATION_THRESHOLD = 30
+
+# the number of comments that each process tokenizes at a time
+TEXT_CHUNK_SIZE = 20000
+
+
+def comment_column(columns: List[str]) -> Optional[str]:
+    """
+    The :func:`comment_column` finds the column which holds the comments of a dataframe.
+
+    Parameters
+    ----------
+    columns: `List[str]`, required
+        The columns of the dataframe
+
+    Returns
+    ----------
+    The first one of the `COMMENT_COLUMNS` which exists, or `None`.
+    """
+    for column in COMMENT_COLUMNS:
+        if column in columns:
+            return column
+    return None
+
+
+def tokenize_comments(
+        comments: pandas.Series,
+        ngram_range: Tuple[int, int] = (1, 1)
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    The :func:`tokenize_comments` splits the comments into their tokens with the vectorized (arrow) string kernels.
+    The tokens are the same as the words of `WordCloud.process_text` (the maximal runs of letters, digits, `_` and
+    `'` without their leading `'`) in their case and without their trailing `'s`, and the numbers are left out.
+    The bigrams are the pairs of adjacent tokens of a comment which are not `STOPWORDS` (in any case), joined by a
+    space, and then the `STOPWORDS` are left out of the tokens. The filters are applied once per distinct token.
+
+    Parameters
+    ----------
+    comments: `pandas.Series`, required
+        The comments, the missing ones are skipped
+    ngram_range: `Tuple[int, int]`, optional (default=(1, 1))
+        The smallest and largest number of tokens in each n-gram, `(1, 1)` for the tokens, `(2, 2)` for the
+        bigrams and `(1, 2)` for both
+
+    Returns
+    ----------
+    The n-grams in a factorized form: the position of the comment of each occurrence, the code of each occurrence
+    and the distinct n-grams that the codes refer to (as `numpy.ndarray` instances).
+    """
+    present = numpy.flatnonzero(comments.notna().to_numpy())
+    texts = pyarrow.array(comments.iloc[present].astype(str).to_numpy(dtype=object), type=pyarrow.large_string())
+    words = pyarrow.compute.split_pattern_regex(texts, TOKEN_SEPARATOR_PATTERN)
+    positions = present[pyarrow.compute.list_parent_indices(words).to_numpy()]
+    words = pyarrow.compute.utf8_ltrim(pyarrow.compute.list_flatten(words), characters="'")
+    # the empty strings (e.g. before a leading separator) are not tokens, and do not separate the bigrams
+    nonempty = pyarrow.compute.greater(pyarrow.compute.utf8_length(words), 0)
+    words, positions = words.filter(nonempty), positions[nonempty.to_numpy(zero_copy_only=False)]
+    words = pyarrow.compute.replace_substring_regex(words, r"(?i)'s$", "").dictionary_encode()
+    codes = words.indices.to_numpy(zero_copy_only=False).astype(numpy.int64)
+    dictionary = numpy.asarray(words.dictionary.to_pylist(), dtype=object)
+    # the numbers are left out before the bigrams are paired (the stopwords only after)
+    words = numpy.array([len(e) > 0 and not e.isdigit() for e in dictionary], dtype=bool)
+    words = words[codes] if len(codes) > 0 else numpy.zeros(0, dtype=bool)
+    codes, positions = codes[words], positions[words]
+    kept = numpy.array([e.lower() not in STOPWORDS for e in dictionary], dtype=bool)
+    kept = kept[codes] if len(codes) > 0 else numpy.zeros(0, dtype=bool)
+
+    ngram_positions, ngram_codes, ngrams = [], [], []
+    if ngram_range[0] <= 1:
+        unigram_codes, unigrams = pandas.factorize(codes[kept])
+        ngram_positions.append(positions[kept])
+        ngram_codes.append(unigram_codes)
+        ngrams.append(dictionary[unigrams])
+    if ngram_range[1] >= 2 and len(codes) > 1:
+        adjacent = kept[:-1] & kept[1:] & (positions[:-1] == positions[1:])
+        bigram_codes, bigrams = pandas.factorize(codes[:-1][adjacent] * len(dictionary) + codes[1:][adjacent])
+        ngram_positions.append(positions[:-1][adjacent])
+        ngram_codes.append(bigram_codes + sum(len(e) for e in ngrams))
+        ngrams.append(dictionary[bigrams // len(dictionary)] + ' ' + dictionary[bigrams % len(dictionary)])
+
+    if len(ngrams) == 0:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=object)
+    return numpy.concatenate(ngram_positions), numpy.concatenate(ngram_codes), numpy.concatenate(ngrams)
+
+
+def chunk_token_codes(
+        comments: pandas.Series,
+        ngram_range: Tuple[int, int] = (1, 1)
+) -> Tuple[int, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    The :func:`chunk_token_codes` tokenizes a chunk of comments (please refer to :func:`tokenize_comments`) in one
+    of the processes of :class:`TextAggregation`.
+
+    Parameters
+    ----------
+    comments: `pandas.Series`, required
+        The chunk of comments
+    ngram_range: `Tuple[int, int]`, optional (default=(1, 1))
+        Please refer to :func:`tokenize_comments`.
+
+    Returns
+    ----------
+    The number of comments in the chunk, followed by the output of :func:`tokenize_comments`.
+    """
+    return (comments.shape[0],) + tokenize_comments(comments, ngram_range=ngram_range)
+
+
+def chunk_token_counts(comments: pandas.Series, ngram_range: Tuple[int, int] = (1, 1)) -> pandas.Series:
+    """
+    The :func:`chunk_token_counts` counts the n-grams of a chunk of comments (please refer to
+    :func:`tokenize_comments`) in one of the processes of :class:`TextAggregation`.
+
+    Parameters
+    ----------
+    comments: `pandas.Series`, required
+        The chunk of comments
+    ngram_range: `Tuple[int, int]`, optional (default=(1, 1))
+        Please refer to :func:`tokenize_comments`.
+
+    Returns
+    ----------
+    The `pandas.Series` of the count of each n-gram, indexed by the n-grams.
+    """
+    _, codes, ngrams = tokenize_comments(comments, ngram_range=ngram_range)
+    return pandas.Series(numpy.bincount(codes, minlength=len(ngrams)), index=ngrams)
+
+
+class TextAggregation:
+    """
+    The :class:`TextAggregation` is the stage that the text visualizations count the tokens of the comments with.
+    The comments are split into chunks of `TEXT_CHUNK_SIZE`, which are tokenized in a pool of processes, and the
+    partial outputs are merged in order. The inputs with a single chunk are tokenized in the calling process.
+
+    Similar to the flask extensions, the instance is created at import time and its number of processes is read
+    from the application configuration in :meth:`init_app`. The pool is started (with the `spawn` method, since
+    the server may have other threads) the first time it is needed, and kept for the later requests.
+    """
+
+    def __init__(
+            self,
+            config_key: Optional[str] = None,
+            processes: int = 1,
+            chunk_size: int = TEXT_CHUNK_SIZE
+    ):
+        """
+        The constructor method of :class:`TextAggregation`
+
+        Parameters
+        ----------
+        config_key: `str`, optional (default=None)
+            The key of the configuration parameter which holds the number of processes
+        processes: `int`, optional (default=1)
+            The number of processes, used if the configuration does not include the `config_key`
+        chunk_size: `int`, optional (default=TEXT_CHUNK_SIZE)
+            The number of comments in each chunk
+        """
+        self.config_key = config_key
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def init_app(self, app) -> None:
+        """
+        The :meth:`init_app` reads the number of processes from the application configuration.
+
+        Parameters
+        ----------
+        app: `Flask`, required
+            The application
+        """
+        if self.config_key is not None:
+            self.processes = app.config.get(self.config_key, self.processes)
+
+    def pool(self) -> ProcessPoolExecutor:
+        """
+        The :meth:`pool` returns the pool of processes, which is started the first time.
+
+        Returns
+        ----------
+        The `ProcessPoolExecutor` with `processes` workers.
+        """
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+    def split(self, chunks: Iterator[pandas.Series]) -> Iterator[pandas.Series]:
+        """
+        The :meth:`split` splits the chunks of the comments into chunks of at most `chunk_size` comments.
+
+        Parameters
+        ----------
+        chunks: `Iterator[pandas.Series]`, required
+            The consecutive chunks of the comments
+
+        Returns
+        ----------
+        This generator yields the smaller chunks in the same order.
+        """
+        for chunk in chunks:
+            for start in range(0, chunk.shape[0], self.chunk_size):
+                yield chunk.iloc[start:start + self.chunk_size]
+
+    def map(self, function: Callable[[pandas.Series], Any], chunks: Iterator[pandas.Series]) -> Iterator[Any]:
+        """
+        The :meth:`map` applies a function to the chunks of the comments (please refer to :meth:`split`) in the
+        pool of processes. At most twice as many chunks as processes are in flight, so the whole input is never
+        kept in memory.
+
+        Parameters
+        ----------
+        function: `Callable[[pandas.Series], Any]`, required
+            The function, which has to be picklable (e.g. a module-level function or a `partial` of one)
+        chunks: `Iterator[pandas.Series]`, required
+            The consecutive chunks of the comments
+
+        Returns
+        ----------
+        This generator yields the outputs of the function in the order of the chunks.
+        """
+        chunks = self.split(chunks)
+        first, second = next(chunks, None), next(chunks, None)
+        if first is None:
+            return
+        if second is None or self.processes <= 1:
+            for chunk in [first] + ([] if second is None else [second]):
+                yield function(chunk)
+            for chunk in chunks:
+                yield function(chunk)
+            return
+
+        executor = self.pool()
+        pending = deque([executor.submit(function, first), executor.submit(function, second)])
+        try:
+            for chunk in chunks:
+                pending.append(executor.submit(function, chunk))
+                if len(pending) >= 2 * self.processes:
+                    yield pending.popleft().result()
+            while len(pending) > 0:
+                yield pending.popleft().result()
+        except BrokenProcessPool:
+            # a worker process was terminated abruptly, the next call starts a new pool
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = None
+            raise
+        finally:
+            # the chunks which are not needed anymore (e.g. the caller stopped early) are not tokenized
+            for future in pending:
+                future.cancel()
+
+    def count_tokens(self, chunks: Iterator[pandas.Series], collocations: bool = True) -> Dict[str, int]:
+        """
+        The :meth:`count_tokens` counts the words of the comments the same way as the word clouds, please refer to
+        :func:`tokenize_comments` and :func:`token_frequencies`.
+
+        Parameters
+        ----------
+        chunks: `Iterator[pandas.Series]`, required
+            The consecutive chunks of the comments
+        collocations: `bool`, optional (default=True)
+            Whether or not to count the collocations (which needs the bigrams to be counted as well)
+
+        Returns
+        ----------
+        The frequency of each word as a `Dict[str, int]`, please refer to :func:`token_frequencies`.
+        """
+        ngram_range = (1, 2) if collocations else (1, 1)
+        partials = list(self.map(partial(chunk_token_counts, ngram_range=ngram_range), chunks))
+        if len(partials) == 0:
+            return dict()
+        counts = pandas.concat(partials).groupby(level=0, sort=False).sum()
+        return token_frequencies(counts.to_numpy(), counts.index.to_numpy(dtype=object), collocations=collocations)
+
+    def token_matrix(
+            self,
+            chunks: Iterator[pandas.Series],
+            vocabulary: Dict[str, int],
+            number_of_rows: int = 0,
+            ngram_range: Tuple[int, int] = (1, 1)
+    ) -> Tuple[scipy.sparse.csr_matrix, int]:
+        """
+        The :meth:`token_matrix` counts the n-grams of each comment (please refer to :func:`tokenize_comments`) into
+        a sparse matrix with one row per comment and one column per n-gram of the vocabulary.
+
+        Parameters
+        ----------
+        chunks: `Iterator[pandas.Series]`, required
+            The consecutive chunks of the comments
+        vocabulary: `Dict[str, int]`, required
+            The column of each token, the new tokens are added to it in place
+        number_of_rows: `int`, optional (default=0)
+            The number of comments before the first chunk (e.g. the ones already in the index), which is the
+            position of the first row of the output
+        ngram_range: `Tuple[int, int]`, optional (default=(1, 1))
+            Please refer to :func:`tokenize_comments`.
+
+        Returns
+        ----------
+        The `scipy.sparse.csr_matrix` of the counts of the chunks (with as many columns as the vocabulary, and the
+        rows before `number_of_rows` left empty) and the number of comments after the last chunk.
+        """
+        rows, token_ids = [], []
+        for length, positions, codes, uniques in self.map(
+                partial(chunk_token_codes, ngram_range=ngram_range), chunks):
+            uniques_ids = numpy.array(
+                [vocabulary.setdefault(e, len(vocabulary)) for e in uniques], dtype=numpy.int64)
+            rows.append(positions + number_of_rows)
+            token_ids.append(uniques_ids[codes])
+            number_of_rows += length
+
+        rows = numpy.concatenate(rows) if len(rows) > 0 else numpy.zeros(0, dtype=numpy.int64)
+        token_ids = numpy.concatenate(token_ids) if len(token_ids) > 0 else numpy.zeros(0, dtype=numpy.int64)
+        # the repeated (row, token) pairs are summed up by the conversion
+        matrix = scipy.sparse.coo_matrix(
+            (numpy.ones(len(rows), dtype=numpy.int32), (rows, token_ids)),
+            shape=(number_of_rows, len(vocabulary))
+        ).tocsr()
+        return matrix, number_of_rows
+
+
+def fold_cases(counts: Dict[str, int]) -> Tuple[Dict[str, int], Dict[str, str]]:
+    """
+    The :func:`fold_cases` counts the tokens (or bigrams) in all of their cases under their most common case, and
+    the plural ones (ending in a single `s`) under their singular forms if those appear as well. This is
+    `wordcloud.tokenization.process_tokens` for the counts of the tokens rather than their occurrences.
+
+    Parameters
+    ----------
+    counts: `Dict[str, int]`, required
+        The count of each token, in the order of their first occurrence
+
+    Returns
+    ----------
+    The count of each folded token, and the folded form of each lowercased token (as `Dict` instances).
+    """
+    cases = dict()
+    for token, count in counts.items():
+        case_counts = cases.setdefault(token.lower(), dict())
+        case_counts[token] = case_counts.get(token, 0) + count
+
+    plurals = dict()
+    for key in list(cases.keys()):
+        if key.endswith('s') and not key.endswith('ss') and key[:-1] in cases:
+            singular_counts = cases[key[:-1]]
+            for token, count in cases.pop(key).items():
+                singular_counts[token[:-1]] = singular_counts.get(token[:-1], 0) + count
+            plurals[key] = key[:-1]
+
+    folded, forms = dict(), dict()
+    for key, case_counts in cases.items():
+        # the most common case, the first one to occur among the equally common ones
+        form = max(case_counts.items(), key=lambda e: e[1])[0]
+        folded[form] = sum(case_counts.values())
+        forms[key] = form
+    for plural, singular in plurals.items():
+        forms[plural] = forms[singular]
+    return folded, forms
+
+
+def token_frequencies(
+        counts: numpy.ndarray,
+        vocabulary: numpy.ndarray,
+        collocations: bool = True
+) -> Dict[str, int]:
+    """
+    The :func:`token_frequencies` turns the counts of the tokens and bigrams into the frequencies that the word
+    clouds are generated from, the same way as `WordCloud.process_text` does (please refer to :func:`fold_cases`).
+    If `collocations` are counted, the bigrams which score above `COLLOCATION_THRESHOLD` are counted as words of
+    their own, and their counts are taken off their tokens. Unlike `WordCloud.process_text` (which is given the
+    comments joined into one text), the bigrams never span two comments.
+
+    Parameters
+    ----------
+    counts: `numpy.ndarray`, required
+        The count of each token (or bigram) of the vocabulary
+    vocabulary: `numpy.ndarray`, required
+        The tokens and bigrams (the ones with a space)
+    collocations: `bool`, optional (default=True)
+        Whether or not to count the collocations, the bigrams are ignored otherwise
+
+    Returns
+    ----------
+    The `Dict[str, int]` of the frequency of each word (or collocation) that appears.
+    """
+    present = numpy.flatnonzero(counts)
+    unigram_counts, bigram_counts = dict(), dict()
+    for token, count in zip(vocabulary[present].tolist(), counts[present].tolist()):
+        (bigram_counts if ' ' in token else unigram_counts)[token] = count
+
+    frequencies, forms = fold_cases(unigram_counts)
+    if not collocations:
+        return frequencies
+
+    number_of_words = sum(unigram_counts.values())
+    word_counts = dict(frequencies)
+    for bigram, count in fold_cases(bigram_counts)[0].items():
+        first, second = bigram.split(' ')
+        first, second = forms[first.lower()], forms[second.lower()]
+        if collocation_score(count, word_counts[first], word_counts[second], number_of_words) > COLLOCATION_THRESHOLD:
+            frequencies[first] -= count
+            frequencies[second] -= count
+            frequencies[bigram] = count
+    return {token: count for token, count in frequencies.items() if count > 0}
@@ -0,0 +1,83 @@
+import numpy
+import pandas
+import scipy.sparse
+from typing import Optional, Dict, Any, Iterator
+from application import text_aggregation
+from application.libraries.files import replaced_file
+
+# the token indexes of the registered comment dataframes are kept in this folder (relative to the application directory)
+TOKEN_INDEX_DIRECTORY = 'warehouse/tokens'
+
+
+def index_comments(comments: Iterator[pandas.Series], previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    The :func:`index_comments` counts each token and bigram in each comment (please refer to
+    :class:`TextAggregation`), so that the word clouds of any subset of the comments are computed without
+    tokenizing them again.
+
+    Parameters
+    ----------
+    comments: `Iterator[pandas.Series]`, required
+        The chunks of the comments
+    previous: `Dict[str, Any]`, optional (default=None)
+        The index of the comments before these ones (e.g. before the rows were appended to the csv file), to which
+        these comments are added, please refer to :func:`load_token_index`.
+
+    Returns
+    ----------
+    A `Dict[str, Any]` with the `vocabulary` (`numpy.ndarray` of the tokens) and the `matrix`
+    (`scipy.sparse.csr_matrix` of the counts, one row per comment and one column per token).
+    """
+    vocabulary = dict() if previous is None else {e: i for i, e in enumerate(previous["vocabulary"].tolist())}
+    matrix, _ = text_aggregation.token_matrix(comments, vocabulary, ngram_range=(1, 2))
+    if previous is not None:
+        # the rows of the appended comments are stacked under the previous ones, which are empty in the new tokens
+        previous["matrix"].resize((previous["matrix"].shape[0], len(vocabulary)))
+        matrix = scipy.sparse.vstack([previous["matrix"], matrix], format='csr')
+    return {"vocabulary": numpy.array(list(vocabulary.keys()), dtype=str), "matrix": matrix}
+
+
+def save_token_index(index_path: str, index: Dict[str, Any]) -> None:
+    """
+    The :func:`save_token_index` saves a token index (please refer to :func:`index_comments`), so that the other
+    processes never read a partial index.
+
+    Parameters
+    ----------
+    index_path: `str`, required
+        The path to the index file
+    index: `Dict[str, Any]`, required
+        The token index
+    """
+    matrix = index["matrix"]
+    with replaced_file(index_path) as handle:
+        numpy.savez(
+            handle,
+            data=matrix.data,
+            indices=matrix.indices,
+            indptr=matrix.indptr,
+            shape=numpy.array(matrix.shape),
+            vocabulary=index["vocabulary"]
+        )
+
+
+def load_token_index(index_path: str) -> Dict[str, Any]:
+    """
+    The :func:`load_token_index` loads a token index which was saved by :func:`save_token_index`.
+
+    Parameters
+    ----------
+    index_path: `str`, required
+        The path to the index file
+
+    Returns
+    ----------
+    A `Dict[str, Any]` with the `vocabulary` (`numpy.ndarray` of the tokens) and the `matrix`
+    (`scipy.sparse.csr_matrix` of the counts, one row per comment and one column per token).
+    """
+    with numpy.load(index_path, allow_pickle=False) as arrays:
+        return {
+            "vocabulary": arrays["vocabulary"],
+            "matrix": scipy.sparse.csr_matrix(
+                (arrays["data"], arrays["indices"], arrays["indptr"]), shape=tuple(arrays["shape"].tolist()))
+        }
@@ -1,56 +1,708 @@
+import json
 import pandas
 import numpy
-import os, sys
-from copy import deepcopy
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple, Optional
 
 
-def apply_single_transformation(dataframe, single_transformation):
-    dataframe = deepcopy(dataframe)
-    if single_transformation["name"] == "limit_range":
+# the transformations which only remove rows, and therefore can be combined into a single mask
+FILTER_TRANSFORMATIONS = ["limit_range", "equality", "inequality"]
+
+# the parameters of the planner's estimates, please refer to :func:`plan_transformations`
+MAXIMUM_TRACKED_VALUES = 256
+QUANTILE_COUNT = 33
+DEFAULT_SELECTIVITY = 0.5
+NON_NUMERIC_COMPARISON_COST = 5.0
+
+# once the fraction of the remaining rows falls below this, the next filters only evaluate the remaining rows
+SPARSE_EVALUATION_DENSITY = 0.25
+
+
+def as_mask(indices: pandas.Series) -> numpy.ndarray:
+    """
+    The :func:`as_mask` converts the result of a comparison to a boolean `numpy.ndarray`, in which the missing
+    values (of nullable dtypes) are treated as `False`.
+    """
+    mask = indices.to_numpy(dtype=bool, na_value=False)
+    if not mask.flags.writeable:
+        mask = mask.copy()
+    return mask
+
+
+def transformation_mask(
+        dataframe: pandas.DataFrame,
+        single_transformation: Dict[str, Any],
+        rows: Optional[numpy.ndarray] = None
+) -> numpy.ndarray:
+    """
+    The :func:`transformation_mask` evaluates a single filter transformation (`limit_range`, `equality`
+    or `inequality`) over the dataframe without copying it. On categorical columns, the filter is evaluated
+    on the categories rather than on the rows.
+
+    Parameters
+    -----------
+    dataframe: `pandas.DataFrame`, required
+        The input dataframe
+    single_transformation: `Dict[str, Any]`, required
+        The transformation, please refer to :func:`transform_dataframe` for its format.
+    rows: `numpy.ndarray`, optional (default=None)
+        The positions of the rows that are to be evaluated, the others will be `False` in the output. If `None`,
+        all of the rows are evaluated.
+
+    Returns
+    -----------
+    The boolean `numpy.ndarray` which is `True` for the rows that are kept.
+    """
+    column = dataframe[single_transformation["column"]]
+    if rows is not None:
+        column = column.iloc[rows]
+    if column.dtype == numpy.float32:
+        # the compact float32 columns (please refer to :func:`infer_column_dtypes`) hold the values of the csv file
+        # exactly, but numpy casts the value of the filter to float32 before comparing them, which can keep other rows
+        column = column.astype(numpy.float64)
+
+    if isinstance(column.dtype, pandas.CategoricalDtype):
+        # the filter is evaluated once per category and looked up by the codes of the rows, the missing
+        # values (code -1) take the last item which is the result of the filter on a missing value
+        categories = pandas.Series(column.cat.categories)
+        categories = pandas.concat([categories, pandas.Series([None], dtype=categories.dtype)], ignore_index=True)
+        indices = transformation_mask(
+            pandas.DataFrame({single_transformation["column"]: categories}),
+            dict(single_transformation, negation=False)
+        )[column.cat.codes.to_numpy()]
+    elif single_transformation["name"] == "limit_range":
         if single_transformation["upper_bound"][1] == 'closed':
-            indices = dataframe[single_transformation["column"]] <= single_transformation["upper_bound"][0]
+            indices = as_mask(column <= single_transformation["upper_bound"][0])
         else:
-            indices = dataframe[single_transformation["column"]] < single_transformation["upper_bound"][0]
+            indices = as_mask(column < single_transformation["upper_bound"][0])
 
         if single_transformation["lower_bound"][1] == 'closed':
-            indices = indices & (dataframe[single_transformation["column"]] >= single_transformation["lower_bound"][0])
+            indices &= as_mask(column >= single_transformation["lower_bound"][0])
         else:
-            indices = indices & (dataframe[single_transformation["column"]] > single_transformation["lower_bound"][0])
-
-        if single_transformation["negation"]:
-            indices = ~indices
-        dataframe = dataframe[indices]
+            indices &= as_mask(column > single_transformation["lower_bound"][0])
     elif single_transformation["name"] == "equality":
-        indices = dataframe[single_transformation["column"]] == single_transformation['value']
-        if single_transformation['negation']:
-            dataframe = dataframe[~indices]
-        else:
-            dataframe = dataframe[indices]
-
+        indices = as_mask(column == single_transformation['value'])
     elif single_transformation["name"] == "inequality":
         if single_transformation["type"] == '>':
-            indices = dataframe[single_transformation["column"]] > single_transformation['value']
+            indices = as_mask(column > single_transformation['value'])
         elif single_transformation["type"] == '>=':
-            indices = dataframe[single_transformation["column"]] >= single_transformation['value']
+            indices = as_mask(column >= single_transformation['value'])
         elif single_transformation["type"] == '<':
-            indices = dataframe[single_transformation["column"]] < single_transformation['value']
+            indices = as_mask(column < single_transformation['value'])
         elif single_transformation["type"] == '<=':
-            indices = dataframe[single_transformation["column"]] <= single_transformation['value']
+            indices = as_mask(column <= single_transformation['value'])
         else:
-            return ValueError
-        if single_transformation['negation']:
-            dataframe = dataframe[~indices]
+            raise ValueError("unknown inequality type: {}".format(single_transformation["type"]))
+    else:
+        raise ValueError("not a filter transformation: {}".format(single_transformation["name"]))
+
+    if single_transformation.get("negation", False):
+        numpy.logical_not(indices, out=indices)
+
+    if rows is not None:
+        mask = numpy.zeros(dataframe.shape[0], dtype=bool)
+        mask[rows] = indices
+        indices = mask
+
+    return indices
+
+
+def compile_transformations(transformations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    The :func:`compile_transformations` turns the list of transformations into a plan of stages. Each run of
+    consecutive filter transformations becomes one `filter` stage, the masks of which are combined and applied
+    once, and each `random_selection` becomes a stage of its own which acts as an ordered barrier between them.
+
+    Parameters
+    -----------
+    transformations: `List[Dict[str, Any]]`, required
+        The transformations of the guide
+
+    Returns
+    -----------
+    The plan as a `List[Dict[str, Any]]`, in which each stage has a `name` (`filter` or `random_selection`),
+    `steps` which is the list of its transformations, and `indices` which are their positions in the user's list.
+    """
+    plan = []
+    for index, single_transformation in enumerate(transformations):
+        if single_transformation["name"] in FILTER_TRANSFORMATIONS:
+            if len(plan) == 0 or plan[-1]["name"] != "filter":
+                plan.append({"name": "filter", "steps": [], "indices": []})
+            plan[-1]["steps"].append(single_transformation)
+            plan[-1]["indices"].append(index)
+        elif single_transformation["name"] == "random_selection":
+            plan.append({"name": "random_selection", "steps": [single_transformation], "indices": [index]})
         else:
-            dataframe = dataframe[indices]
+            raise ValueError("unknown transformation: {}".format(single_transformation["name"]))
+    return plan
+
+
+def column_statistics(column: pandas.Series) -> Dict[str, Any]:
+    """
+    The :func:`column_statistics` computes the statistics of a column which :func:`plan_transformations` uses
+    to estimate the selectivity of the filters on it.
+
+    Parameters
+    -----------
+    column: `pandas.Series`, required
+        The column
+
+    Returns
+    -----------
+    A `Dict[str, Any]` with the `count` of rows, the `null_fraction`, whether or not the column is `numeric` or
+    `categorical`,
+    the `frequencies` of its values (fraction of rows, only if it has at most `MAXIMUM_TRACKED_VALUES` distinct
+    values), and the `quantiles` at `QUANTILE_COUNT` equally spaced probabilities for numeric columns.
+    """
+    count = column.shape[0]
+    statistics = {
+        "count": count,
+        "null_fraction": float(column.isna().sum()) / max(count, 1),
+        "numeric": pandas.api.types.is_numeric_dtype(column.dtype) and not pandas.api.types.is_bool_dtype(column.dtype),
+        "categorical": isinstance(column.dtype, pandas.CategoricalDtype),
+        "frequencies": None,
+        "quantiles": None
+    }
+
+    frequencies = column.value_counts(dropna=True)
+    if frequencies.shape[0] <= MAXIMUM_TRACKED_VALUES and not pandas.api.types.is_datetime64_any_dtype(column.dtype):
+        # the filters compare the dates with `str` values, so the frequencies of the dates are not tracked
+        statistics["frequencies"] = {key: float(value) / max(count, 1) for key, value in frequencies.items()}
+    statistics["distinct"] = int(frequencies.shape[0])
+
+    if statistics["numeric"] and count > statistics["null_fraction"] * count:
+        statistics["quantiles"] = column.quantile(numpy.linspace(0, 1, QUANTILE_COUNT)).to_numpy(dtype=float)
+
+    return statistics
+
+
+def estimate_selectivity(single_transformation: Dict[str, Any], statistics: Optional[Dict[str, Any]]) -> float:
+    """
+    The :func:`estimate_selectivity` estimates the fraction of rows that a filter transformation keeps.
+
+    Parameters
+    -----------
+    single_transformation: `Dict[str, Any]`, required
+        The filter transformation
+    statistics: `Dict[str, Any]`, optional
+        The statistics of its column (please refer to :func:`column_statistics`), or `None` if unknown.
+
+    Returns
+    -----------
+    The estimated selectivity as a `float` between 0 and 1.
+    """
+    def fraction_below(value, closed: bool) -> Optional[float]:
+        # fraction of the rows that are less than (or equal to, if closed) the value
+        if statistics["frequencies"] is not None:
+            try:
+                return sum(f for k, f in statistics["frequencies"].items() if (k <= value if closed else k < value))
+            except TypeError:
+                return None
+        if statistics["quantiles"] is not None:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return None
+            quantiles = statistics["quantiles"]
+            probabilities = numpy.linspace(0, 1, quantiles.shape[0])
+            if closed:
+                fraction = numpy.interp(value, quantiles, probabilities, left=0.0, right=1.0)
+            else:
+                fraction = 1.0 - numpy.interp(-value, -quantiles[::-1], probabilities, left=0.0, right=1.0)
+            return float(fraction) * (1.0 - statistics["null_fraction"])
+        return None
+
+    selectivity = None
+    if statistics is not None:
+        present = 1.0 - statistics["null_fraction"]
+        if single_transformation["name"] == "equality":
+            if statistics["frequencies"] is not None:
+                try:
+                    selectivity = statistics["frequencies"].get(single_transformation["value"], 0.0)
+                except TypeError:
+                    selectivity = 0.0
+            elif statistics["distinct"] > 0:
+                selectivity = present / statistics["distinct"]
+        elif single_transformation["name"] == "inequality":
+            value = single_transformation["value"]
+            if single_transformation["type"] in ['<', '<=']:
+                selectivity = fraction_below(value, single_transformation["type"] == '<=')
+            elif single_transformation["type"] in ['>', '>=']:
+                below = fraction_below(value, single_transformation["type"] == '>')
+                if below is not None:
+                    selectivity = present - below
+        elif single_transformation["name"] == "limit_range":
+            upper_bound, lower_bound = single_transformation["upper_bound"], single_transformation["lower_bound"]
+            upper = fraction_below(upper_bound[0], upper_bound[1] == 'closed')
+            lower = fraction_below(lower_bound[0], lower_bound[1] == 'open')
+            if upper is not None and lower is not None:
+                selectivity = upper - lower
+
+    if selectivity is None:
+        selectivity = DEFAULT_SELECTIVITY
+    selectivity = min(max(float(selectivity), 0.0), 1.0)
+
+    if single_transformation.get("negation", False):
+        selectivity = 1.0 - selectivity
+
+    return selectivity
+
+
+def estimate_cost(single_transformation: Dict[str, Any], statistics: Optional[Dict[str, Any]]) -> float:
+    """
+    The :func:`estimate_cost` estimates the relative cost of evaluating a filter transformation on one row. The
+    comparisons on non-numeric (object) columns are more expensive (unless they are categorical, in which case the
+    categories are compared), and `limit_range` performs two of them.
+
+    Parameters
+    -----------
+    single_transformation: `Dict[str, Any]`, required
+        The filter transformation
+    statistics: `Dict[str, Any]`, optional
+        The statistics of its column (please refer to :func:`column_statistics`), or `None` if unknown.
+
+    Returns
+    -----------
+    The estimated cost as a `float`.
+    """
+    cost = 1.0
+    if statistics is not None and not statistics["numeric"] and not statistics.get("categorical", False):
+        cost = NON_NUMERIC_COMPARISON_COST
+    if single_transformation["name"] == "limit_range":
+        cost *= 2.0
+    return cost
+
+
+def plan_transformations(
+        transformations: List[Dict[str, Any]],
+        statistics: Dict[str, Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    The :func:`plan_transformations` builds the plan of :func:`compile_transformations` and reorders the
+    transformations of each `filter` stage so that the cheap and selective ones are evaluated first (the ones
+    after them are only evaluated on the remaining rows). Since the masks of a stage are combined, the output
+    stays the same. The filters are sorted by `cost / (1 - selectivity)`, and the ties keep the user's order.
+
+    The plan can be inspected: each step of a stage is accompanied by an entry in its `estimates` including
+    its estimated `selectivity` and `cost`.
+
+    Parameters
+    -----------
+    transformations: `List[Dict[str, Any]]`, required
+        The transformations of the guide
+    statistics: `Dict[str, Dict[str, Any]]`, required
+        The statistics of the columns (please refer to :func:`column_statistics`), the ones that are missing
+        are treated as unknown.
+
+    Returns
+    -----------
+    The plan as a `List[Dict[str, Any]]`, please refer to :func:`compile_transformations`.
+    """
+    plan = compile_transformations(transformations)
+    for stage in plan:
+        estimates = []
+        for single_transformation in stage["steps"]:
+            if stage["name"] == "filter":
+                column_statistics = statistics.get(single_transformation["column"], None)
+                estimates.append({
+                    "selectivity": estimate_selectivity(single_transformation, column_statistics),
+                    "cost": estimate_cost(single_transformation, column_statistics)
+                })
+            else:
+                estimates.append({"selectivity": None, "cost": None})
+
+        if stage["name"] == "filter":
+            order = sorted(
+                range(len(estimates)),
+                key=lambda i: (estimates[i]["cost"] / max(1.0 - estimates[i]["selectivity"], 1e-6), i)
+            )
+            stage["steps"] = [stage["steps"][i] for i in order]
+            stage["indices"] = [stage["indices"][i] for i in order]
+            estimates = [estimates[i] for i in order]
+        stage["estimates"] = estimates
+
+    return plan
+
+
+def satisfies(value: Any, single_transformation: Dict[str, Any]) -> bool:
+    """
+    The :func:`satisfies` evaluates a filter transformation, without its negation, on a single value.
+
+    Parameters
+    -----------
+    value: `Any`, required
+        The value
+    single_transformation: `Dict[str, Any]`, required
+        The filter transformation
+
+    Returns
+    -----------
+    `True` if the value satisfies the filter.
+    """
+    if single_transformation["name"] == "limit_range":
+        upper_bound, lower_bound = single_transformation["upper_bound"], single_transformation["lower_bound"]
+        return (value <= upper_bound[0] if upper_bound[1] == 'closed' else value < upper_bound[0]) and \
+            (value >= lower_bound[0] if lower_bound[1] == 'closed' else value > lower_bound[0])
+    elif single_transformation["name"] == "equality":
+        return value == single_transformation["value"]
+    elif single_transformation["type"] == '>':
+        return value > single_transformation["value"]
+    elif single_transformation["type"] == '>=':
+        return value >= single_transformation["value"]
+    elif single_transformation["type"] == '<':
+        return value < single_transformation["value"]
+    else:
+        return value <= single_transformation["value"]
+
+
+def zone_map_admits(zone_map: Dict[str, List[Any]], single_transformation: Dict[str, Any]) -> numpy.ndarray:
+    """
+    The :func:`zone_map_admits` finds the chunks (row groups) of a column that may include rows that a filter
+    transformation keeps, using the `min`, `max` and `null_count` of each chunk. The filters are convex (the
+    values between two kept values are kept as well), so a chunk has a kept row if its value range intersects
+    the kept range, and all of its rows are removed by a negated filter only if its `min` and `max` are kept by
+    the filter and it has no missing value. The comparisons that fail (e.g. because of the types) admit the chunk.
+
+    Parameters
+    -----------
+    zone_map: `Dict[str, List[Any]]`, required
+        The zone map of the column including the `min`, `max` and `null_count` of each chunk. The `min` and
+        `max` are `None` for the chunks that have no value or the ones that are unknown.
+    single_transformation: `Dict[str, Any]`, required
+        The filter transformation
+
+    Returns
+    -----------
+    The boolean `numpy.ndarray` which is `True` for the chunks that have to be evaluated.
+    """
+    admitted = numpy.ones(len(zone_map["min"]), dtype=bool)
+    for index, (minimum, maximum, null_count) in enumerate(
+            zip(zone_map["min"], zone_map["max"], zone_map["null_count"])):
+        if minimum is None or maximum is None:
+            # either the chunk has no value, or the range is unknown
+            admitted[index] = single_transformation.get("negation", False) or null_count is None or null_count == 0
+            continue
+        try:
+            if single_transformation.get("negation", False):
+                admitted[index] = null_count > 0 or not (
+                    satisfies(minimum, single_transformation) and satisfies(maximum, single_transformation))
+            elif single_transformation["name"] == "equality":
+                admitted[index] = minimum <= single_transformation["value"] <= maximum
+            elif single_transformation["name"] == "inequality" and single_transformation["type"] in ['>', '>=']:
+                admitted[index] = satisfies(maximum, single_transformation)
+            elif single_transformation["name"] == "inequality":
+                admitted[index] = satisfies(minimum, single_transformation)
+            elif single_transformation["name"] == "limit_range":
+                upper_bound, lower_bound = single_transformation["upper_bound"], single_transformation["lower_bound"]
+                admitted[index] = \
+                    (maximum >= lower_bound[0] if lower_bound[1] == 'closed' else maximum > lower_bound[0]) and \
+                    (minimum <= upper_bound[0] if upper_bound[1] == 'closed' else minimum < upper_bound[0])
+        except TypeError:
+            admitted[index] = True
+
+    return admitted
+
+
+def zone_map_row_groups(
+        zone_maps: Dict[str, Any],
+        transformations: List[Dict[str, Any]],
+        window: Optional[Dict[str, str]] = None
+) -> numpy.ndarray:
+    """
+    The :func:`zone_map_row_groups` finds the chunks (row groups) of a dataframe that may include rows that
+    remain after the filters which come before the first `random_selection` of a list of transformations, and
+    (optionally) fall in a date window.
+
+    Parameters
+    -----------
+    zone_maps: `Dict[str, Any]`, required
+        The zone maps of the dataframe, including the `row_counts` of the chunks and the zone map of each of the
+        `columns` (please refer to :func:`zone_map_admits`), in which the date columns also have the `date_min`
+        and `date_max` of each chunk in `yyyy-mm-dd` format.
+    transformations: `List[Dict[str, Any]]`, required
+        The transformations of the guide
+    window: `Dict[str, str]`, optional (default=None)
+        The date window, including the `column` and the `start` and `end` dates in `yyyy-mm-dd` format.
+
+    Returns
+    -----------
+    The boolean `numpy.ndarray` which is `True` for the chunks that have to be read.
+    """
+    admitted = numpy.ones(len(zone_maps["row_counts"]), dtype=bool)
+    for single_transformation in transformations:
+        if single_transformation["name"] == "random_selection":
+            break
+        if single_transformation["name"] in FILTER_TRANSFORMATIONS and \
+                single_transformation["column"] in zone_maps["columns"]:
+            admitted &= zone_map_admits(zone_maps["columns"][single_transformation["column"]], single_transformation)
+
+    if window is not None and "date_min" in zone_maps["columns"].get(window["column"], dict()):
+        zone_map = zone_maps["columns"][window["column"]]
+        for index, (date_min, date_max) in enumerate(zip(zone_map["date_min"], zone_map["date_max"])):
+            if date_min is not None and date_max is not None:
+                admitted[index] &= date_max >= window["start"] and date_min <= window["end"]
+
+    return admitted
+
+
+def initial_transformation_state(
+        dataframe: pandas.DataFrame,
+        zone_maps: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    The :func:`initial_transformation_state` prepares the state of the transformation engine before any
+    transformation is applied. A state includes the `dataframe` after the last `random_selection` (or the input
+    dataframe) and the combined `mask` of the filters that came after it (`None` if there is none), and the
+    `zone_maps` of the input dataframe which help with skipping its chunks until a `random_selection` happens.
+
+    The states are never modified once they are built, so they can be kept and resumed from later.
+
+    Parameters
+    -----------
+    dataframe: `pandas.DataFrame`, required
+        The input dataframe, which is not modified
+    zone_maps: `Dict[str, Any]`, optional (default=None)
+        The zone maps of the input dataframe (please refer to :func:`zone_map_row_groups`) with the names of
+        its columns.
 
+    Returns
+    -----------
+    The state as a `Dict[str, Any]`.
+    """
+    if zone_maps is not None and numpy.sum(zone_maps["row_counts"]) != dataframe.shape[0]:
+        zone_maps = None
+    return {"dataframe": dataframe, "mask": None, "zone_maps": zone_maps}
+
+
+def advance_transformation_state(state: Dict[str, Any], single_transformation: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The :func:`advance_transformation_state` applies one more transformation to a state of the transformation engine.
+
+    Parameters
+    -----------
+    state: `Dict[str, Any]`, required
+        The state, please refer to :func:`initial_transformation_state`.
+    single_transformation: `Dict[str, Any]`, required
+        The transformation, please refer to :func:`transform_dataframe` for its format.
+
+    Returns
+    -----------
+    The new state as a `Dict[str, Any]`.
+    """
+    if single_transformation["name"] in FILTER_TRANSFORMATIONS:
+        # the rows that may be kept, namely the remaining ones in the chunks that the zone maps do not rule out
+        candidates = state["mask"]
+        zone_maps = state["zone_maps"]
+        if zone_maps is not None and single_transformation["column"] in zone_maps["columns"]:
+            admitted = zone_map_admits(zone_maps["columns"][single_transformation["column"]], single_transformation)
+            if not admitted.all():
+                candidates = numpy.repeat(admitted, zone_maps["row_counts"])
+                if state["mask"] is not None:
+                    candidates &= state["mask"]
+
+        rows = None
+        if candidates is not None:
+            remaining = numpy.count_nonzero(candidates)
+            if remaining <= SPARSE_EVALUATION_DENSITY * candidates.shape[0]:
+                rows = numpy.flatnonzero(candidates)
+        mask = transformation_mask(state["dataframe"], single_transformation, rows=rows)
+        if candidates is not None:
+            mask &= candidates
+        return {"dataframe": state["dataframe"], "mask": mask, "zone_maps": zone_maps}
     elif single_transformation["name"] == "random_selection":
-        number_of_elements = single_transformation["row_count"]
-        dataframe = dataframe.sample(number_of_elements, replace=True)
+        dataframe = transformation_state_output(state).sample(
+            single_transformation["row_count"], replace=True, random_state=single_transformation.get("seed", None))
+        return {"dataframe": dataframe, "mask": None, "zone_maps": None}
+    else:
+        raise ValueError("unknown transformation: {}".format(single_transformation["name"]))
+
+
+def transformation_state_output(state: Dict[str, Any]) -> pandas.DataFrame:
+    """
+    The :func:`transformation_state_output` selects the rows of a state of the transformation engine.
+    No copy is made if no row is removed.
+
+    Parameters
+    -----------
+    state: `Dict[str, Any]`, required
+        The state, please refer to :func:`initial_transformation_state`.
+
+    Returns
+    -----------
+    The `pandas.DataFrame` of the selected rows.
+    """
+    if state["mask"] is None or state["mask"].all():
+        return state["dataframe"]
+    return state["dataframe"][state["mask"]]
+
+
+def transformation_states(
+        state: Dict[str, Any],
+        transformations: List[Dict[str, Any]],
+        statistics: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    The :func:`transformation_states` evaluates the plan for a list of transformations, starting from a state of
+    the transformation engine. The rows are only selected when a `random_selection` barrier is reached.
+
+    Parameters
+    -----------
+    state: `Dict[str, Any]`, required
+        The state to start from, please refer to :func:`initial_transformation_state`.
+    transformations: `List[Dict[str, Any]]`, required
+        The transformations that are to be applied
+    statistics: `Dict[str, Dict[str, Any]]`, optional (default=None)
+        The statistics of the columns. If given, the plan of :func:`plan_transformations` is used, otherwise the
+        one of :func:`compile_transformations` which keeps the user's order.
+
+    Returns
+    -----------
+    This generator yields the number of transformations, from the beginning of the list, that the state
+    represents, along with the state. When the filters are reordered, the states in the middle of a stage
+    that do not match a prefix of the list are not yielded.
+    """
+    if statistics is None:
+        plan = compile_transformations(transformations)
     else:
-        raise ValueError
+        plan = plan_transformations(transformations, statistics)
+
+    count = 0
+    evaluated = set()
+    for stage in plan:
+        for index, single_transformation in zip(stage["indices"], stage["steps"]):
+            state = advance_transformation_state(state, single_transformation)
+            evaluated.add(index)
+            while count in evaluated:
+                count += 1
+            if len(evaluated) == count:
+                yield count, state
+
+
+def apply_transformations(dataframe: pandas.DataFrame, transformations: List[Dict[str, Any]]) -> pandas.DataFrame:
+    """
+    The :func:`apply_transformations` applies a list of transformations to the dataframe, please refer to
+    :func:`transformation_states`.
+
+    Parameters
+    -----------
+    dataframe: `pandas.DataFrame`, required
+        The input dataframe, which is not modified
+    transformations: `List[Dict[str, Any]]`, required
+        The transformations of the guide
+
+    Returns
+    -----------
+    The transformed `pandas.DataFrame`.
+    """
+    state = initial_transformation_state(dataframe)
+    for _, state in transformation_states(state, transformations):
+        pass
+    return transformation_state_output(state)
+
+
+def apply_single_transformation(dataframe: pandas.DataFrame, single_transformation: Dict[str, Any]) -> pandas.DataFrame:
+    """
+    The :func:`apply_single_transformation` applies one transformation to the dataframe, please refer
+    to :func:`apply_transformations`.
+    """
+    return apply_transformations(dataframe, [single_transformation])
+
+
+def map_columns(dataframe: pandas.DataFrame, column_mapping: Dict[str, str]) -> pandas.DataFrame:
+    """
+    The :func:`map_columns` adds the columns of the guide's `column_mapping` to the dataframe. The mapped columns
+    are aliases of the original ones and none of the columns are copied (the dataframe that is given might be
+    shared with the cache, so it is never modified).
+
+    Parameters
+    -----------
+    dataframe: `pandas.DataFrame`, required
+        The input dataframe
+    column_mapping: `Dict[str, str]`, required
+        The mapping from the original column names to the new ones
+
+    Returns
+    -----------
+    The `pandas.DataFrame` including the original and the mapped columns.
+    """
+    output_dict = dict()
+    for column in dataframe.columns.tolist():
+        output_dict[column] = dataframe[column]
+
+    for column in column_mapping.keys():
+        output_dict[column_mapping[column]] = dataframe[column]
+
+    return pandas.DataFrame(output_dict, columns=list(output_dict.keys()), copy=False)
 
-    return dataframe
+
+def guide_columns(guide: Dict[Any, Any]) -> List[str]:
+    """
+    The :func:`guide_columns` lists the columns of the original dataframe that a guide refers to, namely
+    the sources of its `column_mapping` and the columns used in its transformations (the mapped names are
+    resolved back to their sources).
+
+    Parameters
+    -----------
+    guide: `Dict[str, Any]`, required
+        The guide, please refer to :func:`transform_dataframe` for its format.
+
+    Returns
+    -----------
+    The `List[str]` of the column names, without repetitions.
+    """
+    column_mapping = guide.get("column_mapping", dict())
+    source_of = {column_mapping[column]: column for column in column_mapping.keys()}
+
+    columns = list(column_mapping.keys())
+    for single_transformation in guide.get("transformations", []):
+        if "column" in single_transformation.keys():
+            columns.append(source_of.get(single_transformation["column"], single_transformation["column"]))
+
+    return list(dict.fromkeys(columns))
+
+
+def guide_fingerprint(guide: Dict[Any, Any]) -> str:
+    """
+    The :func:`guide_fingerprint` returns the canonical JSON of the parts of the guide that
+    :func:`transform_dataframe` depends on (its `column_mapping` and `transformations`), with sorted keys.
+    Two guides with the same fingerprint produce the same output on the same dataframe.
+
+    Parameters
+    -----------
+    guide: `Dict[str, Any]`, required
+        The guide, please refer to :func:`transform_dataframe` for its format.
+
+    Returns
+    -----------
+    The `str` fingerprint.
+    """
+    return json.dumps(
+        {
+            "column_mapping": guide.get("column_mapping", dict()),
+            "transformations": guide.get("transformations", [])
+        },
+        sort_keys=True,
+        separators=(',', ':')
+    )
+
+
+def is_deterministic(guide: Dict[Any, Any]) -> bool:
+    """
+    The :func:`is_deterministic` checks whether or not the output of :func:`transform_dataframe` is determined
+    by the guide, which is not the case if a `random_selection` has no `seed`.
+
+    Parameters
+    -----------
+    guide: `Dict[str, Any]`, required
+        The guide, please refer to :func:`transform_dataframe` for its format.
+
+    Returns
+    -----------
+    `True` if the output can be reused for the same guide.
+    """
+    for single_transformation in guide.get("transformations", []):
+        if single_transformation["name"] == "random_selection" and single_transformation.get("seed") is None:
+            return False
+    return True
 
 
 def transform_dataframe(
@@ -82,6 +734,11 @@ def transform_dataframe(
                     "column": "y",
                     "type": ">"
                     "value": 2
+                },
+                {
+                    "name": "random_selection",
+                    "row_count": 100,
+                    "seed": 2019
                 }
             ]
         }
@@ -106,21 +763,104 @@ def transform_dataframe(
     with a bundle of metadata which might be used in the new visualization's html file in order to show more
     useful information to the user.
     """
-    output_dict = dict()
-    for column in dataframe.columns.tolist():
-        output_dict[column] = dataframe[column].tolist()
-
-    if "column_mapping" in guide.keys():
-        column_mapping = guide["column_mapping"]
-        for column in column_mapping.keys():
-            output_dict[column_mapping[column]] = dataframe[column].tolist()
-
-    output = pandas.DataFrame(output_dict)
+    output = map_columns(dataframe, guide.get("column_mapping", dict()))
 
     if "transformations" in guide.keys():
-        transformations = guide["transformations"]
-        for single_transformation in transformations:
-            output = apply_single_transformation(output, single_transformation)
+        output = apply_transformations(output, guide["transformations"])
 
     return output
 
+
+def reservoir_sample(
+        chunks: Iterator[pandas.DataFrame],
+        row_count: int,
+        seed: Optional[int] = None
+) -> pandas.DataFrame:
+    """
+    The :func:`reservoir_sample` is the streaming version of the `random_selection` transformation: it selects
+    `row_count` rows, uniformly and with replacement, from all of the rows of the chunks while keeping only
+    `row_count` rows in memory. Each of the output rows is an independent reservoir of size one, which is
+    replaced by a random row of the next chunk with the probability of that chunk's share of the rows seen so far.
+
+    Parameters
+    -----------
+    chunks: `Iterator[pandas.DataFrame]`, required
+        The chunks of the dataframe
+    row_count: `int`, required
+        The number of rows to select
+    seed: `int`, optional (default=None)
+        The seed of the random number generator
+
+    Returns
+    -----------
+    The `pandas.DataFrame` of the selected rows.
+    """
+    random_state = numpy.random.RandomState(seed)
+    reservoir = None
+    seen = 0
+    for chunk in chunks:
+        if chunk.shape[0] == 0:
+            if reservoir is None:
+                reservoir = chunk
+            continue
+        seen += chunk.shape[0]
+        replaced = numpy.flatnonzero(random_state.random_sample(row_count) < float(chunk.shape[0]) / seen)
+        selected = chunk.iloc[random_state.randint(0, chunk.shape[0], size=replaced.shape[0])]
+        if seen == chunk.shape[0]:
+            # this is the first chunk with rows, every reservoir is filled from it
+            reservoir = selected
+        else:
+            positions = numpy.arange(row_count)
+            positions[replaced] = row_count + numpy.arange(replaced.shape[0])
+            reservoir = pandas.concat([reservoir, selected]).iloc[positions]
+
+    if seen == 0:
+        raise ValueError("there is no row to select from")
+    return reservoir
+
+
+def transform_dataframe_chunks(
+        chunks: Iterator[pandas.DataFrame],
+        guide: Dict[Any, Any]
+) -> Iterator[pandas.DataFrame]:
+    """
+    The :func:`transform_dataframe_chunks` applies a guide to a dataframe that is given in chunks, with the same
+    output as :func:`transform_dataframe` on the whole dataframe (the `random_selection` picks different rows
+    for the same `seed` though). The transformations before the first `random_selection` are applied to each
+    chunk, which is then reservoir sampled (please refer to :func:`reservoir_sample`), and the rest of them are
+    applied to the sample in memory.
+
+    Parameters
+    -----------
+    chunks: `Iterator[pandas.DataFrame]`, required
+        The chunks of the input dataframe
+    guide: `Dict[str, Any]`, required
+        The guide, please refer to :func:`transform_dataframe` for its format.
+
+    Returns
+    -----------
+    This generator yields the transformed chunks as instances of `pandas.DataFrame`.
+    """
+    column_mapping = guide.get("column_mapping", dict())
+    transformations = guide.get("transformations", [])
+
+    # checking the transformations before reading any chunk
+    compile_transformations(transformations)
+    barrier = len(transformations)
+    for index, single_transformation in enumerate(transformations):
+        if single_transformation["name"] == "random_selection":
+            barrier = index
+            break
+
+    transformed_chunks = (
+        apply_transformations(map_columns(chunk, column_mapping), transformations[:barrier]) for chunk in chunks)
+    if barrier == len(transformations):
+        for chunk in transformed_chunks:
+            yield chunk
+    else:
+        sample = reservoir_sample(
+            transformed_chunks,
+            row_count=transformations[barrier]["row_count"],
+            seed=transformations[barrier].get("seed", None)
+        )
+        yield apply_transformations(sample, transformations[barrier + 1:])
@@ -0,0 +1,1089 @@
+import os
+import fcntl
+import contextlib
+from types import SimpleNamespace
+import numpy
+import pandas
+import pyarrow
+import pyarrow.parquet
+from typing import List, Optional, Dict, Any, Iterator
+from application import application_directory, db, dataframe_cache, transformation_cache
+from application.libraries.caching import size_in_bytes
+from application.libraries.files import temporary_path
+from application.libraries.dates import quantize_dates
+from application.libraries.text import COMMENT_COLUMNS, comment_column, token_frequencies
+from application.libraries.dtypes import infer_column_dtypes, compact_dataframe, appended_column_dtypes
+from application.libraries.zone_maps import is_date_column, compute_zone_maps, mapped_zone_maps
+from application.libraries.partitions import build_partitions, append_partitions, sweep_partitions, \
+    requested_partition, read_partition
+from application.libraries.token_index import TOKEN_INDEX_DIRECTORY, index_comments, save_token_index, \
+    load_token_index
+from application.libraries.rollups import ROLLUP_DIRECTORY, STEP_COLUMNS, SUBJECT_COLUMN, is_step_dataframe, \
+    aggregate_steps, merge_rollups, rollup_resolutions, file_state, appended_chunks, subject_buckets
+from application.libraries.transformation import guide_fingerprint, is_deterministic, map_columns, \
+    initial_transformation_state, transformation_states, transformation_state_output, column_statistics, \
+    plan_transformations, transform_dataframe_chunks, zone_map_row_groups, FILTER_TRANSFORMATIONS
+
+# the columnar copies of the registered dataframes are kept in this folder (relative to the application directory)
+COLUMNAR_DIRECTORY = 'warehouse/columnar'
+
+# number of rows in each parquet row group
+ROW_GROUP_SIZE = 65536
+
+# the lock files which keep the processes from refreshing the same columnar copy at once are kept in this folder
+LOCK_DIRECTORY = 'warehouse/locks'
+
+# the fields of the `Dataframe` entity which the reads use
+DATAFRAME_FIELDS = [
+    'id', 'name', 'relative_path', 'columnar_relative_path', 'source_version', 'source_state', 'zone_maps',
+    'column_dtypes', 'rollup', 'partitions', 'token_index'
+]
+
+
+@contextlib.contextmanager
+def columnar_copy_lock(dataframe_entity) -> Iterator[None]:
+    """
+    The :func:`columnar_copy_lock` holds the lock of a registered dataframe while its columnar copy (and everything
+    that is derived from it) is refreshed, which is an exclusive lock on a file so that it is held against the
+    other processes (e.g. the workers of the server) as well as the other threads.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    """
+    lock_path = os.path.join(application_directory, LOCK_DIRECTORY, '{}.lock'.format(dataframe_entity.id))
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def source_version(dataframe_entity) -> str:
+    """
+    The :func:`source_version` computes the version marker of the csv file behind a registered dataframe.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+
+    Returns
+    ----------
+    The output is a `str` made of the modification time (in nanoseconds) and the size of the file.
+    """
+    stat = os.stat(os.path.join(application_directory, dataframe_entity.relative_path))
+    return '{}-{}'.format(stat.st_mtime_ns, stat.st_size)
+
+
+def write_columnar_file(
+        csv_path: str,
+        columnar_path: str,
+        column_dtypes: Optional[Dict[str, Dict[str, Any]]] = None
+) -> None:
+    """
+    The :func:`write_columnar_file` converts a csv file to parquet one row group at a time, so the csv file
+    never has to fit in memory. The types of the columns are the compact ones (please refer to
+    :func:`compact_dataframe`) and the rest are inferred from the first row group.
+
+    Parameters
+    ----------
+    csv_path: `str`, required
+        The path to the csv file
+    columnar_path: `str`, required
+        The path to the parquet file
+    column_dtypes: `Dict[str, Dict[str, Any]]`, optional (default=None)
+        The compact dtypes of the columns, please refer to :func:`infer_column_dtypes`.
+
+    Raises
+    ----------
+    `pyarrow.ArrowException` or `TypeError` if a row group does not fit the types of the first one.
+    """
+    writer = None
+    try:
+        for chunk in pandas.read_csv(csv_path, chunksize=ROW_GROUP_SIZE):
+            chunk = compact_dataframe(chunk, column_dtypes)
+            if writer is None:
+                table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+                writer = pyarrow.parquet.ParquetWriter(columnar_path, table.schema)
+            else:
+                table = pyarrow.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+            writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        # the file has no rows
+        compact_dataframe(pandas.read_csv(csv_path), column_dtypes).to_parquet(columnar_path, index=False)
+
+
+def build_columnar_copy(dataframe_entity) -> None:
+    """
+    The :func:`build_columnar_copy` parses the registered csv file once and writes it as a parquet file,
+    so that the later reads can load only the columns they need. The compact dtypes of the columns (please refer
+    to :func:`infer_column_dtypes`) are found in a first pass and used both in the columnar copy and in all of
+    the later reads. The zone maps (please refer to :func:`compute_zone_maps`), the partitions of the subjects
+    (please refer to :func:`build_partitions`), the rollup of the step dataframes (please refer to
+    :func:`refresh_rollup`) and the token index of the comment dataframes (please refer to
+    :func:`refresh_token_index`) are computed at the end.
+    The entity is updated in place, and committing it is left to the caller.
+
+    If the csv cannot be represented in parquet (e.g. a column with mixed types), the columnar path
+    is left empty and the reads fall back to the csv file.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    """
+    version = source_version(dataframe_entity)
+    csv_path = os.path.join(application_directory, dataframe_entity.relative_path)
+    state = file_state(csv_path)
+
+    columnar_relative_path = os.path.join(COLUMNAR_DIRECTORY, '{}.parquet'.format(dataframe_entity.id))
+    columnar_path = os.path.join(application_directory, columnar_relative_path)
+    os.makedirs(os.path.dirname(columnar_path), exist_ok=True)
+
+    column_dtypes = infer_column_dtypes(csv_path, chunk_size=ROW_GROUP_SIZE)
+    # writing to a temporary file first so that concurrent readers never see a partial file
+    columnar_temporary_path = temporary_path(columnar_path)
+    try:
+        try:
+            write_columnar_file(csv_path, columnar_temporary_path, column_dtypes=column_dtypes)
+        except (pyarrow.ArrowException, TypeError):
+            # the types that were inferred from the first rows do not fit the rest of the file
+            compact_dataframe(pandas.read_csv(csv_path), column_dtypes).to_parquet(
+                columnar_temporary_path, index=False, row_group_size=ROW_GROUP_SIZE)
+        os.replace(columnar_temporary_path, columnar_path)
+    except (pyarrow.ArrowException, TypeError):
+        if os.path.isfile(columnar_temporary_path):
+            os.remove(columnar_temporary_path)
+        columnar_relative_path = None
+
+    dataframe_entity.columnar_relative_path = columnar_relative_path
+    dataframe_entity.source_version = version
+    dataframe_entity.source_state = state
+    dataframe_entity.column_dtypes = column_dtypes
+    dataframe_entity.zone_maps = None if columnar_relative_path is None else compute_zone_maps(columnar_path)
+    build_partitions(dataframe_entity)
+    refresh_rollup(dataframe_entity)
+    refresh_token_index(dataframe_entity)
+
+
+def append_columnar_copy(dataframe_entity) -> bool:
+    """
+    The :func:`append_columnar_copy` brings the columnar copy of a registered dataframe up to date if its csv file
+    was only appended to since the copy was built (please refer to :func:`appended_chunks`). Only the appended
+    rows are parsed: they are added after the row groups of the copy (the last row group is filled up first, and
+    their new categories are added to the categorical columns), and the zone maps of the new row groups, the
+    partitions of the subjects of the new rows, the rollup and the token index are updated with them. The entity
+    is updated in place, and committing it is left to the caller.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+
+    Returns
+    ----------
+    `True` if the copy was brought up to date, `False` if it has to be built again (e.g. the csv file was changed
+    in any other way, or the appended rows do not fit the compact dtypes of the columns).
+    """
+    if dataframe_entity.columnar_relative_path is None or dataframe_entity.source_state is None:
+        return False
+    csv_path = os.path.join(application_directory, dataframe_entity.relative_path)
+    columnar_path = os.path.join(application_directory, dataframe_entity.columnar_relative_path)
+    if not os.path.isfile(columnar_path):
+        return False
+
+    version = source_version(dataframe_entity)
+    state = file_state(csv_path)
+    chunks = appended_chunks(csv_path, dataframe_entity.source_state, chunk_size=ROW_GROUP_SIZE)
+    if chunks is None:
+        return False
+
+    if state["size"] > dataframe_entity.source_state["size"]:
+        parquet_file = pyarrow.parquet.ParquetFile(columnar_path)
+        schema = parquet_file.schema_arrow
+        number_of_rows = parquet_file.metadata.num_rows
+        # the last row group is written again along with the appended rows if it is not full
+        first_row_group = parquet_file.num_row_groups
+        if first_row_group > 0 and parquet_file.metadata.row_group(first_row_group - 1).num_rows < ROW_GROUP_SIZE:
+            first_row_group -= 1
+
+        column_dtypes = dataframe_entity.column_dtypes
+        columnar_temporary_path = temporary_path(columnar_path)
+        try:
+            with pyarrow.parquet.ParquetWriter(columnar_temporary_path, schema) as writer:
+                for row_group in range(first_row_group):
+                    writer.write_table(parquet_file.read_row_group(row_group), row_group_size=ROW_GROUP_SIZE)
+                pending = [parquet_file.read_row_group(e) for e in range(first_row_group, parquet_file.num_row_groups)]
+                for chunk in chunks:
+                    column_dtypes = appended_column_dtypes(chunk, column_dtypes)
+                    if column_dtypes is None:
+                        raise TypeError("The appended rows do not fit the dtypes of the columns.")
+                    pending.append(pyarrow.Table.from_pandas(
+                        compact_dataframe(chunk, column_dtypes), schema=schema, preserve_index=False))
+                    table = pyarrow.concat_tables(pending)
+                    full_rows = table.num_rows - table.num_rows % ROW_GROUP_SIZE
+                    if full_rows > 0:
+                        writer.write_table(table.slice(0, full_rows), row_group_size=ROW_GROUP_SIZE)
+                    pending = [table.slice(full_rows)]
+                table = pyarrow.concat_tables(pending)
+                if table.num_rows > 0:
+                    writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+        except (pyarrow.ArrowException, TypeError, ValueError):
+            if os.path.isfile(columnar_temporary_path):
+                os.remove(columnar_temporary_path)
+            return False
+        os.replace(columnar_temporary_path, columnar_path)
+
+        dataframe_entity.column_dtypes = column_dtypes
+        dataframe_entity.zone_maps = compute_zone_maps(
+            columnar_path, zone_maps=dataframe_entity.zone_maps, first_row_group=first_row_group)
+        append_partitions(dataframe_entity, number_of_rows)
+
+    dataframe_entity.source_version = version
+    dataframe_entity.source_state = state
+    refresh_rollup(dataframe_entity)
+    refresh_token_index(dataframe_entity)
+    return True
+
+
+def refresh_rollup(dataframe_entity) -> None:
+    """
+    The :func:`refresh_rollup` keeps the rollup of a registered step dataframe (please refer to
+    :mod:`application.libraries.rollups`) up to date. If the csv file was only appended to since the rollup was
+    built, only the appended rows are read and added to it, otherwise it is built again from the columnar copy.
+    The dataframes the timestamps of which are not dates get no rollup. The entity is updated in place, and
+    committing it is left to the caller.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    """
+    if not is_step_dataframe(available_columns(dataframe_entity)):
+        dataframe_entity.rollup = None
+        return
+
+    csv_path = os.path.join(application_directory, dataframe_entity.relative_path)
+    rollup_relative_path = os.path.join(ROLLUP_DIRECTORY, '{}.parquet'.format(dataframe_entity.id))
+    rollup_path = os.path.join(application_directory, rollup_relative_path)
+    os.makedirs(os.path.dirname(rollup_path), exist_ok=True)
+    state = file_state(csv_path)
+
+    previous, chunks = [], None
+    if dataframe_entity.rollup is not None and os.path.isfile(rollup_path):
+        chunks = appended_chunks(csv_path, dataframe_entity.rollup, chunk_size=ROW_GROUP_SIZE)
+        if chunks is not None:
+            previous = pandas.read_parquet(rollup_path)
+            previous = [previous[previous['resolution'] == 'day'].drop(columns=['resolution'])]
+    if chunks is None:
+        chunks = iterate_registered_dataframe(dataframe_entity, columns=STEP_COLUMNS + [SUBJECT_COLUMN])
+
+    try:
+        rollup = rollup_resolutions(merge_rollups(previous + [aggregate_steps(e) for e in chunks]))
+    except (ValueError, TypeError):
+        # the timestamps are not dates that can be quantized (please refer to :func:`quantize_dates`), in which
+        # case the dataframe has no rollup and the visualizations aggregate its rows themselves
+        dataframe_entity.rollup = None
+        return
+    rollup_temporary_path = temporary_path(rollup_path)
+    rollup.to_parquet(rollup_temporary_path, index=False)
+    os.replace(rollup_temporary_path, rollup_path)
+    dataframe_entity.rollup = dict(state, relative_path=rollup_relative_path)
+
+
+def refresh_token_index(dataframe_entity) -> None:
+    """
+    The :func:`refresh_token_index` keeps the token index of a registered dataframe with comments up to date
+    (please refer to :func:`index_comments`). If the csv file was only appended to since the index was built, only
+    the appended comments are tokenized and added to it.
+    The entity is updated in place, and committing it is left to the caller.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    """
+    column = comment_column(available_columns(dataframe_entity))
+    if column is None:
+        dataframe_entity.token_index = None
+        return
+
+    csv_path = os.path.join(application_directory, dataframe_entity.relative_path)
+    index_relative_path = os.path.join(TOKEN_INDEX_DIRECTORY, '{}.npz'.format(dataframe_entity.id))
+    index_path = os.path.join(application_directory, index_relative_path)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    state = file_state(csv_path)
+
+    previous, chunks = None, None
+    if dataframe_entity.token_index is not None and dataframe_entity.token_index["column"] == column and \
+            os.path.isfile(index_path):
+        chunks = appended_chunks(csv_path, dataframe_entity.token_index, chunk_size=ROW_GROUP_SIZE)
+        if chunks is not None:
+            previous = load_token_index(index_path)
+    if chunks is None:
+        chunks = iterate_registered_dataframe(dataframe_entity, columns=[column])
+
+    save_token_index(index_path, index_comments((e[column] for e in chunks), previous=previous))
+    dataframe_entity.token_index = dict(state, relative_path=index_relative_path, column=column)
+
+
+def ensure_columnar_copy(dataframe_entity) -> None:
+    """
+    The :func:`ensure_columnar_copy` brings the columnar copy of a registered dataframe up to date if it does not
+    exist yet or if the csv file has changed since it was built. If the csv file was only appended to, the appended
+    rows are added to the copy (please refer to :func:`append_columnar_copy`), otherwise it is built again. The
+    copy is refreshed while holding the lock of the dataframe (please refer to :func:`columnar_copy_lock`), and
+    the ones which were refreshed by another process in the meantime are not refreshed again.
+
+    This is not called while handling the requests (which read the csv file of a stale copy instead, please refer
+    to :func:`readable_dataframe`), but by the `flask dataframes refresh` command.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    """
+    if is_columnar_copy_current(dataframe_entity):
+        return
+
+    with columnar_copy_lock(dataframe_entity):
+        # the entity is read again, since another process may have refreshed the copy already
+        db.session.refresh(dataframe_entity)
+        if is_columnar_copy_current(dataframe_entity):
+            return
+        if not append_columnar_copy(dataframe_entity):
+            build_columnar_copy(dataframe_entity)
+        db.session.commit()
+        sweep_partitions(dataframe_entity)
+
+
+def is_columnar_copy_current(dataframe_entity) -> bool:
+    """
+    The :func:`is_columnar_copy_current` checks whether the columnar copy of a registered dataframe was built from
+    the current version of its csv file.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+
+    Returns
+    ----------
+    `True` if the copy is up to date (or the dataframe is read from the csv file, which is up to date too).
+    """
+    if dataframe_entity.source_version != source_version(dataframe_entity):
+        return False
+    return dataframe_entity.columnar_relative_path is None or os.path.isfile(
+        os.path.join(application_directory, dataframe_entity.columnar_relative_path))
+
+
+def detached_dataframe(dataframe_entity, **fields) -> SimpleNamespace:
+    """
+    The :func:`detached_dataframe` copies the fields of a registered dataframe entity that the reads use (please
+    refer to `DATAFRAME_FIELDS`) to an object which is not bound to the database session, so that it can be
+    passed to the other processes (e.g. the jobs of the ML toolkit) and read there.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    fields: `Dict[str, Any]`, optional
+        The fields that are replaced in the copy
+
+    Returns
+    ----------
+    The copy as a `SimpleNamespace`.
+    """
+    return SimpleNamespace(**dict({e: getattr(dataframe_entity, e) for e in DATAFRAME_FIELDS}, **fields))
+
+
+def readable_dataframe(dataframe_entity):
+    """
+    The :func:`readable_dataframe` returns what the reads of a registered dataframe use. If its columnar copy is
+    up to date, that is the entity itself. Otherwise (e.g. the csv file was changed and the copy has not been
+    refreshed yet by `flask dataframes refresh`), the copy is not built while handling the request, and a
+    detached entity (please refer to :func:`detached_dataframe`) without the columnar copy and everything that
+    is derived from it is returned, which reads the csv file as it is. Its `source_version` is marked so that its
+    entries in the caches are never mistaken for the ones of the columnar copy.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity (or a detached one)
+
+    Returns
+    ----------
+    The entity that the reads use.
+    """
+    version = source_version(dataframe_entity)
+    if dataframe_entity.source_version == 'csv-{}'.format(version) or is_columnar_copy_current(dataframe_entity):
+        return dataframe_entity
+    return detached_dataframe(
+        dataframe_entity,
+        columnar_relative_path=None,
+        source_version='csv-{}'.format(version),
+        source_state=None,
+        zone_maps=None,
+        column_dtypes=None,
+        rollup=None,
+        partitions=None,
+        token_index=None
+    )
+
+
+def register_dataframe(name: str, description: str, relative_path: str):
+    """
+    The :func:`register_dataframe` registers a csv file (relative to the application directory) as a
+    dataframe in ViSierra, and converts it to the columnar format once.
+
+    Parameters
+    ----------
+    name: `str`, required
+        The unique name of the dataframe, which is what the user enters in the forms
+    description: `str`, required
+        The description of the dataframe
+    relative_path: `str`, required
+        The path to the csv file, relative to the application directory (e.g. `warehouse/sample_df.csv`)
+
+    Returns
+    ----------
+    The output of this method is the registered `Dataframe` entity.
+    """
+    from application.entities import Dataframe
+    dataframe_entity = Dataframe(name=name, description=description, relative_path=relative_path)
+    db.session.add(dataframe_entity)
+
+    # the id is needed for the name of the columnar copy
+    db.session.flush()
+    build_columnar_copy(dataframe_entity)
+    db.session.commit()
+    sweep_partitions(dataframe_entity)
+    return dataframe_entity
+
+
+def available_columns(dataframe_entity) -> List[str]:
+    """
+    The :func:`available_columns` returns the column names of a registered dataframe without reading its data.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+
+    Returns
+    ----------
+    The `List[str]` of the column names.
+    """
+    dataframe_entity = readable_dataframe(dataframe_entity)
+    key = (dataframe_entity.id, dataframe_entity.source_version)
+    columns = dataframe_cache.get(key)
+    if columns is None:
+        # the entries of the previous versions of this dataframe will not be used anymore
+        dataframe_cache.invalidate(lambda e: e[0] == key[0] and e[1] != key[1])
+        if dataframe_entity.columnar_relative_path is not None:
+            columns = pyarrow.parquet.read_schema(
+                os.path.join(application_directory, dataframe_entity.columnar_relative_path)).names
+        else:
+            columns = pandas.read_csv(
+                os.path.join(application_directory, dataframe_entity.relative_path), nrows=0).columns.tolist()
+        dataframe_cache.put(key, columns)
+    return columns
+
+
+def read_registered_dataframe(
+        dataframe_entity,
+        columns: Optional[List[str]] = None,
+        partition: Optional[Any] = None,
+        rows: Optional[numpy.ndarray] = None
+) -> pandas.DataFrame:
+    """
+    The :func:`read_registered_dataframe` reads a registered dataframe from its columnar copy, loading only
+    the requested columns in their compact dtypes (please refer to :func:`infer_column_dtypes`).
+
+    The columns are kept in the process-wide `dataframe_cache` under (`id`, `source_version`, `'column'`, column
+    name), apart from what is derived from them (e.g. the rollup under (`id`, `source_version`, `'rollup'`)), so
+    repeated requests on the same dataframe do not touch the disk, and a changed csv file is never served
+    from the cache. The returned dataframe shares its data with the cache, so it must not be modified in place.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    columns: `List[str]`, optional (default=None)
+        The columns that are needed. The ones that do not exist in the dataframe are ignored (these are usually
+        the names that the guide's `column_mapping` introduces). If `None`, all of the columns will be read.
+    partition: `Any`, optional (default=None)
+        The subject, the rows of which are to be read (please refer to :func:`build_partitions`). If `None`, or if
+        the dataframe is not partitioned, all of the rows are read.
+    rows: `numpy.ndarray`, optional (default=None)
+        The positions of the rows to keep (e.g. the ones found by :func:`date_window_rows`). The whole columns are
+        still read and cached, but only these rows are copied to the output. If `None`, all of the rows are kept.
+
+    Returns
+    ----------
+    The output of this method is the `pandas.DataFrame` with the requested columns in the file's order.
+    """
+    dataframe_entity = readable_dataframe(dataframe_entity)
+    all_columns = available_columns(dataframe_entity)
+    if columns is not None:
+        requested_columns = set(columns)
+        columns = [e for e in all_columns if e in requested_columns]
+    else:
+        columns = all_columns
+
+    partition = requested_partition(dataframe_entity, partition)
+    key = (dataframe_entity.id, dataframe_entity.source_version)
+    if partition is not None:
+        key = key + ('partition', partition)
+    output_dict = dict()
+    for column in columns:
+        output_dict[column] = dataframe_cache.get(key + ('column', column))
+    missing_columns = [column for column in columns if output_dict[column] is None]
+
+    if len(missing_columns) > 0:
+        if partition is not None:
+            data = read_partition(dataframe_entity, partition, missing_columns)
+        elif dataframe_entity.columnar_relative_path is not None:
+            data = pandas.read_parquet(
+                os.path.join(application_directory, dataframe_entity.columnar_relative_path),
+                columns=missing_columns
+            )
+        else:
+            data = pandas.read_csv(
+                os.path.join(application_directory, dataframe_entity.relative_path), usecols=missing_columns)
+        data = compact_dataframe(data, dataframe_entity.column_dtypes)
+        for column in missing_columns:
+            output_dict[column] = data[column]
+            dataframe_cache.put(key + ('column', column), data[column])
+
+    if rows is not None:
+        output_dict = {column: output_dict[column].take(rows) for column in columns}
+    return pandas.DataFrame(output_dict, columns=columns, copy=False)
+
+
+def date_index(dataframe_entity, column: str, partition: Optional[Any] = None) -> Optional[pandas.DataFrame]:
+    """
+    The :func:`date_index` builds the sorted index of a date column of a registered dataframe, so that the rows
+    in a range of dates can be found by binary search (please refer to :func:`date_window_rows`). The rows keep
+    their order in the file, and the index is cached next to the columns (in the process-wide `dataframe_cache`).
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    column: `str`, required
+        The name of the date column
+    partition: `Any`, optional (default=None)
+        The subject, the rows of which are indexed, please refer to :func:`read_registered_dataframe`.
+
+    Returns
+    ----------
+    The `pandas.DataFrame` with the `day` (`yyyymmdd`, please refer to :func:`quantize_dates`) of the rows which
+    have a date in ascending order, and the position of each one as its `row`. The output is `None` if
+    the column does not exist or does not hold dates.
+    """
+    dataframe_entity = readable_dataframe(dataframe_entity)
+    partition = requested_partition(dataframe_entity, partition)
+    key = (dataframe_entity.id, dataframe_entity.source_version)
+    if partition is not None:
+        key = key + ('partition', partition)
+    key = key + ('date_index', column)
+
+    index = dataframe_cache.get(key)
+    if index is None:
+        index = False
+        if column in available_columns(dataframe_entity):
+            dates = read_registered_dataframe(dataframe_entity, columns=[column], partition=partition)[column]
+            present = numpy.flatnonzero(dates.notna().to_numpy())
+            dates = dates.iloc[present]
+            if is_date_column(pandas.Series(dates.unique())):
+                days = quantize_dates(dates, 'day')
+                order = numpy.argsort(days, kind='stable')
+                index = pandas.DataFrame({"day": days[order], "row": present[order]})
+        # the columns which do not hold dates are remembered as well
+        dataframe_cache.put(key, index)
+
+    return None if index is False else index
+
+
+def date_window_rows(
+        dataframe_entity,
+        window: Dict[str, str],
+        column: str,
+        partition: Optional[Any] = None
+) -> Optional[numpy.ndarray]:
+    """
+    The :func:`date_window_rows` finds the rows of a registered dataframe which fall in a date window by
+    binary search in the sorted index of the date column (please refer to :func:`date_index`). The search itself
+    is `O(log n)`, and sorting the `k` rows in the window back to their order in the file is `O(k log k)`. The
+    index is built on the first call for each version of the dataframe (and after it is evicted from the
+    `dataframe_cache`), which reads and sorts the whole column in `O(n log n)`.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    window: `Dict[str, str]`, required
+        The date window of the visualization, please refer to :func:`zone_map_row_groups`.
+    column: `str`, required
+        The name of the date column in the registered dataframe (i.e. before the guide's `column_mapping`)
+    partition: `Any`, optional (default=None)
+        The subject, the rows of which are to be read, please refer to :func:`read_registered_dataframe`.
+
+    Returns
+    ----------
+    The positions of the rows in the window in ascending order as a `numpy.ndarray`, or `None` if the column
+    is not indexed.
+    """
+    index = date_index(dataframe_entity, column, partition=partition)
+    if index is None:
+        return None
+    start, end = quantize_dates(pandas.Series([window["start"], window["end"]]), 'day')
+    days = index["day"].to_numpy()
+    return numpy.sort(index["row"].to_numpy()[
+        numpy.searchsorted(days, start, side='left'):numpy.searchsorted(days, end, side='right')])
+
+
+def iterate_registered_dataframe(
+        dataframe_entity,
+        columns: Optional[List[str]] = None,
+        batch_size: int = ROW_GROUP_SIZE,
+        row_groups: Optional[List[int]] = None,
+        partition: Optional[Any] = None
+) -> Iterator[pandas.DataFrame]:
+    """
+    The :func:`iterate_registered_dataframe` reads a registered dataframe in chunks, without keeping it in memory
+    or in the cache. The index of each chunk holds the positions of its rows in the whole dataframe, the same
+    as the index of :func:`read_registered_dataframe`.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    columns: `List[str]`, optional (default=None)
+        The columns that are needed, please refer to :func:`read_registered_dataframe`.
+    batch_size: `int`, optional (default=ROW_GROUP_SIZE)
+        The number of rows in each chunk
+    row_groups: `List[int]`, optional (default=None)
+        The row groups of the columnar copy that are to be read (the rest are skipped), if `None`, all of them
+        are read. This is ignored if the dataframe has no columnar copy, or if a partition is read.
+    partition: `Any`, optional (default=None)
+        The subject, the rows of which are to be read, please refer to :func:`read_registered_dataframe`.
+
+    Returns
+    ----------
+    This generator yields the chunks as instances of `pandas.DataFrame`, at least one (maybe empty) chunk is yielded.
+    """
+    dataframe_entity = readable_dataframe(dataframe_entity)
+    all_columns = available_columns(dataframe_entity)
+    if columns is not None:
+        requested_columns = set(columns)
+        columns = [e for e in all_columns if e in requested_columns]
+
+    partition = requested_partition(dataframe_entity, partition)
+    columnar_relative_path = dataframe_entity.columnar_relative_path
+    if partition is not None:
+        row_groups = None
+        columnar_relative_path = dataframe_entity.partitions["index"].get(partition)
+        if columnar_relative_path is None:
+            yield read_partition(dataframe_entity, partition, columns if columns is not None else all_columns)
+            return
+
+    def columnar_chunks():
+        parquet_file = pyarrow.parquet.ParquetFile(os.path.join(application_directory, columnar_relative_path))
+        selected_row_groups = set(range(parquet_file.num_row_groups) if row_groups is None else row_groups)
+        offset = 0
+        for row_group in range(parquet_file.num_row_groups):
+            if row_group in selected_row_groups:
+                for batch in parquet_file.iter_batches(batch_size=batch_size, row_groups=[row_group], columns=columns):
+                    yield offset, batch.to_pandas()
+                    offset += batch.num_rows
+            else:
+                offset += parquet_file.metadata.row_group(row_group).num_rows
+        if len(selected_row_groups) == 0:
+            # all of the row groups are skipped, so an empty chunk is yielded
+            yield 0, parquet_file.schema_arrow.empty_table().select(
+                columns if columns is not None else parquet_file.schema_arrow.names).to_pandas()
+
+    def csv_chunks():
+        offset = 0
+        csv_path = os.path.join(application_directory, dataframe_entity.relative_path)
+        for chunk in pandas.read_csv(csv_path, usecols=columns, chunksize=batch_size):
+            yield offset, chunk
+            offset += chunk.shape[0]
+
+    yielded = False
+    for offset, chunk in (columnar_chunks() if columnar_relative_path is not None else csv_chunks()):
+        chunk = compact_dataframe(chunk, dataframe_entity.column_dtypes)
+        chunk.index = pandas.RangeIndex(offset, offset + chunk.shape[0])
+        yielded = True
+        yield chunk
+
+    if not yielded:
+        yield read_registered_dataframe(dataframe_entity, columns=columns, partition=partition)
+
+
+def read_step_rollup(
+        dataframe_entity,
+        guide: Dict[Any, Any],
+        partition: Optional[Any] = None
+) -> Optional[pandas.DataFrame]:
+    """
+    The :func:`read_step_rollup` reads the rollup of a registered step dataframe (please refer to
+    :func:`refresh_rollup`), which is kept in the `dataframe_cache`. The rollup only describes the raw
+    rows, so it is not returned if the guide transforms them or maps the step columns.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    guide: `Dict[str, Any]`, required
+        The guide, please refer to :func:`transform_dataframe` for its format.
+    partition: `Any`, optional (default=None)
+        The subject whose buckets are kept (please refer to :func:`subject_buckets`), or `None` for all of them
+
+    Returns
+    ----------
+    The rollup as a `pandas.DataFrame` (please refer to :func:`rollup_resolutions`), or `None`.
+    """
+    dataframe_entity = readable_dataframe(dataframe_entity)
+    step_columns = set(STEP_COLUMNS + [SUBJECT_COLUMN])
+    if dataframe_entity.rollup is None or len(guide.get("transformations", [])) > 0 or any(
+            key in step_columns or value in step_columns for key, value in guide.get("column_mapping", dict()).items()):
+        return None
+
+    key = (dataframe_entity.id, dataframe_entity.source_version, 'rollup')
+    rollup = dataframe_cache.get(key)
+    if rollup is None:
+        rollup = pandas.read_parquet(os.path.join(application_directory, dataframe_entity.rollup["relative_path"]))
+        dataframe_cache.put(key, rollup)
+    if partition is not None:
+        rollup = subject_buckets(
+            rollup, partition, has_subject_column=SUBJECT_COLUMN in available_columns(dataframe_entity))
+    return rollup
+
+
+def read_token_frequencies(
+        dataframe_entity,
+        guide: Dict[Any, Any],
+        rows: Optional[numpy.ndarray] = None,
+        collocations: bool = True
+) -> Optional[Dict[str, int]]:
+    """
+    The :func:`read_token_frequencies` sums up the token counts of a set of comments from the token index of a
+    registered dataframe (please refer to :func:`refresh_token_index`), which is kept in the `dataframe_cache` under
+    (`id`, `source_version`, `'token_index'`), apart from the columns (please refer to
+    :func:`read_registered_dataframe`).
+    The index only describes the raw comments, so nothing is returned if the guide maps the comment columns.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    guide: `Dict[str, Any]`, required
+        The guide, please refer to :func:`transform_dataframe` for its format.
+    rows: `numpy.ndarray`, optional (default=None)
+        The positions of the comments in the dataframe (e.g. the index of the output of
+        :func:`read_transformed_dataframe`), if `None`, all of the comments are counted.
+    collocations: `bool`, optional (default=True)
+        Whether or not to count the collocations, please refer to :func:`token_frequencies`.
+
+    Returns
+    ----------
+    The frequency of each token as a `Dict[str, int]` (please refer to :func:`token_frequencies`), or `None`.
+    """
+    dataframe_entity = readable_dataframe(dataframe_entity)
+    if dataframe_entity.token_index is None or any(
+            key in COMMENT_COLUMNS or value in COMMENT_COLUMNS
+            for key, value in guide.get("column_mapping", dict()).items()):
+        return None
+
+    key = (dataframe_entity.id, dataframe_entity.source_version, 'token_index')
+    index = dataframe_cache.get(key)
+    if index is None:
+        index = load_token_index(
+            os.path.join(application_directory, dataframe_entity.token_index["relative_path"]))
+        matrix = index["matrix"]
+        dataframe_cache.put(key, index, size=int(
+            matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes + index["vocabulary"].nbytes))
+
+    matrix = index["matrix"] if rows is None else index["matrix"][rows]
+    return token_frequencies(
+        numpy.asarray(matrix.sum(axis=0)).ravel(), index["vocabulary"], collocations=collocations)
+
+
+def registered_column_statistics(dataframe_entity, column: str) -> Dict[str, Any]:
+    """
+    The :func:`registered_column_statistics` returns the statistics of a column of a registered dataframe (please
+    refer to :func:`column_statistics`), which are computed once per version of the csv file and kept in the
+    `dataframe_cache`.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    column: `str`, required
+        The column name
+
+    Returns
+    ----------
+    The statistics as a `Dict[str, Any]`.
+    """
+    dataframe_entity = readable_dataframe(dataframe_entity)
+    key = (dataframe_entity.id, dataframe_entity.source_version, 'statistics', column)
+    statistics = dataframe_cache.get(key)
+    if statistics is None:
+        statistics = column_statistics(read_registered_dataframe(dataframe_entity, columns=[column])[column])
+        dataframe_cache.put(key, statistics)
+    return statistics
+
+
+def guide_statistics(dataframe_entity, guide: Dict[Any, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    The :func:`guide_statistics` gathers the statistics of the columns that the filters of a guide use, for
+    :func:`plan_transformations`. The mapped column names are resolved to their original columns.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    guide: `Dict[str, Any]`, required
+        The guide, please refer to :func:`transform_dataframe` for its format.
+
+    Returns
+    ----------
+    The `Dict[str, Dict[str, Any]]` from the column names (as the guide uses them) to their statistics.
+    """
+    column_mapping = guide.get("column_mapping", dict())
+    source_of = {column_mapping[column]: column for column in column_mapping.keys()}
+    columns = available_columns(dataframe_entity)
+
+    statistics = dict()
+    for single_transformation in guide.get("transformations", []):
+        if single_transformation["name"] in FILTER_TRANSFORMATIONS:
+            column = single_transformation["column"]
+            if source_of.get(column, column) in columns:
+                statistics[column] = registered_column_statistics(dataframe_entity, source_of.get(column, column))
+    return statistics
+
+
+def explain_transformations(dataframe_entity, guide: Dict[Any, Any]) -> List[Dict[str, Any]]:
+    """
+    The :func:`explain_transformations` returns the plan that :func:`read_transformed_dataframe` uses for the
+    transformations of a guide, please refer to :func:`plan_transformations`.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    guide: `Dict[str, Any]`, required
+        The guide, please refer to :func:`transform_dataframe` for its format.
+
+    Returns
+    ----------
+    The plan as a `List[Dict[str, Any]]`.
+    """
+    return plan_transformations(guide.get("transformations", []), guide_statistics(dataframe_entity, guide))
+
+
+def deterministic_prefix_length(transformations: List[Dict[str, Any]]) -> int:
+    """
+    The :func:`deterministic_prefix_length` returns the number of leading transformations the output of which can
+    be reused, namely the ones before the first `random_selection` that has no `seed`.
+    """
+    for index, single_transformation in enumerate(transformations):
+        if single_transformation["name"] == "random_selection" and single_transformation.get("seed") is None:
+            return index
+    return len(transformations)
+
+
+def read_transformed_dataframe(
+        dataframe_entity,
+        guide: Dict[Any, Any],
+        columns: Optional[List[str]] = None,
+        partition: Optional[Any] = None,
+        window: Optional[Dict[str, str]] = None
+) -> pandas.DataFrame:
+    """
+    The :func:`read_transformed_dataframe` reads a registered dataframe (please refer to
+    :func:`read_registered_dataframe`) and applies the guide to it, similar to :func:`transform_dataframe`.
+
+    The process-wide `transformation_cache` keeps, under (`id`, `source_version`, columns, partition, fingerprint
+    of the guide), the output of each guide, and the state of the transformation engine after each prefix of its
+    transformations. Resubmitting the same guide reuses its output, and a guide which only adds transformations
+    to a previous one is evaluated starting from the longest cached prefix (the filters that remain are reordered
+    by :func:`plan_transformations`, please refer to :func:`explain_transformations`). Nothing after a
+    `random_selection` that has no `seed` is cached. The returned dataframe is shared, so it must not be modified in
+    place.
+
+    If the guide has no `random_selection`, only the rows in the date `window` are read, which are found by binary
+    search in the sorted index of the date column (please refer to :func:`date_window_rows`).
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    guide: `Dict[str, Any]`, required
+        The guide, please refer to :func:`transform_dataframe` for its format.
+    columns: `List[str]`, optional (default=None)
+        The columns that are needed, if `None`, all of the columns will be read.
+    partition: `Any`, optional (default=None)
+        The subject, the rows of which are to be read, please refer to :func:`read_registered_dataframe`.
+    window: `Dict[str, str]`, optional (default=None)
+        The date window of the visualization, please refer to :func:`zone_map_row_groups`.
+
+    Returns
+    ----------
+    The transformed `pandas.DataFrame`.
+    """
+    dataframe_entity = readable_dataframe(dataframe_entity)
+    partition = requested_partition(dataframe_entity, partition)
+    column_mapping = guide.get("column_mapping", dict())
+    transformations = guide.get("transformations", [])
+
+    rows = None
+    if window is not None and all(e["name"] != "random_selection" for e in transformations):
+        # the window refers to the column names after the mapping (the last mapping to a name is the one kept)
+        sources = [e for e in column_mapping.keys() if column_mapping[e] == window["column"]]
+        rows = date_window_rows(
+            dataframe_entity, window, sources[-1] if len(sources) > 0 else window["column"], partition=partition)
+
+    key = (
+        dataframe_entity.id,
+        dataframe_entity.source_version,
+        None if columns is None else tuple(sorted(set(columns))),
+        partition,
+        None if rows is None else (window["column"], window["start"], window["end"])
+    )
+    cached_length = deterministic_prefix_length(transformations)
+
+    def prefix_key(length: int) -> tuple:
+        return key + ('state', guide_fingerprint({
+            "column_mapping": column_mapping, "transformations": transformations[:length]}))
+
+    if is_deterministic(guide):
+        output = transformation_cache.get(key + ('output', guide_fingerprint(guide)))
+        if output is not None:
+            return output
+
+    # the entries of the previous versions of this dataframe will not be used anymore
+    transformation_cache.invalidate(lambda e: e[0] == key[0] and e[1] != key[1])
+
+    # finding the longest prefix of the transformations which has been evaluated before
+    state = None
+    for length in range(cached_length, 0, -1):
+        state = transformation_cache.get(prefix_key(length))
+        if state is not None:
+            break
+    if state is None:
+        length = 0
+        # the zone maps describe the row groups of the whole dataframe, not the ones of a partition or a window
+        state = initial_transformation_state(
+            map_columns(read_registered_dataframe(
+                dataframe_entity, columns=columns, partition=partition, rows=rows), column_mapping),
+            zone_maps=mapped_zone_maps(dataframe_entity.zone_maps, column_mapping)
+            if partition is None and rows is None else None
+        )
+
+    # the filters are reordered by the planner according to the statistics of their columns
+    remaining_transformations = transformations[length:]
+    statistics = guide_statistics(dataframe_entity, {
+        "column_mapping": column_mapping, "transformations": remaining_transformations})
+    dataframe_sizes = dict()
+    for count, state in transformation_states(state, remaining_transformations, statistics=statistics):
+        if length + count <= cached_length:
+            # each state keeps its dataframe alive (even after its columns are evicted from the `dataframe_cache`),
+            # so the dataframe is counted in the size of every state along with its mask, and only measured once
+            dataframe = state["dataframe"]
+            if id(dataframe) not in dataframe_sizes:
+                dataframe_sizes[id(dataframe)] = size_in_bytes(dataframe)
+            size = dataframe_sizes[id(dataframe)] + (0 if state["mask"] is None else state["mask"].nbytes)
+            transformation_cache.put(prefix_key(length + count), state, size=size)
+
+    output = transformation_state_output(state)
+    if is_deterministic(guide):
+        transformation_cache.put(key + ('output', guide_fingerprint(guide)), output)
+
+    return output
+
+
+def read_transformed_chunks(
+        dataframe_entity,
+        guide: Dict[Any, Any],
+        columns: Optional[List[str]] = None,
+        window: Optional[Dict[str, str]] = None,
+        partition: Optional[Any] = None
+) -> Iterator[pandas.DataFrame]:
+    """
+    The :func:`read_transformed_chunks` is the streaming counterpart of :func:`read_transformed_dataframe` for the
+    dataframes that do not fit in memory. The registered dataframe is read in chunks and the guide is applied
+    to them using :func:`transform_dataframe_chunks`, so only the remaining rows are kept. Nothing is cached.
+
+    The row groups that the zone maps rule out for the filters before the first `random_selection` are not
+    read at all. If the guide has no `random_selection`, the row groups outside of the date `window` of the
+    visualization are skipped as well, in which case the visualization must still filter the rows by the window.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    guide: `Dict[str, Any]`, required
+        The guide, please refer to :func:`transform_dataframe` for its format.
+    columns: `List[str]`, optional (default=None)
+        The columns that are needed, if `None`, all of the columns will be read.
+    window: `Dict[str, str]`, optional (default=None)
+        The date window of the visualization, please refer to :func:`zone_map_row_groups`.
+    partition: `Any`, optional (default=None)
+        The subject, the rows of which are to be read, please refer to :func:`read_registered_dataframe`.
+
+    Returns
+    ----------
+    This generator yields the transformed chunks as instances of `pandas.DataFrame`.
+    """
+    dataframe_entity = readable_dataframe(dataframe_entity)
+    partition = requested_partition(dataframe_entity, partition)
+    row_groups = None
+    zone_maps = mapped_zone_maps(dataframe_entity.zone_maps, guide.get("column_mapping", dict()))
+    if zone_maps is not None and partition is None:
+        transformations = guide.get("transformations", [])
+        if not all(e["name"] != "random_selection" for e in transformations):
+            window = None
+        row_groups = numpy.flatnonzero(zone_map_row_groups(zone_maps, transformations, window=window)).tolist()
+
+    return transform_dataframe_chunks(iterate_registered_dataframe(
+        dataframe_entity, columns=columns, row_groups=row_groups, partition=partition), guide=guide)
+
+
+def is_streamed(dataframe_entity, threshold: int, partition: Optional[Any] = None) -> bool:
+    """
+    The :func:`is_streamed` decides whether or not a registered dataframe is too large to be loaded in memory,
+    in which case :func:`read_transformed_chunks` has to be used.
+
+    Parameters
+    ----------
+    dataframe_entity: `Dataframe`, required
+        The registered dataframe entity
+    threshold: `int`, required
+        The size of the csv file (in bytes) above which the dataframe is streamed
+    partition: `Any`, optional (default=None)
+        The subject, the rows of which are to be read, in which case the size of its file is compared instead.
+
+    Returns
+    ----------
+    `True` if the dataframe has to be streamed.
+    """
+    dataframe_entity = readable_dataframe(dataframe_entity)
+    partition = requested_partition(dataframe_entity, partition)
+    if partition is not None:
+        relative_path = dataframe_entity.partitions["index"].get(partition)
+        return relative_path is not None and \
+            os.path.getsize(os.path.join(application_directory, relative_path)) > threshold
+    return os.path.getsize(os.path.join(application_directory, dataframe_entity.relative_path)) > threshold
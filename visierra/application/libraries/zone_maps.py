@@ -0,0 +1,159 @@
+import pandas
+import pyarrow
+import pyarrow.parquet
+from typing import Optional, Dict, Any
+
+
+def is_date_column(values: pandas.Series) -> bool:
+    """
+    The :func:`is_date_column` checks whether all of the values of a column start with a date in `yyyy-mm-dd`
+    (or `yyyy_mm_dd`) format. Similar to the visualizations, the dates are compared by their parts
+    rather than parsed, so these strings are in the same order as the dates.
+
+    Parameters
+    ----------
+    values: `pandas.Series`, required
+        The (non-missing) values of the column
+
+    Returns
+    ----------
+    `True` if all of the values start with a date.
+    """
+    return bool(values.astype(str).str.match(r'^\d{4}[-_]\d{2}[-_]\d{2}').all())
+
+
+def chunk_zone_map(column: pandas.Series, is_date: bool) -> Dict[str, Any]:
+    """
+    The :func:`chunk_zone_map` computes the zone map entries of a column in one chunk (row group).
+
+    Parameters
+    ----------
+    column: `pandas.Series`, required
+        The values of the column in the chunk
+    is_date: `bool`, required
+        Whether or not the column holds dates as `str` values, the range of which has to be computed as well.
+        The range of the parsed (`datetime64`) dates is always computed.
+
+    Returns
+    ----------
+    A `Dict[str, Any]` with the `min`, `max` and `null_count` of the chunk, and its `date_min` and `date_max`
+    (in `yyyy-mm-dd` format) for date columns.
+    """
+    values = column.dropna()
+    entry = {"min": None, "max": None, "null_count": int(column.shape[0] - values.shape[0])}
+    if pandas.api.types.is_datetime64_any_dtype(column.dtype):
+        # the filters compare the dates with `str` values, so only the date range is kept
+        entry = {"min": None, "max": None, "null_count": None, "date_min": None, "date_max": None}
+        if values.shape[0] > 0:
+            entry["date_min"], entry["date_max"] = values.min().strftime('%Y-%m-%d'), values.max().strftime('%Y-%m-%d')
+        return entry
+    elif values.shape[0] > 0:
+        try:
+            entry["min"], entry["max"] = values.min(), values.max()
+            entry["min"] = entry["min"].item() if hasattr(entry["min"], 'item') else entry["min"]
+            entry["max"] = entry["max"].item() if hasattr(entry["max"], 'item') else entry["max"]
+        except TypeError:
+            # e.g. a mix of types, the range is unknown
+            entry = {"min": None, "max": None, "null_count": None}
+
+    if is_date:
+        entry["date_min"], entry["date_max"] = None, None
+        if values.shape[0] > 0 and is_date_column(values):
+            dates = values.astype(str).str.slice(0, 10).str.replace('_', '-')
+            entry["date_min"], entry["date_max"] = dates.min(), dates.max()
+    return entry
+
+
+def compute_zone_maps(
+        columnar_path: str,
+        zone_maps: Optional[Dict[str, Any]] = None,
+        first_row_group: int = 0
+) -> Dict[str, Any]:
+    """
+    The :func:`compute_zone_maps` computes the zone maps of a parquet file, namely the `min`, `max` and
+    `null_count` of each of its numeric, `str` and categorical columns in each of its row groups, and the date
+    range (`date_min` and `date_max`) of each row group for the date columns (please refer to
+    :func:`is_date_column`). These help with skipping the row groups that cannot match a filter (please refer
+    to :func:`application.libraries.transformation.zone_map_row_groups`).
+
+    Parameters
+    ----------
+    columnar_path: `str`, required
+        The path to the parquet file
+    zone_maps: `Dict[str, Any]`, optional (default=None)
+        The zone maps of an earlier version of the file (e.g. before rows were appended to it), the entries of
+        the row groups before `first_row_group` of which are kept as they are
+    first_row_group: `int`, optional (default=0)
+        The first row group that is computed, the ones before it are taken from the `zone_maps`
+
+    Returns
+    ----------
+    The zone maps as a `Dict[str, Any]` including the `row_counts` of the row groups and the zone map of each of
+    the `columns`, in which each entry is a list with one item per row group.
+    """
+    parquet_file = pyarrow.parquet.ParquetFile(columnar_path)
+    if zone_maps is None or first_row_group == 0:
+        zone_maps, first_row_group = {"row_counts": [], "columns": dict()}, 0
+    else:
+        zone_maps = {
+            "row_counts": zone_maps["row_counts"][:first_row_group],
+            "columns": {
+                column: {key: entries[:first_row_group] for key, entries in zone_map.items()}
+                for column, zone_map in zone_maps["columns"].items()
+            }
+        }
+    date_columns = set(e for e, zone_map in zone_maps["columns"].items() if "date_min" in zone_map)
+    for row_group in range(first_row_group, parquet_file.num_row_groups):
+        chunk = parquet_file.read_row_group(row_group).to_pandas()
+        zone_maps["row_counts"].append(int(chunk.shape[0]))
+        for column in chunk.columns:
+            values = chunk[column]
+            if isinstance(values.dtype, pandas.CategoricalDtype):
+                values = values.astype(values.cat.categories.dtype)
+            is_numeric = pandas.api.types.is_numeric_dtype(values.dtype) and \
+                not pandas.api.types.is_bool_dtype(values.dtype)
+            is_string = pandas.api.types.is_string_dtype(values.dtype) or \
+                pandas.api.types.is_object_dtype(values.dtype)
+            if row_group == 0:
+                if pandas.api.types.is_datetime64_any_dtype(values.dtype):
+                    date_columns.add(column)
+                elif not (is_numeric or is_string):
+                    continue
+                # the `str` columns in which all of the values of the first row group are dates, are date columns
+                if is_string and values.dropna().shape[0] > 0 and is_date_column(values.dropna()):
+                    date_columns.add(column)
+                zone_maps["columns"][column] = {"min": [], "max": [], "null_count": []}
+                if column in date_columns:
+                    zone_maps["columns"][column].update({"date_min": [], "date_max": []})
+            if column not in zone_maps["columns"]:
+                continue
+            for key, value in chunk_zone_map(values, is_date=column in date_columns).items():
+                zone_maps["columns"][column][key].append(value)
+    return zone_maps
+
+
+def mapped_zone_maps(zone_maps: Optional[Dict[str, Any]], column_mapping: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """
+    The :func:`mapped_zone_maps` adapts the zone maps of a dataframe to the column names after a `column_mapping`
+    (please refer to :func:`application.libraries.transformation.map_columns`).
+
+    Parameters
+    ----------
+    zone_maps: `Dict[str, Any]`, optional
+        The zone maps, please refer to :func:`compute_zone_maps`.
+    column_mapping: `Dict[str, str]`, required
+        The mapping from the original column names to the new ones
+
+    Returns
+    ----------
+    The zone maps with the new column names, or `None` if there is none.
+    """
+    if zone_maps is None:
+        return None
+    columns = dict(zone_maps["columns"])
+    for column in column_mapping.keys():
+        columns.pop(column_mapping[column], None)
+    for column in column_mapping.keys():
+        if column in zone_maps["columns"]:
+            columns[column_mapping[column]] = zone_maps["columns"][column]
+    return {"row_counts": zone_maps["row_counts"], "columns": columns}
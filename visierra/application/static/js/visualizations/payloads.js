@@ -0,0 +1,35 @@
+// Reading the chart data of the palette in the columnar json format (please refer to
+// `application/libraries/payloads.py`), with the same arguments as `d3.csv`: the `row`
+// function (optional) is applied to each row, and `callback` receives the error and the rows.
+// The `source` is either the payload itself (if it was put in the page) or its url.
+function read_payload(source, row, callback) {
+    if (typeof source !== "string") return callback(null, columnar_rows(source, row));
+    d3.json(source, function(error, payload) {
+        if (error) return callback(error);
+        callback(null, columnar_rows(payload, row));
+    });
+}
+
+// The numeric columns are turned into typed arrays first, and the rows are put together
+// from the columns, keeping the `columns` attribute the same as `d3.csv` does.
+function columnar_rows(payload, row) {
+    var columns = payload.columns;
+    var arrays = columns.map(function(column) {
+        var values = payload.data[column];
+        var dtype = payload.dtypes[column].toLowerCase();
+        if (dtype.startsWith("int") || dtype.startsWith("uint") || dtype.startsWith("float")) {
+            return Float64Array.from(values, function(value) { return value === null ? NaN : value; });
+        }
+        return values;
+    });
+
+    var data = [];
+    for (var i = 0; i < payload.length; ++i) {
+        var d = {};
+        for (var j = 0; j < columns.length; ++j) d[columns[j]] = arrays[j][i];
+        d = row ? row(d, i, columns) : d;
+        if (d != null) data.push(d);
+    }
+    data.columns = columns;
+    return data;
+}
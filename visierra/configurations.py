@@ -18,11 +18,28 @@ class Configurations(object):
     the database parameters especially where the SQLite database is to be saved.
     """
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'visierra_is_secret_Key23'
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(base_directory, 'visierra_database.db')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
+        'sqlite:///' + os.path.join(base_directory, 'visierra_database.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     ADMINS = ['shayan@cs.ucla.edu']
     LANGUAGES = ['en']
     VISUALIZATIONS_PER_PAGE=10
+    # budget (in bytes) of the in-memory cache of the registered dataframes' columns
+    DATAFRAME_CACHE_MAX_BYTES = int(os.environ.get('DATAFRAME_CACHE_MAX_BYTES') or 1024 * 1024 * 1024)
+    # budget (in bytes) of the in-memory cache of the transformed dataframes (outputs of the guides)
+    TRANSFORMATION_CACHE_MAX_BYTES = int(os.environ.get('TRANSFORMATION_CACHE_MAX_BYTES') or 512 * 1024 * 1024)
+    # budget (in bytes) of the in-memory store of the morphed chart data, which the rendered pages fetch by token
+    CHART_PAYLOAD_CACHE_MAX_BYTES = int(os.environ.get('CHART_PAYLOAD_CACHE_MAX_BYTES') or 64 * 1024 * 1024)
+    # the chart data and pictures up to this size (in bytes) are put in the rendered page rather than stored and fetched
+    CHART_PAYLOAD_INLINE_MAX_BYTES = int(os.environ.get('CHART_PAYLOAD_INLINE_MAX_BYTES') or 512 * 1024)
+    # the number of processes that the comments are tokenized in (e.g. for the word clouds)
+    TEXT_AGGREGATION_PROCESSES = int(os.environ.get('TEXT_AGGREGATION_PROCESSES') or os.cpu_count() or 1)
+    # the number of processes that the experiments of the ML toolkit run in (i.e. the experiments that run at once)
+    ML_JOB_PROCESSES = int(os.environ.get('ML_JOB_PROCESSES') or 1)
+    # the number of experiments of the ML toolkit that can wait for a process, the ones submitted after are refused
+    ML_JOB_MAX_QUEUED = int(os.environ.get('ML_JOB_MAX_QUEUED') or 8)
+    # the registered csv files larger than this (in bytes) are streamed in chunks instead of being loaded in memory
+    STREAMING_THRESHOLD_BYTES = int(os.environ.get('STREAMING_THRESHOLD_BYTES') or 2 * 1024 * 1024 * 1024)
     # Flask-Security config
     SECURITY_URL_PREFIX = "/admin"
     SECURITY_PASSWORD_HASH = "pbkdf2_sha512"
@@ -0,0 +1,67 @@
+"""the tables of the platform
+
+Revision ID: 3f2a9c1d7b04
+Revises:
+Create Date: 2026-10-18 11:02:14.381027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b04'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the databases which were created before the migrations were shipped have these tables already
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'role' not in existing_tables:
+        op.create_table(
+            'role',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=80), nullable=True),
+            sa.Column('description', sa.String(length=255), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name')
+        )
+    if 'user' not in existing_tables:
+        op.create_table(
+            'user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('first_name', sa.String(length=255), nullable=True),
+            sa.Column('last_name', sa.String(length=255), nullable=True),
+            sa.Column('email', sa.String(length=255), nullable=True),
+            sa.Column('password', sa.String(length=255), nullable=True),
+            sa.Column('active', sa.Boolean(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email')
+        )
+    if 'roles_users' not in existing_tables:
+        op.create_table(
+            'roles_users',
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('role_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['role_id'], ['role.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'])
+        )
+    if 'dataframe' not in existing_tables:
+        op.create_table(
+            'dataframe',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=255), nullable=True),
+            sa.Column('description', sa.String(length=1000), nullable=True),
+            sa.Column('relative_path', sa.String(length=1000), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name')
+        )
+
+
+def downgrade():
+    op.drop_table('dataframe')
+    op.drop_table('roles_users')
+    op.drop_table('user')
+    op.drop_table('role')
@@ -0,0 +1,43 @@
+"""the columnar copies of the dataframes
+
+Revision ID: 8c51e0a6d2f3
+Revises: 3f2a9c1d7b04
+Create Date: 2026-10-18 11:04:52.914663
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c51e0a6d2f3'
+down_revision = '3f2a9c1d7b04'
+branch_labels = None
+depends_on = None
+
+# the bookkeeping of the columnar copies, please refer to `application.entities.Dataframe`
+COLUMNS = [
+    ('columnar_relative_path', sa.String(length=1000)),
+    ('source_version', sa.String(length=255)),
+    ('source_state', sa.JSON()),
+    ('zone_maps', sa.JSON()),
+    ('column_dtypes', sa.JSON()),
+    ('rollup', sa.JSON()),
+    ('partitions', sa.JSON()),
+    ('token_index', sa.JSON())
+]
+
+
+def upgrade():
+    # the databases which were created by `db.create_all` with the new entities have these columns already
+    existing_columns = [e['name'] for e in sa.inspect(op.get_bind()).get_columns('dataframe')]
+    with op.batch_alter_table('dataframe', schema=None) as batch_op:
+        for name, column_type in COLUMNS:
+            if name not in existing_columns:
+                batch_op.add_column(sa.Column(name, column_type, nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('dataframe', schema=None) as batch_op:
+        for name, _ in reversed(COLUMNS):
+            batch_op.drop_column(name)